@@ -32,6 +32,20 @@ Swagger(app)
 # Register blueprints
 from routes.main import test_bp 
 app.register_blueprint(test_bp, url_prefix='')
+from routes.batch import batch_bp
+app.register_blueprint(batch_bp, url_prefix='')
+
+from shared.redis_client import close_redis
+from shared.job_events import job_event_hub
+
+@app.before_serving
+async def start_job_events():
+    job_event_hub.start()
+
+@app.after_serving
+async def shutdown_redis():
+    await job_event_hub.stop()
+    await close_redis()
 
 
 if __name__ == '__main__':
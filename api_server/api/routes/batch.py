@@ -0,0 +1,182 @@
+from quart import Blueprint, request, jsonify, make_response
+import json
+import logging
+import os
+import time
+import uuid
+import zipfile
+
+from shared.redis_client import redis_client
+from shared import result_store
+from shared.jobs import enqueue_uploads, client_id_of, lane_of
+from shared.uploads import read_multipart
+from shared.admission import require_admission, record_admitted, rejection_response, AdmissionRejected
+
+logger = logging.getLogger(__name__)
+batch_bp = Blueprint('batch', __name__)
+
+# batch:<batch_id>       -> hash with the chapter's options and page count
+# batch:<batch_id>:jobs  -> list of job ids in page order
+BATCH_TTL = int(os.getenv("BATCH_TTL", 24 * 60 * 60))
+
+
+class _ChunkWriter:
+    """Write-only file object for zipfile, hands out what was written since the last drain"""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def _page_states(job_ids: list) -> list:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for job_id in job_ids:
+            pipe.exists(f"job_result:{job_id}")
+            pipe.exists(f"job_failed:{job_id}")
+        flags = await pipe.execute()
+    states = []
+    for done, failed in zip(flags[::2], flags[1::2]):
+        states.append("done" if done else "failed" if failed else "pending")
+    return states
+
+
+@batch_bp.route('/batch', methods=['POST'])
+async def create_batch():
+    """
+    Queue the pages of a chapter as one batch.
+    The order of the 'image' files is the page order. Optional form fields:
+    source_lang, target_lang, manga_title (used as translation context for every page),
+    priority ('bulk' by default, or 'interactive').
+    """
+    async def admit(form):
+        # fields sent before the files decide the lane and client, nothing is stored yet if this rejects
+        await require_admission(lane_of(form, "bulk"), client_id_of(request, form))
+
+    try:
+        form, uploads = await read_multipart(request, before_files=admit)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected batch: {e}")
+        return rejection_response(e.decision)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not uploads:
+        return jsonify({"error": "No image file provided"}), 400
+
+    lane = lane_of(form, "bulk")
+    client_id = client_id_of(request, form)
+    batch_id = str(uuid.uuid4())
+    jobs, cached, queued = await enqueue_uploads(
+        uploads,
+        form,
+        lane=lane,
+        client_id=client_id,
+        extra=lambda index: {"batch_id": batch_id, "page_index": index},
+    )
+    # only cache misses add to the queue
+    eta = await record_admitted(lane, queued)
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(f"batch:{batch_id}", mapping={
+            "total": len(jobs),
+            "source_lang": form.get("source_lang", "ja"),
+            "target_lang": form.get("target_lang", "en"),
+            "manga_title": form.get("manga_title", ""),
+            "created_at": time.time(),
+        })
+        pipe.rpush(f"batch:{batch_id}:jobs", *jobs)
+        pipe.expire(f"batch:{batch_id}", BATCH_TTL)
+        pipe.expire(f"batch:{batch_id}:jobs", BATCH_TTL)
+        await pipe.execute()
+
+    logger.info(f"Batch {batch_id}: queued {queued} of {len(jobs)} page(s).")
+    return jsonify({
+        "status": "accepted",
+        "batch_id": batch_id,
+        "job_ids": jobs,
+        "cached_job_ids": cached,
+        "eta_seconds": eta,
+        "message": f"Translation batch has been queued for {len(jobs)} page(s)."
+    }), 202
+
+
+@batch_bp.route('/batch/<batch_id>', methods=['GET'])
+async def get_batch(batch_id):
+    """Aggregate progress of a batch, with the state of every page in page order"""
+    batch = await redis_client.hgetall(f"batch:{batch_id}")
+    if not batch:
+        return jsonify({"error": "Unknown batch"}), 404
+    job_ids = await redis_client.lrange(f"batch:{batch_id}:jobs", 0, -1)
+    states = await _page_states(job_ids)
+
+    done = states.count("done")
+    failed = states.count("failed")
+    if done == len(states):
+        status = "done"
+    elif done + failed == len(states):
+        status = "failed"
+    else:
+        status = "processing"
+
+    return jsonify({
+        "batch_id": batch_id,
+        "status": status,
+        "total": len(job_ids),
+        "done": done,
+        "failed": failed,
+        "pending": len(job_ids) - done - failed,
+        "manga_title": batch.get("manga_title") or None,
+        "pages": [
+            {"page_index": index, "job_id": job_id, "status": state}
+            for index, (job_id, state) in enumerate(zip(job_ids, states))
+        ],
+    }), 200
+
+
+@batch_bp.route('/batch/<batch_id>/archive', methods=['GET'])
+async def get_batch_archive(batch_id):
+    """
+    Download the translated chapter as a zip of PNGs in page order (page_000.png, ...).
+    Only available once every page is done, 202 while some are still processing.
+    """
+    job_ids = await redis_client.lrange(f"batch:{batch_id}:jobs", 0, -1)
+    if not job_ids:
+        return jsonify({"error": "Unknown batch"}), 404
+    states = await _page_states(job_ids)
+    if "failed" in states:
+        failed = [job_id for job_id, state in zip(job_ids, states) if state == "failed"]
+        return jsonify({"status": "failed", "failed_job_ids": failed}), 409
+    if "pending" in states:
+        return jsonify({"status": "pending", "message": "Batch not finished"}), 202
+
+    async def stream():
+        # pages are fetched and zipped one at a time, the archive is never held in memory
+        writer = _ChunkWriter()
+        with zipfile.ZipFile(writer, "w", zipfile.ZIP_STORED) as archive:
+            for index, job_id in enumerate(job_ids):
+                result_json = await redis_client.get(f"job_result:{job_id}")
+                image_bytes = await result_store.load_image(job_id, json.loads(result_json)) if result_json else None
+                if image_bytes is None:
+                    # expired in the meantime, leave the page out rather than break the archive
+                    logger.warning(f"Batch {batch_id}: result of page {index} is gone")
+                    continue
+                # PNGs are compressed already, store them as they are
+                archive.writestr(f"page_{index:03d}.png", image_bytes)
+                yield writer.drain()
+        yield writer.drain()
+
+    response = await make_response(stream(), {
+        "Content-Type": "application/zip",
+        "Content-Disposition": f'attachment; filename="batch_{batch_id}.zip"',
+    })
+    response.timeout = None
+    return response
@@ -1,98 +1,173 @@
-from quart import Blueprint, request, jsonify
-import base64
+from quart import Blueprint, request, jsonify, Response, make_response
+import asyncio
 import json
 import logging
-import uuid
+import os
 
 from shared.redis_client import redis_client
+from shared import result_store
+from shared.uploads import read_multipart
+from shared.admission import require_admission, record_admitted, rejection_response, AdmissionRejected, drain_rate
+from shared.jobs import enqueue_uploads, client_id_of, lane_of, LANES
+from shared.job_events import job_event_hub
 
 logger = logging.getLogger(__name__)
 test_bp = Blueprint('test', __name__)
 
+# an event stream is closed after this many seconds even if some jobs are still running
+EVENTS_MAX_SECONDS = int(os.getenv("EVENTS_MAX_SECONDS", 15 * 60))
+# comment line sent when nothing happened for a while, keeps proxies from closing the stream
+EVENTS_KEEPALIVE_SECONDS = int(os.getenv("EVENTS_KEEPALIVE_SECONDS", 15))
+
 @test_bp.route('/test')
 def test():
     return jsonify(message="API Server is running!")
 
 @test_bp.route('/process', methods=['POST'])
 async def process_endpoint():
-    files = (await request.files).getlist('image')
-    if not files:
+    async def admit(form):
+        # fields sent before the files decide the lane and client, nothing is stored yet if this rejects
+        await require_admission(lane_of(form, "interactive"), client_id_of(request, form))
+
+    try:
+        form, uploads = await read_multipart(request, before_files=admit)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected upload: {e}")
+        return rejection_response(e.decision)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not uploads:
         return jsonify({"error": "No image file provided"}), 400
-        
-    form = await request.form
-    source_lang = form.get("source_lang", "ja")
-    target_lang = form.get("target_lang", "en")
-
-    jobs = []
-    for file in files:
-        image_bytes = file.read()
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-        job_id = str(uuid.uuid4())
-        job = {
-            "job_id": job_id,
-            "image_b64": image_b64,
-            "source_lang": source_lang,
-            "target_lang": target_lang
-        }
-        job_json = json.dumps(job)
-        redis_client.lpush("job_queue", job_json)
-        jobs.append(job_id)
 
-    logger.info(f"Queued {len(jobs)} translation job(s).")
+    lane = lane_of(form, "interactive")
+    jobs, cached, queued = await enqueue_uploads(uploads, form, lane=lane, client_id=client_id_of(request, form))
+    # only cache misses add to the queue
+    eta = await record_admitted(lane, queued)
+
+    logger.info(f"Queued {queued} translation job(s), {len(jobs) - queued} served from cache.")
     return jsonify({
         "status": "accepted",
         "job_ids": jobs,
+        "cached_job_ids": cached,
+        "eta_seconds": eta,
         "message": f"Translation job has been queued for {len(jobs)} image(s)."
     }), 202
 
-# Async Redis client
-# redis_client = aioredis.from_url("redis://localhost:6379", decode_responses=True)
-
-# @test_bp.route("/process", methods=["POST"])
-# async def process_endpoint():
-#     files = (await request.files).getlist("image")
-#     if not files:
-#         return jsonify({"error": "No image file provided"}), 400
-
-#     form = await request.form
-#     source_lang = form.get("source_lang", "ja")
-#     target_lang = form.get("target_lang", "en")
-
-#     jobs = []
-#     for file in files:
-#         job_id = str(uuid.uuid4())
-
-#         job = {
-#             "job_id": job_id,
-#             "filename": file.filename,
-#             "source_lang": source_lang,
-#             "target_lang": target_lang,
-#         }
-#         job_json = json.dumps(job)
-
-#         # Async LPUSH 
-#         await redis_client.lpush("job_queue", job_json)
-
-#         jobs.append(job_id)
-
-#     logger.info(f"Queued {len(jobs)} translation job(s).")
-#     return (
-#         jsonify(
-#             {
-#                 "status": "accepted",
-#                 "job_ids": jobs,
-#                 "message": f"Queued {len(jobs)} image(s) (non-blocking test).",
-#             }
-#         ),
-#         202,
-#     )
+@test_bp.route('/queues', methods=['GET'])
+async def queue_metrics():
+    """Queue depth per priority lane, with the number of queued jobs of every client"""
+    lanes = {}
+    for lane in LANES:
+        clients = await redis_client.lrange(f"job_queue:{lane}:clients", 0, -1)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for client_id in clients:
+                pipe.llen(f"job_queue:{lane}:{client_id}")
+            depths = await pipe.execute()
+        lanes[lane] = {
+            "depth": sum(depths),
+            "clients": dict(zip(clients, depths)),
+        }
+    return jsonify({
+        "lanes": lanes,
+        "legacy_depth": await redis_client.llen("job_queue"),
+        "drain_rate": await drain_rate(),
+    }), 200
+
+@test_bp.route('/results/stats', methods=['GET'])
+async def result_store_metrics():
+    """Size of the result store (cache entries, blob directory, Redis memory)"""
+    return jsonify(await result_store.store_stats()), 200
+
+async def _no_result(job_id):
+    """Response for a job without a result: failed (409, with the worker's error) or still pending (202)"""
+    error = await redis_client.get(f"job_failed:{job_id}")
+    if error is not None:
+        return jsonify({"status": "failed", "job_id": job_id, "error": error}), 409
+    return jsonify({"status": "pending", "message": "Result not ready"}), 202
 
 @test_bp.route('/result/<job_id>', methods=['GET'])
 async def get_result(job_id):
-    result_json = redis_client.get(f"job_result:{job_id}")
+    """Serve the translated image of a finished job"""
+    result_json = await redis_client.get(f"job_result:{job_id}")
     if not result_json:
-        return jsonify({"status": "pending", "message": "Result not ready"}), 202
+        return await _no_result(job_id)
     result = json.loads(result_json)
-    
+
+    # results written by older workers still carry the image inline
+    if "image_bytes" in result:
+        return jsonify({"status": "done", "result": result}), 200
+
+    image_bytes = await result_store.load_image(job_id, result)
+    if image_bytes is None:
+        return jsonify({"status": "expired", "message": "Result image is no longer available"}), 404
+
     logger.info("Completed Job")
-    return jsonify({"status": "done", "result": result}), 200
\ No newline at end of file
+    return Response(image_bytes, status=200, content_type=result.get("content_type", "image/png"))
+
+
+@test_bp.route('/result/<job_id>/data', methods=['GET'])
+async def get_result_data(job_id):
+    """Json metadata of a finished job (counts and translated text per bubble)"""
+    result_json = await redis_client.get(f"job_result:{job_id}")
+    if not result_json:
+        return await _no_result(job_id)
+    return jsonify({"status": "done", "result": json.loads(result_json)}), 200
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@test_bp.route('/events', methods=['GET'])
+async def job_events():
+    """
+    Server-sent events stream for a batch of jobs.
+    Usage: GET /events?job_ids=<id>,<id>,...
+    Sends one 'done' or 'failed' event per job as soon as it finishes, then an 'end' event.
+    """
+    job_ids = [job_id for job_id in request.args.get("job_ids", "").split(",") if job_id]
+    if not job_ids:
+        return jsonify({"error": "No job_ids provided"}), 400
+
+    async def stream():
+        # subscribe first, then look for jobs that finished before we were listening
+        queue = job_event_hub.subscribe(job_ids)
+        try:
+            pending = set(job_ids)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for job_id in job_ids:
+                    pipe.exists(f"job_result:{job_id}")
+                    pipe.get(f"job_failed:{job_id}")
+                states = await pipe.execute()
+            for job_id, done, error in zip(job_ids, states[::2], states[1::2]):
+                if done:
+                    pending.discard(job_id)
+                    yield _sse("done", {"job_id": job_id, "status": "done"})
+                elif error is not None:
+                    pending.discard(job_id)
+                    yield _sse("failed", {"job_id": job_id, "status": "failed", "error": error})
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + EVENTS_MAX_SECONDS
+            while pending and loop.time() < deadline:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["job_id"] not in pending:
+                    continue
+                pending.discard(event["job_id"])
+                yield _sse(event["status"], event)
+
+            yield _sse("end", {"pending": sorted(pending)})
+        finally:
+            job_event_hub.unsubscribe(job_ids, queue)
+
+    response = await make_response(stream(), {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    response.timeout = None
+    return response
@@ -0,0 +1,259 @@
+import os
+import json
+import math
+import time
+
+from shared.redis_client import redis_client
+from shared.jobs import LANES, LANE_WEIGHTS
+
+# Admission control. Workers add every finished job to the job_completions zset (scored by
+# time), which gives the cluster's drain rate. A request is turned away when its lane's
+# queue would take longer than the lane's latency budget to drain.
+ADMISSION_LATENCY_BUDGET = {
+    "interactive": float(os.getenv("ADMISSION_LATENCY_BUDGET_INTERACTIVE", 120)),
+    "bulk": float(os.getenv("ADMISSION_LATENCY_BUDGET_BULK", 30 * 60)),
+}
+# jobs a single client may have queued in a lane, 0 = no limit
+ADMISSION_CLIENT_MAX_JOBS = int(os.getenv("ADMISSION_CLIENT_MAX_JOBS", 0))
+# seconds of completions the drain rate is computed over, must match the worker's THROUGHPUT_WINDOW
+THROUGHPUT_WINDOW = int(os.getenv("THROUGHPUT_WINDOW", 5 * 60))
+# Retry-After of the 503 sent while jobs are queued and the workers look down or stuck
+ADMISSION_STALLED_RETRY_AFTER = int(os.getenv("ADMISSION_STALLED_RETRY_AFTER", 30))
+# queue depth and drain rate are cached this long, so admission doesn't cost round trips on every upload
+ADMISSION_CACHE_SECONDS = float(os.getenv("ADMISSION_CACHE_SECONDS", 1))
+
+_snapshot = {"at": 0.0}
+
+
+async def queue_depth() -> dict:
+    """
+    Queued jobs per lane, over all of its clients
+
+    Returns:
+        dict: lane -> number of queued jobs, plus the legacy job_queue under 'legacy'
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for lane in LANES:
+            pipe.lrange(f"job_queue:{lane}:clients", 0, -1)
+        clients_per_lane = await pipe.execute()
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for lane, clients in zip(LANES, clients_per_lane):
+            for client_id in clients:
+                pipe.llen(f"job_queue:{lane}:{client_id}")
+        pipe.llen("job_queue")
+        depths = iter(await pipe.execute())
+
+    result = {lane: sum(next(depths) for _ in clients) for lane, clients in zip(LANES, clients_per_lane)}
+    result["legacy"] = next(depths)
+    return result
+
+
+def lane_eta(snapshot: dict, lane: str, new_jobs: int):
+    """
+    Seconds until the lane's queue plus new_jobs is drained. Workers split their time
+    between the lanes that have work by LANE_WEIGHTS, so a lane drains at its share of
+    the total rate and a bulk backlog barely delays interactive pages.
+
+    Args:
+        snapshot (dict): Cached depths and drain rate
+        lane (str): Lane the jobs go to
+        new_jobs (int): Jobs about to be queued
+
+    Returns:
+        float: Estimated wait, None if there is no drain rate to estimate from
+    """
+    rate = snapshot["rate"]
+    if rate <= 0:
+        return None
+    depths = snapshot["depths"]
+    busy = [other for other in LANES if depths.get(other) or other == lane]
+    share = LANE_WEIGHTS.get(lane, 1) / sum(LANE_WEIGHTS.get(other, 1) for other in busy)
+    return (depths.get(lane, 0) + new_jobs) / (rate * share)
+
+
+async def drain_rate() -> float:
+    """
+    Jobs finished per second by all workers over the last THROUGHPUT_WINDOW seconds
+
+    Returns:
+        float: Rate, 0.0 if nothing finished recently
+    """
+    now = time.time()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zcount("job_completions", now - THROUGHPUT_WINDOW, "+inf")
+        pipe.zrangebyscore("job_completions", now - THROUGHPUT_WINDOW, "+inf", start=0, num=1, withscores=True)
+        count, oldest = await pipe.execute()
+    if not count:
+        return 0.0
+    # workers that just started haven't filled the window yet
+    span = max(now - oldest[0][1], 1.0) if oldest else THROUGHPUT_WINDOW
+    return count / span
+
+
+async def _load_snapshot() -> dict:
+    now = time.monotonic()
+    if now - _snapshot["at"] > ADMISSION_CACHE_SECONDS:
+        # stall_reason is looked up lazily, only when there is no drain rate
+        _snapshot.update(at=now, depths=await queue_depth(), rate=await drain_rate(), stall_reason=None, stall_checked=False)
+    return _snapshot
+
+
+async def live_workers() -> int:
+    """Workers with a live heartbeat or stats hash, the keys expire when a worker dies"""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.smembers("workers")
+        pipe.smembers("worker_stats")
+        heartbeat_ids, stats_ids = await pipe.execute()
+    worker_ids = sorted(set(heartbeat_ids) | set(stats_ids))
+    if not worker_ids:
+        return 0
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for worker_id in worker_ids:
+            pipe.exists(f"worker_heartbeat:{worker_id}", f"worker_stats:{worker_id}")
+        return sum(1 for alive in await pipe.execute() if alive)
+
+
+async def oldest_queued_at():
+    """
+    Enqueue time of the oldest job waiting in a lane
+
+    Returns:
+        float: Unix time, None if no queued job carries a queued_at
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for lane in LANES:
+            pipe.lrange(f"job_queue:{lane}:clients", 0, -1)
+        clients_per_lane = await pipe.execute()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for lane, clients in zip(LANES, clients_per_lane):
+            for client_id in clients:
+                # every client queue is FIFO, its head is its oldest job
+                pipe.lindex(f"job_queue:{lane}:{client_id}", 0)
+        heads = await pipe.execute()
+    times = []
+    for head in heads:
+        if head:
+            queued_at = json.loads(head).get("queued_at")
+            if queued_at:
+                times.append(float(queued_at))
+    return min(times) if times else None
+
+
+async def stall_reason(snapshot: dict):
+    """
+    Why the workers look down or stuck, checked only while jobs are queued without a drain rate.
+    An empty job_completions alone isn't enough: after a quiet period it stays empty until
+    the first new job finishes.
+
+    Returns:
+        str: Reason for the 503, None if the workers are alive and the queue is moving
+    """
+    if not snapshot["stall_checked"]:
+        reason = None
+        if not await live_workers():
+            reason = "no worker is running"
+        else:
+            queued_at = await oldest_queued_at()
+            if queued_at is not None and time.time() - queued_at > THROUGHPUT_WINDOW:
+                reason = f"the oldest queued job has waited {time.time() - queued_at:.0f}s and none finished in the last {THROUGHPUT_WINDOW}s"
+        snapshot.update(stall_reason=reason, stall_checked=True)
+    return snapshot["stall_reason"]
+
+
+class AdmissionRejected(Exception):
+    """Raised from read_multipart's before_files hook, carries the check_admission decision"""
+    def __init__(self, decision: dict):
+        super().__init__(decision["reason"])
+        self.decision = decision
+
+
+async def check_admission(lane: str, client_id: str, new_jobs: int = 1) -> dict:
+    """
+    Decide whether new_jobs more jobs can be queued within the lane's latency budget.
+    Runs before the upload is read, so new_jobs is the lower bound of one job; what is
+    actually queued is counted with record_admitted.
+
+    Args:
+        lane (str): Lane the jobs go to
+        client_id (str): Client queueing them
+        new_jobs (int): Number of jobs about to be queued
+
+    Returns:
+        dict: admitted (bool), eta_seconds (float or None if there is no throughput data yet),
+            and for rejections status (429 or 503), retry_after (int seconds) and reason
+    """
+    if ADMISSION_CLIENT_MAX_JOBS:
+        client_depth = await redis_client.llen(f"job_queue:{lane}:{client_id}")
+        if client_depth + new_jobs > ADMISSION_CLIENT_MAX_JOBS:
+            return {
+                "admitted": False,
+                "status": 429,
+                "retry_after": 30,
+                "eta_seconds": None,
+                "reason": f"Client has {client_depth} job(s) queued, the limit is {ADMISSION_CLIENT_MAX_JOBS}",
+            }
+
+    snapshot = await _load_snapshot()
+    eta = lane_eta(snapshot, lane, new_jobs)
+    if eta is None:
+        depth = sum(snapshot["depths"].values())
+        reason = await stall_reason(snapshot) if depth > 0 else None
+        if reason:
+            return {
+                "admitted": False,
+                "status": 503,
+                "retry_after": ADMISSION_STALLED_RETRY_AFTER,
+                "eta_seconds": None,
+                "reason": f"{depth} job(s) queued and {reason}",
+            }
+        # idle cluster, cold start or the first jobs after a quiet period, nothing to estimate from
+        return {"admitted": True, "eta_seconds": None}
+
+    budget = ADMISSION_LATENCY_BUDGET.get(lane, 0)
+    if budget and eta > budget:
+        return {
+            "admitted": False,
+            "status": 503,
+            # roughly when the backlog is back within budget
+            "retry_after": max(1, math.ceil(eta - budget)),
+            "eta_seconds": round(eta, 1),
+            "reason": f"Estimated wait of {eta:.0f}s in the {lane} lane exceeds the {budget:.0f}s budget",
+        }
+
+    return {"admitted": True, "eta_seconds": round(eta, 1)}
+
+
+async def require_admission(lane: str, client_id: str):
+    """check_admission that raises AdmissionRejected, for read_multipart's before_files hook"""
+    decision = await check_admission(lane, client_id)
+    if not decision["admitted"]:
+        raise AdmissionRejected(decision)
+
+
+async def record_admitted(lane: str, new_jobs: int):
+    """
+    Count jobs that were queued (cache misses only) until the next refresh of the depths
+
+    Args:
+        lane (str): Lane the jobs went to
+        new_jobs (int): Number of jobs queued
+
+    Returns:
+        float: ETA of the last of them, 0 if nothing was queued, None without a drain rate
+    """
+    if not new_jobs:
+        return 0
+    snapshot = await _load_snapshot()
+    snapshot["depths"][lane] = snapshot["depths"].get(lane, 0) + new_jobs
+    eta = lane_eta(snapshot, lane, 0)
+    return None if eta is None else round(eta, 1)
+
+
+def rejection_response(decision: dict):
+    """Body, status and headers of a rejected request"""
+    return {
+        "error": decision["reason"],
+        "retry_after": decision["retry_after"],
+        "eta_seconds": decision["eta_seconds"],
+    }, decision["status"], {"Retry-After": str(decision["retry_after"])}
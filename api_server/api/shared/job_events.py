@@ -0,0 +1,77 @@
+import json
+import asyncio
+import logging
+from collections import defaultdict
+
+from shared.redis_client import redis_client
+
+# Workers publish {"job_id": ..., "status": "done" | "failed"} here when a job finishes.
+JOB_EVENTS_CHANNEL = "job_events"
+
+logger = logging.getLogger(__name__)
+
+
+class JobEventHub:
+    """
+    Fans job completion events out to the handlers waiting on them.
+    One pub/sub connection per API process, no matter how many clients are streaming.
+    """
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        # job_id -> queues of the streams waiting for it
+        self.waiters = defaultdict(set)
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def subscribe(self, job_ids: list) -> asyncio.Queue:
+        """
+        Start receiving the events of job_ids. Subscribe before checking for finished
+        results, otherwise a job finishing in between is missed.
+
+        Returns:
+            asyncio.Queue: Queue the events are put on
+        """
+        queue = asyncio.Queue()
+        for job_id in job_ids:
+            self.waiters[job_id].add(queue)
+        return queue
+
+    def unsubscribe(self, job_ids: list, queue: asyncio.Queue):
+        for job_id in job_ids:
+            waiting = self.waiters.get(job_id)
+            if waiting is None:
+                continue
+            waiting.discard(queue)
+            if not waiting:
+                del self.waiters[job_id]
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(JOB_EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    event = json.loads(message["data"])
+                    for queue in list(self.waiters.get(event.get("job_id"), ())):
+                        queue.put_nowait(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Job event subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+job_event_hub = JobEventHub(redis_client)
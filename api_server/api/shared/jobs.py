@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import uuid
+
+from shared.redis_client import redis_client, redis_binary_client
+from shared import result_cache
+
+# uploaded images wait in Redis until a worker picks them up, don't keep them forever if none does
+JOB_IMAGE_TTL = int(os.getenv("JOB_IMAGE_TTL", 24 * 60 * 60))
+
+# priority lanes, see worker/shared/job_queue.py. jobs go to job_queue:<lane>:<client_id>
+# and workers round-robin over the clients of a lane. JOB_LANES must match the workers',
+# the weights are the share of the workers' time a lane gets while the others have work
+LANE_WEIGHTS = {
+    lane: int(weight)
+    for lane, weight in (item.split(":") for item in os.getenv("JOB_LANES", "interactive:4,bulk:1").split(","))
+}
+LANES = list(LANE_WEIGHTS)
+
+# what a job may ask the worker to inpaint with, the worker's INPAINT_METHOD otherwise
+INPAINT_METHODS = ["opencv", "lama", "auto"]
+
+# appends the jobs to the client's queue and puts the client in the lane's ring if it isn't there yet.
+# all keys come in KEYS, they don't share a hash tag though, so this needs a single Redis node, not Cluster
+ENQUEUE_SCRIPT = """
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 2))
+if redis.call('SADD', KEYS[3], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+return redis.call('LLEN', KEYS[1])
+"""
+enqueue_script = redis_client.register_script(ENQUEUE_SCRIPT)
+
+
+async def enqueue_uploads(uploads: list, form, lane: str = "interactive", client_id: str = "anonymous", extra: dict = None):
+    """
+    Create one job per uploaded image, reusing finished or in-flight jobs of identical uploads.
+    The upload keys become the jobs' images or are deleted.
+
+    Args:
+        uploads (list): shared.uploads.Upload, in order
+        form (dict): Request options (source_lang, target_lang, manga_title, ...)
+        lane (str): Priority lane, one of LANES
+        client_id (str): Client the jobs are scheduled fairly for
+        extra (dict): Fields added to every new job, or a callable(index) returning them
+
+    Returns:
+        tuple: (job_ids in the order of uploads, ids served from cache, number of queued jobs)
+    """
+    source_lang = form.get("source_lang", "ja")
+    target_lang = form.get("target_lang", "en")
+
+    # identical upload with the same options -> reuse the finished or in-flight job.
+    # all uploads are looked up and claimed in one round trip
+    digests = [result_cache.cache_key_from_hash(upload.hasher, form) for upload in uploads]
+    claims = await result_cache.find_or_claim(redis_client, [(digest, str(uuid.uuid4())) for digest in digests])
+
+    jobs = []
+    cached = []
+    queued = []
+    unused = []
+    for index, (upload, digest, (job_id, state)) in enumerate(zip(uploads, digests, claims)):
+        jobs.append(job_id)
+        if state != "new":
+            unused.append(upload.key)
+            if state == "done":
+                cached.append(job_id)
+            continue
+
+        job = {
+            "job_id": job_id,
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "cache_key": digest,
+            "lane": lane,
+            "client_id": client_id,
+            # admission control tells a stuck queue from a quiet one by the age of its oldest job
+            "queued_at": time.time()
+        }
+        if form.get("manga_title"):
+            job["manga_title"] = form.get("manga_title")
+        if form.get("inpaint_method") in INPAINT_METHODS:
+            job["inpaint_method"] = form.get("inpaint_method")
+        if extra:
+            job.update(extra(index) if callable(extra) else extra)
+        queued.append((job, upload))
+
+    # the streamed images become the jobs' image keys without being read back,
+    # the queue only carries the small json jobs. images first so a worker never sees a job without its image
+    async with redis_binary_client.pipeline(transaction=False) as pipe:
+        for job, upload in queued:
+            pipe.rename(upload.key, f"job_image:{job['job_id']}")
+            pipe.expire(f"job_image:{job['job_id']}", JOB_IMAGE_TTL)
+        if unused:
+            pipe.delete(*unused)
+        await pipe.execute()
+
+    if queued:
+        prefix = f"job_queue:{lane}:"
+        await enqueue_script(
+            keys=[prefix + client_id, prefix + "clients", prefix + "members"],
+            args=[client_id, *[json.dumps(job) for job, _ in queued]],
+        )
+
+    return jobs, cached, len(queued)
+
+
+def client_id_of(request, form) -> str:
+    """Who a request is scheduled for: X-Client-Id header, client_id field, then the remote address"""
+    client_id = request.headers.get("X-Client-Id") or form.get("client_id") or request.remote_addr or "anonymous"
+    # it becomes part of redis keys
+    return client_id.replace(":", "_")[:128]
+
+
+def lane_of(form, default: str) -> str:
+    """Priority lane requested with the 'priority' field, default if missing or unknown"""
+    lane = form.get("priority", default)
+    return lane if lane in LANES else default
@@ -1,13 +1,44 @@
 import os
-import redis
+import redis.asyncio as aioredis
 
 # Use environment variables for flexibility. This allows you to easily switch
 # between 'localhost' for local testing and a static IP for GCP.
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 
-# Create a single, reusable Redis client connection.
+# Size of each connection pool. Handlers wait for a free connection instead of failing when it's exhausted.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+# Seconds a pooled connection may sit idle before it's pinged on checkout, so dead connections get replaced.
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+# Seconds a handler waits for a free connection before giving up.
+REDIS_POOL_TIMEOUT = int(os.getenv("REDIS_POOL_TIMEOUT", 5))
+
+
+def _make_pool(decode_responses: bool):
+    return aioredis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        decode_responses=decode_responses,
+    )
+
+
+# Async clients so the Quart handlers never block the event loop on a Redis round trip.
 # decode_responses=True ensures that data read from Redis is in a human-readable string format.
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+redis_client = aioredis.Redis(connection_pool=_make_pool(decode_responses=True))
+
+# Raw bytes client for the job images and result images, which are stored as binary keys.
+redis_binary_client = aioredis.Redis(connection_pool=_make_pool(decode_responses=False))
+
+
+async def close_redis():
+    """Close both connection pools, called when the server shuts down"""
+    await redis_client.aclose()
+    await redis_binary_client.aclose()
+    await redis_client.connection_pool.disconnect()
+    await redis_binary_client.connection_pool.disconnect()
+
 
-print(f"Redis client configured for {REDIS_HOST}:{REDIS_PORT}")
+print(f"Redis client configured for {REDIS_HOST}:{REDIS_PORT} (pool size {REDIS_MAX_CONNECTIONS})")
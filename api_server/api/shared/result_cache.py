@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import hashlib
+
+# Content-addressed result cache.
+# result_cache:<digest>   -> job_id that produced (or is producing) the result
+# job_inflight:<job_id>   -> set while the job is queued/processing, removed by the worker
+# result_cache:lru        -> zset of digests scored by last access, used for byte budget eviction
+# result_cache:sizes      -> hash of digest -> bytes the result keeps in Redis (maintained by the worker)
+# result_cache:bytes      -> running total of result_cache:sizes (maintained by the worker)
+# result_cache:blob_sizes -> hash of digest -> bytes of the result's blob file (maintained by the worker)
+# result_cache:blob_bytes -> running total of result_cache:blob_sizes (maintained by the worker)
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 24 * 60 * 60))
+# a queued job may wait as long as its image is kept (JOB_IMAGE_TTL), the worker clears the marker
+# when the job finishes or fails. a shorter TTL would queue duplicates of pages still waiting in the bulk lane
+RESULT_CACHE_INFLIGHT_TTL = int(os.getenv("RESULT_CACHE_INFLIGHT_TTL", os.getenv("JOB_IMAGE_TTL", 24 * 60 * 60)))
+
+# form fields a job carries to the worker that change its output, so they're part of the cache key.
+# the translator is configured per worker, not per job, so it isn't one of them
+CACHE_KEY_OPTIONS = ["source_lang", "target_lang", "inpaint_method", "manga_title"]
+
+
+def cache_key(image_bytes: bytes, options: dict) -> str:
+    """
+    Hash the uploaded image together with the options that affect the result
+
+    Args:
+        image_bytes (bytes): Raw uploaded image
+        options (dict): Form options, only CACHE_KEY_OPTIONS are used
+
+    Returns:
+        str: Hex digest identifying the result
+    """
+    return cache_key_from_hash(hashlib.sha256(image_bytes), options)
+
+
+def cache_key_from_hash(image_hash, options: dict) -> str:
+    """
+    Same as cache_key, for an image that was hashed while it was streamed in
+
+    Args:
+        image_hash (hashlib.sha256): Hash over the image bytes, left unchanged
+        options (dict): Form options, only CACHE_KEY_OPTIONS are used
+    """
+    digest = image_hash.copy()
+    relevant = {name: options.get(name) for name in CACHE_KEY_OPTIONS if options.get(name) is not None}
+    digest.update(json.dumps(relevant, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# for every (digest, new job id) pair: reuse the finished or in-flight job of the digest, otherwise
+# register the new job as its producer and mark it in flight. one round trip for a whole batch, and
+# atomic, so two requests can't both claim a digest. keys are built in the script, single Redis node only
+# ARGV: now, RESULT_CACHE_TTL, RESULT_CACHE_INFLIGHT_TTL, then digest, new job id pairs
+FIND_OR_CLAIM_SCRIPT = """
+local now, cache_ttl, inflight_ttl = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local found = {}
+for i = 4, #ARGV, 2 do
+    local digest, new_id = ARGV[i], ARGV[i + 1]
+    local key = 'result_cache:' .. digest
+    local job_id = redis.call('GET', key)
+    local state = nil
+    if job_id then
+        if redis.call('EXISTS', 'job_result:' .. job_id) == 1 then
+            -- keep recently requested results away from expiry and eviction
+            redis.call('EXPIRE', key, cache_ttl)
+            redis.call('EXPIRE', 'job_result:' .. job_id, cache_ttl)
+            redis.call('EXPIRE', 'job_result_image:' .. job_id, cache_ttl)
+            redis.call('ZADD', 'result_cache:lru', 'XX', now, digest)
+            state = 'done'
+        elseif redis.call('EXISTS', 'job_inflight:' .. job_id) == 1 then
+            state = 'pending'
+        end
+    end
+    if not state then
+        -- no job yet, or the result expired/was evicted or the job was lost
+        job_id = new_id
+        redis.call('SET', 'job_inflight:' .. job_id, digest, 'EX', inflight_ttl)
+        redis.call('SET', key, job_id, 'EX', cache_ttl)
+        state = 'new'
+    end
+    table.insert(found, job_id)
+    table.insert(found, state)
+end
+return found
+"""
+
+
+async def find_or_claim(redis_client, claims: list) -> list:
+    """
+    Look up the existing job of every cache key and claim the keys without one
+
+    Args:
+        redis_client (redis.asyncio.Redis): Client with decode_responses=True
+        claims (list): (digest, new job_id) pairs, a digest may repeat
+
+    Returns:
+        list: (job_id, "done" | "pending" | "new") per pair, "new" means the new job_id was registered
+    """
+    if not claims:
+        return []
+    script = redis_client.register_script(FIND_OR_CLAIM_SCRIPT)
+    args = [time.time(), RESULT_CACHE_TTL, RESULT_CACHE_INFLIGHT_TTL]
+    for digest, job_id in claims:
+        args.extend((digest, job_id))
+    found = await script(args=args)
+    return list(zip(found[::2], found[1::2]))
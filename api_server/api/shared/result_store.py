@@ -0,0 +1,65 @@
+import os
+import asyncio
+
+from shared.redis_client import redis_client, redis_binary_client
+
+# Read side of worker/shared/result_store.py. Workers put large result images in
+# RESULT_BLOB_DIR (shared with this server) and small ones in job_result_image:<job_id>.
+RESULT_BLOB_DIR = os.getenv("RESULT_BLOB_DIR", "")
+
+
+def _read_file(path: str):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+async def load_image(job_id: str, result: dict):
+    """
+    Fetch the image of a finished job from wherever the worker stored it
+
+    Args:
+        job_id (str): Job id
+        result (dict): The job's json metadata
+
+    Returns:
+        bytes: PNG bytes, None if the image is gone
+    """
+    if result.get("storage") == "blob":
+        if not RESULT_BLOB_DIR:
+            return None
+        path = os.path.join(RESULT_BLOB_DIR, f"{os.path.basename(job_id)}.png")
+        return await asyncio.to_thread(_read_file, path)
+    return await redis_binary_client.get(f"job_result_image:{job_id}")
+
+
+def _blob_usage() -> tuple:
+    files, size = 0, 0
+    if RESULT_BLOB_DIR and os.path.isdir(RESULT_BLOB_DIR):
+        for entry in os.scandir(RESULT_BLOB_DIR):
+            if entry.name.endswith(".png"):
+                files += 1
+                size += entry.stat().st_size
+    return files, size
+
+
+async def store_stats() -> dict:
+    """Size of the result store: cached results, blob directory and Redis memory"""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zcard("result_cache:lru")
+        pipe.get("result_cache:bytes")
+        pipe.get("result_cache:blob_bytes")
+        pipe.info("memory")
+        cached, cached_bytes, cached_blob_bytes, memory = await pipe.execute()
+    blob_files, blob_bytes = await asyncio.to_thread(_blob_usage)
+    return {
+        "cached_results": cached,
+        "cached_bytes": int(cached_bytes or 0),
+        "cached_blob_bytes": int(cached_blob_bytes or 0),
+        "blob_files": blob_files,
+        "blob_bytes": blob_bytes,
+        "redis_used_memory": memory.get("used_memory"),
+        "redis_maxmemory": memory.get("maxmemory"),
+    }
@@ -0,0 +1,129 @@
+import os
+import uuid
+import hashlib
+
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+
+from shared.redis_client import redis_binary_client
+
+# Streaming multipart ingestion. Image parts are appended to upload:<uuid> in Redis while
+# they arrive and hashed on the way, so a request never holds more than one chunk of an
+# image in memory. The key is renamed to job_image:<job_id> once the job is created.
+
+# uploads are written to Redis in chunks of this size
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", 256 * 1024))
+# temporary keys of requests that died half way expire after this many seconds
+UPLOAD_TTL = int(os.getenv("UPLOAD_TTL", 10 * 60))
+UPLOAD_MAX_FIELD_BYTES = 64 * 1024
+
+
+class Upload:
+    """One uploaded image, stored in a temporary Redis key"""
+    def __init__(self, filename: str = None):
+        self.key = f"upload:{uuid.uuid4()}"
+        self.filename = filename
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self.buffer = bytearray()
+
+    async def write(self, data: bytes, final: bool = False):
+        self.hasher.update(data)
+        self.size += len(data)
+        self.buffer.extend(data)
+        if len(self.buffer) >= UPLOAD_CHUNK_BYTES or (final and self.buffer):
+            async with redis_binary_client.pipeline(transaction=False) as pipe:
+                pipe.append(self.key, bytes(self.buffer))
+                pipe.expire(self.key, UPLOAD_TTL)
+                await pipe.execute()
+            self.buffer.clear()
+
+
+async def discard_uploads(uploads: list):
+    """Delete the temporary keys of uploads that won't become jobs"""
+    if uploads:
+        await redis_binary_client.delete(*[upload.key for upload in uploads])
+
+
+async def read_multipart(request, file_field: str = "image", before_files=None):
+    """
+    Stream a multipart/form-data request body into Redis
+
+    Args:
+        request (quart.Request): The request, its body must not have been read yet
+        file_field (str): Name of the file parts to ingest, other files are skipped
+        before_files (callable): Awaited with the form fields read so far when the first
+            file part starts, before anything is stored. Whatever it raises aborts the upload
+
+    Returns:
+        tuple: (form fields as a dict, list of Upload in request order)
+
+    Raises:
+        ValueError: If the body isn't valid multipart/form-data
+    """
+    boundary = request.mimetype_params.get("boundary")
+    if request.mimetype != "multipart/form-data" or not boundary:
+        raise ValueError("Expected a multipart/form-data body")
+
+    # no max_form_memory_size: werkzeug checks it against every received chunk, file parts
+    # included, so a normal upload could fail half way. handle() caps the fields itself
+    decoder = MultipartDecoder(boundary.encode("latin-1"))
+    form = {}
+    uploads = []
+    # what the current part's data goes to: an Upload, a field value buffer, or None to skip it
+    target = None
+    field_name = None
+
+    async def handle(event):
+        nonlocal target, field_name
+        if isinstance(event, File):
+            if event.name == file_field:
+                if before_files is not None and not uploads:
+                    await before_files(form)
+                target = Upload(event.filename)
+                uploads.append(target)
+            else:
+                target = None
+        elif isinstance(event, Field):
+            field_name = event.name
+            target = bytearray()
+        elif isinstance(event, Data):
+            if isinstance(target, Upload):
+                await target.write(event.data, final=not event.more_data)
+            elif isinstance(target, bytearray):
+                target.extend(event.data)
+                if len(target) > UPLOAD_MAX_FIELD_BYTES:
+                    raise ValueError(f"Form field '{field_name}' is too large")
+                if not event.more_data:
+                    form[field_name] = target.decode("utf-8")
+
+    try:
+        body_done = False
+        async for chunk in request.body:
+            if body_done:
+                # anything after the closing boundary is ignored
+                continue
+            decoder.receive_data(chunk)
+            while True:
+                event = decoder.next_event()
+                if isinstance(event, NeedData):
+                    break
+                if isinstance(event, Epilogue):
+                    body_done = True
+                    break
+                await handle(event)
+        if not body_done:
+            decoder.receive_data(None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                await handle(event)
+                event = decoder.next_event()
+            if not isinstance(event, Epilogue):
+                raise ValueError("Multipart body ended early")
+    except Exception:
+        await discard_uploads(uploads)
+        raise
+
+    # browsers send an empty part when no file was picked
+    empty = [upload for upload in uploads if upload.size == 0]
+    await discard_uploads(empty)
+    return form, [upload for upload in uploads if upload.size > 0]
@@ -0,0 +1,23 @@
+import asyncio
+
+import fakeredis
+
+from shared import result_cache
+
+
+def test_find_or_claim_reuses_done_and_inflight_jobs():
+    async def run():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        first = await result_cache.find_or_claim(redis, [("a", "job-1"), ("b", "job-2"), ("a", "job-3")])
+        # the repeated digest attaches to the job claimed earlier in the same batch
+        assert first == [("job-1", "new"), ("job-2", "new"), ("job-1", "pending")]
+
+        # job-2 finished, job-1 was lost
+        await redis.set("job_result:job-2", "{}")
+        await redis.delete("job_inflight:job-1", "job_inflight:job-2")
+        second = await result_cache.find_or_claim(redis, [("a", "job-4"), ("b", "job-5")])
+        assert second == [("job-4", "new"), ("job-2", "done")]
+        assert await redis.get("result_cache:a") == "job-4"
+        assert await redis.exists("job_inflight:job-4")
+
+    asyncio.run(run())
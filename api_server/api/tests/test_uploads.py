@@ -0,0 +1,64 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from shared import uploads
+
+BOUNDARY = "test-boundary"
+
+
+class StreamingRequest:
+    """The parts of quart.Request that read_multipart uses, with the body in fixed size chunks"""
+    def __init__(self, body: bytes, chunk_size: int):
+        self.mimetype = "multipart/form-data"
+        self.mimetype_params = {"boundary": BOUNDARY}
+        self.chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    @property
+    def body(self):
+        async def stream():
+            for chunk in self.chunks:
+                yield chunk
+        return stream()
+
+
+def multipart_body(fields: dict, files: list) -> bytes:
+    body = b""
+    for name, value in fields.items():
+        body += (
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n"
+        ).encode()
+    for filename, data in files:
+        body += (
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/png\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+@pytest.fixture
+def redis_binary(monkeypatch):
+    client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(uploads, "redis_binary_client", client)
+    return client
+
+
+@pytest.mark.parametrize("chunk_size", [64 * 1024, 64 * 1024 + 7, 4096])
+def test_streams_image_larger_than_field_limit(redis_binary, chunk_size):
+    # servers hand the body over in chunks of about 64 KB, an image part spans many of them
+    image = bytes(range(256)) * (3 * uploads.UPLOAD_MAX_FIELD_BYTES // 256 + 11)
+    body = multipart_body({"source_lang": "ja"}, [("page.png", image)])
+
+    form, files = asyncio.run(uploads.read_multipart(StreamingRequest(body, chunk_size)))
+
+    assert form == {"source_lang": "ja"}
+    assert len(files) == 1
+    assert files[0].size == len(image)
+    assert asyncio.run(redis_binary.get(files[0].key)) == image
+
+
+def test_rejects_oversized_field(redis_binary):
+    body = multipart_body({"manga_title": "x" * (uploads.UPLOAD_MAX_FIELD_BYTES + 1)}, [])
+    with pytest.raises(ValueError):
+        asyncio.run(uploads.read_multipart(StreamingRequest(body, 64 * 1024)))
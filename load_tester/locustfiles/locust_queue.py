@@ -62,33 +62,41 @@ class QueueTranslationTasks(TaskSet):
                     response.failure("No job IDs returned")
                     return
                 
-            # Step 2: Poll each job until complete
-            for job_id in job_ids:
-                done = False
-                retries = 0
-                while not done and retries < 25:
-                    with self.client.get(f"/result/{job_id}",
-                                         catch_response=True) as result_resp:
-                        if result_resp.status_code == 200:
-                            result_data = result_resp.json()
-                            if result_data.get("status") == "done":
-                                result_resp.success()
-                                done = True
-                            else:
-                                # still pending
-                                result_resp.failure("Result still pending")
-                        elif result_resp.status_code == 202:
-                            # pending state
-                            pass
-                        else:
-                            result_resp.failure(f"Unexpected status {result_resp.status_code}")
-                        
-                    if not done:
-                        time.sleep(10)  # wait before polling again
-                        retries += 1
+            # Step 2: Wait for completion events of all jobs on one stream
+            pending = set(job_ids)
+            with self.client.get("/events",
+                                 params={"job_ids": ",".join(job_ids)},
+                                 stream=True,
+                                 name="/events",
+                                 catch_response=True) as events_resp:
+                if events_resp.status_code != 200:
+                    events_resp.failure(f"Event stream failed: {events_resp.status_code}")
+                    return
+
+                for line in events_resp.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    if event.get("status") == "failed":
+                        print(f"Job {event['job_id']} failed: {event.get('error')}")
+                    pending.discard(event.get("job_id"))
+                    if not pending:
+                        break
+
+                if pending:
+                    events_resp.failure(f"{len(pending)} job(s) did not complete in time")
+                else:
+                    events_resp.success()
 
-                if not done:
-                    print(f"Job {job_id} did not complete in time.")
+            # Step 3: Download the finished images
+            for job_id in set(job_ids) - pending:
+                with self.client.get(f"/result/{job_id}",
+                                     name="/result",
+                                     catch_response=True) as result_resp:
+                    if result_resp.status_code == 200:
+                        result_resp.success()
+                    else:
+                        result_resp.failure(f"Unexpected status {result_resp.status_code}")
 
         except Exception as e:
             print(f"Error processing (queue mode): {e}")
@@ -0,0 +1,172 @@
+# usage (from worker/):
+#   python autoscale.py status                       current load and the desired replica count, as json
+#   python autoscale.py watch --interval 15          same, every interval
+#   python autoscale.py local --min 1 --max 4        spawn/stop worker.py processes on this host to match
+import os
+import sys
+import json
+import math
+import time
+import signal
+import socket
+import argparse
+import logging
+import subprocess
+
+from shared.redis_client import redis_client
+from shared.job_queue import queue_depth
+from shared.worker_stats import read_worker_stats
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+logger = logging.getLogger(__name__)
+
+# seconds of job_completions used for the arrival rate, same zset as the api server's admission control
+THROUGHPUT_WINDOW = int(os.getenv("THROUGHPUT_WINDOW", 5 * 60))
+
+
+def completion_rate(redis_client) -> float:
+    """Jobs finished per second by all workers over the last THROUGHPUT_WINDOW seconds"""
+    now = time.time()
+    count = redis_client.zcount("job_completions", now - THROUGHPUT_WINDOW, "+inf")
+    return count / THROUGHPUT_WINDOW
+
+
+def per_worker_rate(workers: list):
+    """
+    Jobs/s one worker sustains when busy, None if no worker has finished a job yet.
+    Uses the measured jobs/s of the busy workers, which covers batch and pipelined
+    workers running several jobs at once; idle workers would undercount it. Falls back
+    to the average job time while no busy worker has a rate yet.
+    """
+    rates = [worker["jobs_per_sec"] for worker in workers if worker["current_jobs"] and worker["jobs_per_sec"] > 0]
+    if rates:
+        return sum(rates) / len(rates)
+    job_seconds = [worker["job_seconds"] for worker in workers if worker["job_seconds"] > 0]
+    if not job_seconds:
+        return None
+    return 1.0 / (sum(job_seconds) / len(job_seconds))
+
+
+def desired_replicas(depth: int, arrival_rate: float, worker_rate, current: int,
+                     target_latency: float, min_replicas: int, max_replicas: int) -> int:
+    """
+    Workers needed to keep up with arrivals and drain the backlog within target_latency
+
+    Args:
+        depth (int): Jobs waiting in the queues
+        arrival_rate (float): Jobs/s coming in, approximated by the recent completion rate
+        worker_rate (float): Jobs/s of one busy worker, None if unknown
+        current (int): Live workers
+        target_latency (float): Seconds a queued job may wait
+        min_replicas (int): Lower bound
+        max_replicas (int): Upper bound
+
+    Returns:
+        int: Desired number of workers
+    """
+    if worker_rate is None:
+        # nothing measured yet, one worker if there is work, otherwise keep what we have
+        desired = max(current, 1) if depth else current
+    else:
+        needed_rate = arrival_rate + depth / target_latency
+        desired = math.ceil(needed_rate / worker_rate)
+    return max(min_replicas, min(max_replicas, desired))
+
+
+def collect(args, workers: list = None) -> dict:
+    """Read the queues and worker stats and compute the desired replica count"""
+    depths = queue_depth(redis_client)
+    if workers is None:
+        workers = read_worker_stats(redis_client)
+    depth = sum(depths.values())
+    arrival_rate = completion_rate(redis_client)
+    worker_rate = per_worker_rate(workers)
+
+    stage_seconds = {}
+    for worker in workers:
+        for stage, seconds in worker["stage_seconds"].items():
+            stage_seconds.setdefault(stage, []).append(seconds)
+
+    return {
+        "queue_depth": depths,
+        "workers": len(workers),
+        "busy_workers": sum(1 for worker in workers if worker["current_jobs"]),
+        "completion_rate": round(arrival_rate, 4),
+        "worker_rate": round(worker_rate, 4) if worker_rate else None,
+        "stage_seconds": {stage: round(sum(values) / len(values), 3) for stage, values in stage_seconds.items()},
+        "desired_replicas": desired_replicas(
+            depth, arrival_rate, worker_rate, len(workers),
+            args.target_latency, args.min, args.max,
+        ),
+    }
+
+
+def run_local(args):
+    """Keep the number of local worker.py processes at the desired replica count"""
+    processes = []
+    scale_down_since = None
+
+    def stop_all(*_):
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop_all)
+    signal.signal(signal.SIGINT, stop_all)
+
+    host = socket.gethostname()
+    while True:
+        processes[:] = [process for process in processes if process.poll() is None]
+        workers = read_worker_stats(redis_client)
+        status = collect(args, workers)
+        # our children are told apart by host and pid, they only show up once they publish stats
+        pids = {process.pid for process in processes}
+        others = sum(1 for worker in workers if not (worker.get("host") == host and worker["pid"] in pids))
+        desired = max(args.min, min(args.max, status["desired_replicas"] - others))
+
+        if desired > len(processes):
+            scale_down_since = None
+            for _ in range(desired - len(processes)):
+                processes.append(subprocess.Popen([sys.executable, "worker.py"]))
+            logger.info(f"Scaled up to {len(processes)} worker(s): {json.dumps(status)}")
+        elif desired < len(processes):
+            # wait out the cooldown so a short lull doesn't kill workers that are needed again
+            scale_down_since = scale_down_since or time.monotonic()
+            if time.monotonic() - scale_down_since >= args.cooldown:
+                # newest first, they have the coldest caches
+                for process in processes[desired:]:
+                    process.terminate()
+                processes[:] = processes[:desired]
+                scale_down_since = None
+                logger.info(f"Scaled down to {len(processes)} worker(s): {json.dumps(status)}")
+        else:
+            scale_down_since = None
+
+        time.sleep(args.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker replica count from queue depth and worker throughput")
+    parser.add_argument("mode", choices=["status", "watch", "local"])
+    parser.add_argument("--target_latency", type=float, default=float(os.getenv("AUTOSCALE_TARGET_LATENCY", 60)),
+                        help="Seconds a queued job may wait before being picked up")
+    parser.add_argument("--min", type=int, default=int(os.getenv("AUTOSCALE_MIN_REPLICAS", 1)))
+    parser.add_argument("--max", type=int, default=int(os.getenv("AUTOSCALE_MAX_REPLICAS", 8)))
+    parser.add_argument("--interval", type=float, default=15, help="Seconds between checks")
+    parser.add_argument("--cooldown", type=float, default=120, help="Seconds the load must stay low before scaling down")
+    args = parser.parse_args()
+
+    if args.mode == "status":
+        print(json.dumps(collect(args), indent=2))
+    elif args.mode == "watch":
+        while True:
+            print(json.dumps(collect(args)), flush=True)
+            time.sleep(args.interval)
+    else:
+        run_local(args)
+
+
+if __name__ == "__main__":
+    main()
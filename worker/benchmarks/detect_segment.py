@@ -0,0 +1,65 @@
+# usage (from worker/): python -m benchmarks.detect_segment --image_dir ../load_tester/raw_scans/jjk
+import time
+import argparse
+import statistics
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from benchmarks.images import load_images
+from process.text_extraction import MangaTextExtractor, configure_torch_threads
+
+
+def time_per_page(fn, images: list, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        for image in images:
+            start = time.perf_counter()
+            fn(image)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs concurrent bubble detection + text segmentation")
+    parser.add_argument("--image_dir", type=str, default="../load_tester/raw_scans/jjk")
+    parser.add_argument("--limit", type=int, default=10, help="Max number of pages to use")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir, args.limit)
+    if not images:
+        raise SystemExit(f"No images found in {args.image_dir}")
+
+    torch_threads = configure_torch_threads()
+    # the concurrent path is benchmarked regardless of YOLO_CONCURRENT
+    extractor = MangaTextExtractor(concurrent=True)
+
+    def serial(image):
+        extractor.detect_bubbles(image, 0.25)
+        extractor.segment_text(image)
+
+    def concurrent(image):
+        extractor.detect_and_segment(image, 0.25)
+
+    # warm up both models so the first page doesn't pay for lazy init
+    serial(images[0])
+    concurrent(images[0])
+
+    results = {
+        "detect only": time_per_page(lambda image: extractor.detect_bubbles(image, 0.25), images, args.repeat),
+        "segment only": time_per_page(extractor.segment_text, images, args.repeat),
+        "serial": time_per_page(serial, images, args.repeat),
+        "concurrent": time_per_page(concurrent, images, args.repeat),
+    }
+
+    print(f"{len(images)} pages x {args.repeat} runs, torch threads per op: {torch_threads}")
+    for name, timings in results.items():
+        print(f"{name:>14}: mean {statistics.mean(timings) * 1000:8.1f} ms/page, median {statistics.median(timings) * 1000:8.1f} ms/page")
+
+    speedup = statistics.mean(results["serial"]) / statistics.mean(results["concurrent"])
+    print(f"concurrent speedup over serial: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
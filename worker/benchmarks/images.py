@@ -0,0 +1,13 @@
+import os
+import glob
+
+import cv2
+
+
+def load_images(image_dir: str, limit: int) -> list:
+    """The first limit pages of image_dir, sorted by file name, as BGR arrays"""
+    paths = []
+    for extension in ["*.jpg", "*.jpeg", "*.png", "*.webp"]:
+        paths.extend(glob.glob(os.path.join(image_dir, extension)))
+    images = [cv2.imread(path) for path in sorted(paths)[:limit]]
+    return [image for image in images if image is not None]
@@ -0,0 +1,176 @@
+# usage (from worker/): python -m benchmarks.lama_prep --image_dir ../load_tester/raw_scans/jjk [--crops] [--with_model]
+# every variant runs in its own process, so the reported peak RSS is its own
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+import cv2
+import numpy as np
+import torch
+from dotenv import load_dotenv
+load_dotenv()
+
+from benchmarks.images import load_images
+from process.utils.inpainting import (
+    norm_img,
+    ceil_modulo,
+    boxes_from_mask,
+    merge_boxes,
+    resize_max_size,
+    LamaBufferPool,
+    prepare_lama_batch,
+    lama_output_to_bgr
+)
+
+PAD_MOD = 8
+# Inpainter's region mode defaults (LAMA_CROP_MARGIN, LAMA_MERGE_GAP, LAMA_BUCKETS)
+CROP_MARGIN = 64
+MERGE_GAP = 32
+BUCKETS = [256, 384, 512, 640, 768, 896, 1024]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def page_mask(image):
+    """A text-like mask, the exact shape doesn't matter for the tensor preparation"""
+    mask = np.zeros(image.shape[:2], dtype=np.uint8)
+    h, w = mask.shape
+    for y in range(h // 10, h, h // 5):
+        cv2.rectangle(mask, (w // 10, y), (w // 3, y + h // 20), 255, -1)
+    return mask
+
+
+def region_inputs(image, mask):
+    """The crops region mode feeds LaMa, as (crop, crop mask, (bucket height, bucket width))"""
+    height, width = image.shape[:2]
+    inputs = []
+    for x1, y1, x2, y2 in merge_boxes(boxes_from_mask(mask), MERGE_GAP):
+        x1, y1 = max(0, x1 - CROP_MARGIN), max(0, y1 - CROP_MARGIN)
+        x2, y2 = min(width, x2 + CROP_MARGIN), min(height, y2 + CROP_MARGIN)
+        crop = resize_max_size(image[y1:y2, x1:x2], BUCKETS[-1])
+        crop_mask = resize_max_size(mask[y1:y2, x1:x2], BUCKETS[-1], interpolation=cv2.INTER_NEAREST)
+        bucket = tuple(next((size for size in BUCKETS if side <= size), BUCKETS[-1]) for side in crop.shape[:2])
+        inputs.append((crop, crop_mask, bucket))
+    return inputs
+
+
+def legacy(model, image, mask, height, width):
+    """Preparation and output handling as Inpainter did before the buffer pool"""
+    orig_h, orig_w = image.shape[:2]
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    padding = ((0, height - orig_h), (0, width - orig_w))
+    image_norm = norm_img(np.pad(rgb, padding + ((0, 0),), mode="symmetric"))
+    mask_norm = (norm_img(np.pad(mask, padding, mode="symmetric")) > 0) * 1
+    image_tensor = torch.from_numpy(image_norm).unsqueeze(0)
+    mask_tensor = torch.from_numpy(mask_norm).unsqueeze(0)
+    with torch.no_grad():
+        output = model(image_tensor, mask_tensor) if model else image_tensor.clone()
+    result = output[0].permute(1, 2, 0).detach().cpu().numpy()
+    result = np.clip(result * 255, 0, 255).astype("uint8")
+    return cv2.cvtColor(result[:orig_h, :orig_w, :], cv2.COLOR_RGB2BGR)
+
+
+def lean(pool, model, image, mask, height, width):
+    """Pooled buffers, fused conversion, uint8 output conversion"""
+    orig_h, orig_w = image.shape[:2]
+    image_tensor, mask_tensor = prepare_lama_batch(pool, [image], [mask], height, width)
+    with torch.inference_mode():
+        output = model(image_tensor, mask_tensor) if model else image_tensor.clone()
+        return lama_output_to_bgr(output, [(orig_h, orig_w)])[0]
+
+
+def run_variant(args):
+    images = load_images(args.image_dir, args.limit)
+    if not images:
+        raise SystemExit(f"No images found in {args.image_dir}")
+    masks = [page_mask(image) for image in images]
+    if args.crops:
+        # one item per page, the page's crops at their bucket size
+        pages = [region_inputs(image, mask) for image, mask in zip(images, masks)]
+    else:
+        pages = [[(image, mask, None)] for image, mask in zip(images, masks)]
+
+    model = None
+    if args.with_model:
+        from process.inpaint import Inpainter
+        model = Inpainter().lama_model
+
+    pool = LamaBufferPool()
+
+    def fn(page):
+        for image, mask, bucket in page:
+            h, w = image.shape[:2]
+            height, width = bucket or (ceil_modulo(h, PAD_MOD), ceil_modulo(w, PAD_MOD))
+            if args.variant == "legacy":
+                legacy(model, image, mask, height, width)
+            else:
+                lean(pool, model, image, mask, height, width)
+
+    baseline_rss = peak_rss_mb()
+    timings = []
+    cpu_start = time.process_time()
+    for _ in range(args.repeat):
+        for page in pages:
+            start = time.perf_counter()
+            fn(page)
+            timings.append(time.perf_counter() - start)
+    cpu_seconds = time.process_time() - cpu_start
+
+    print(json.dumps({
+        "variant": args.variant,
+        "pages": len(images),
+        "crops": sum(len(page) for page in pages) if args.crops else 0,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "cpu_ms": cpu_seconds / len(timings) * 1000,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LaMa tensor preparation: legacy copies vs pooled buffers")
+    parser.add_argument("--image_dir", type=str, default="../load_tester/raw_scans/jjk")
+    parser.add_argument("--limit", type=int, default=10, help="Max number of pages to use")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--with_model", action="store_true", help="Run LaMa too instead of only the conversions")
+    parser.add_argument("--crops", action="store_true",
+                        help="Feed the bucketed mask crops of region mode instead of whole pages")
+    parser.add_argument("--variant", choices=["legacy", "lean"], help="Run one variant in this process")
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args)
+        return
+
+    results = []
+    for variant in ["legacy", "lean"]:
+        command = [sys.executable, "-m", "benchmarks.lama_prep", "--variant", variant,
+                   "--image_dir", args.image_dir, "--limit", str(args.limit), "--repeat", str(args.repeat)]
+        if args.with_model:
+            command.append("--with_model")
+        if args.crops:
+            command.append("--crops")
+        output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.getcwd()).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    inputs = f"{results[0]['crops']} region crops" if args.crops else "whole pages"
+    print(f"{results[0]['pages']} pages ({inputs}) x {args.repeat} runs, model: {'yes' if args.with_model else 'no'}")
+    for result in results:
+        print(f"{result['variant']:>7}: mean {result['mean_ms']:8.1f} ms/page, median {result['median_ms']:8.1f} ms/page, "
+              f"cpu {result['cpu_ms']:8.1f} ms/page, "
+              f"peak RSS {result['peak_rss_mb']:7.1f} MB ({result['peak_rss_mb'] - result['baseline_rss_mb']:+.1f} MB over the loaded pages)")
+    legacy_result, lean_result = results
+    print(f"lean speedup over legacy: {legacy_result['mean_ms'] / lean_result['mean_ms']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# usage (from worker/): python -m benchmarks.lama_regions --image_dir ../load_tester/raw_scans/jjk [--masks dark_text]
+# LaMa over whole pages vs. over the mask regions (LAMA_STRATEGY), every strategy in its own process
+# so the reported peak RSS is its own. Runs the model, so it needs the LaMa weights (LAMA_MODEL_PATH)
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+from benchmarks.images import load_images
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def dark_text_mask(image):
+    """
+    Dark strokes inside white, bubble-like regions, dilated like the segmenter's masks.
+    A rough stand-in for the text segmenter when its weights aren't around: it finds the
+    bubble text but also some dark details in white areas, so it errs on the side of more regions.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    count, labels, stats, _ = cv2.connectedComponentsWithStats((gray > 200).astype(np.uint8), connectivity=4)
+    mask = np.zeros_like(gray)
+    for i in range(1, count):
+        x, y, w, h, area = stats[i]
+        # bubbles: mid-sized and mostly filling their box
+        if not 0.002 * height * width <= area <= 0.08 * height * width or area < 0.4 * w * h:
+            continue
+        component = (labels[y:y + h, x:x + w] == i).astype(np.uint8)
+        contours, _ = cv2.findContours(component, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        inside = np.zeros_like(component)
+        cv2.drawContours(inside, contours, -1, 1, -1)
+        inside = cv2.erode(inside, np.ones((5, 5), np.uint8))
+        mask[y:y + h, x:x + w][(gray[y:y + h, x:x + w] < 120) & (inside > 0)] = 255
+    return cv2.dilate(mask, np.ones((5, 5), np.uint8))
+
+
+def segmenter_masks(images: list) -> list:
+    from process.model_variants import load_yolo_model, union_mask, YOLO_DEFAULT_BACKEND
+    segmenter = load_yolo_model("comic-text-segmenter", YOLO_DEFAULT_BACKEND)
+    masks = []
+    for image in images:
+        result = segmenter(image, device="cpu", verbose=False)[0]
+        masks.append(union_mask(result, image.shape).astype("uint8") * 255)
+    return masks
+
+
+def run_strategy(args):
+    from process.inpaint import Inpainter
+
+    images = load_images(args.image_dir, args.limit)
+    if not images:
+        raise SystemExit(f"No images found in {args.image_dir}")
+    masks = segmenter_masks(images) if args.masks == "segmenter" else [dark_text_mask(image) for image in images]
+
+    inpainter = Inpainter()
+    inpainter.lama_strategy = args.strategy
+    # count what LaMa actually gets, padding included
+    model = inpainter.lama_model
+    pixels = []
+
+    def counting_model(image, mask):
+        pixels.append(image.shape[0] * image.shape[2] * image.shape[3])
+        return model(image, mask)
+    inpainter.lama_model = counting_model
+
+    baseline_rss = peak_rss_mb()
+    timings = []
+    cpu_start = time.process_time()
+    for image, mask in zip(images, masks):
+        start = time.perf_counter()
+        inpainter.lama_inpaint(image, mask)
+        timings.append(time.perf_counter() - start)
+    cpu_seconds = time.process_time() - cpu_start
+
+    print(json.dumps({
+        "strategy": args.strategy,
+        "pages": len(images),
+        "mask_coverage": float(np.mean([(mask > 0).mean() for mask in masks])),
+        "page_pixels": sum(image.shape[0] * image.shape[1] for image in images) / len(images),
+        "lama_pixels": sum(pixels) / len(images),
+        "lama_calls": len(pixels) / len(images),
+        "mean_s": statistics.mean(timings),
+        "cpu_s": cpu_seconds / len(images),
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LaMa on whole pages vs. on mask regions")
+    parser.add_argument("--image_dir", type=str, default="../load_tester/raw_scans/jjk")
+    parser.add_argument("--limit", type=int, default=5, help="Max number of pages to use")
+    parser.add_argument("--masks", choices=["segmenter", "dark_text"], default="segmenter",
+                        help="Text masks from the text segmenter, or the dark_text_mask approximation")
+    parser.add_argument("--strategies", nargs="+", default=["full", "region"], choices=["full", "region"])
+    parser.add_argument("--strategy", choices=["full", "region"], help="Run one strategy in this process")
+    args = parser.parse_args()
+
+    if args.strategy:
+        run_strategy(args)
+        return
+
+    results = []
+    for strategy in args.strategies:
+        command = [sys.executable, "-m", "benchmarks.lama_regions", "--strategy", strategy,
+                   "--image_dir", args.image_dir, "--limit", str(args.limit), "--masks", args.masks]
+        process = subprocess.run(command, capture_output=True, text=True, cwd=os.getcwd())
+        if process.returncode != 0:
+            # whole pages can take more memory than the host has, the kernel kills the process
+            reason = "killed, out of memory?" if process.returncode == -9 else process.stderr.strip().splitlines()[-1]
+            results.append({"strategy": strategy, "failed": reason})
+            continue
+        results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    measured = [result for result in results if "failed" not in result]
+    if measured:
+        print(f"{measured[0]['pages']} pages, {args.masks} masks covering {measured[0]['mask_coverage'] * 100:.1f}% of a page")
+    for result in results:
+        if "failed" in result:
+            print(f"{result['strategy']:>6}: failed ({result['failed']})")
+            continue
+        print(f"{result['strategy']:>6}: mean {result['mean_s']:7.2f} s/page, cpu {result['cpu_s']:7.2f} s/page, "
+              f"LaMa input {result['lama_pixels'] / result['page_pixels'] * 100:5.1f}% of the page pixels "
+              f"in {result['lama_calls']:.1f} call(s), "
+              f"peak RSS {result['peak_rss_mb']:7.1f} MB ({result['peak_rss_mb'] - result['baseline_rss_mb']:+.1f} MB over the loaded model and pages)")
+
+
+if __name__ == "__main__":
+    main()
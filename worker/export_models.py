@@ -0,0 +1,144 @@
+# usage (from worker/):
+#   python export_models.py lama --variants frozen onnx-int8     export LaMa variants, then check them against fp32
+#   python export_models.py yolo --variants onnx onnx-int8-static
+#   python export_models.py check                                 only check the variants already exported
+# the parity reports are printed and written to models/parity.json, the exit code is 1 if a variant fails its check
+import os
+import sys
+import json
+import argparse
+import logging
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from benchmarks.images import load_images
+from process.model_variants import (
+    MODELS_DIR,
+    LAMA_MODEL_PATH,
+    LAMA_MODEL_MD5,
+    LAMA_DEFAULT_BACKEND,
+    YOLO_DEFAULT_BACKEND,
+    LAMA_VARIANTS,
+    YOLO_VARIANTS,
+    YOLO_MODELS,
+    variant_path,
+    load_lama_model,
+    load_yolo_model,
+    export_lama,
+    export_yolo,
+    lama_parity,
+    yolo_parity,
+    union_mask,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+logger = logging.getLogger(__name__)
+
+PARITY_REPORT = os.path.join(MODELS_DIR, "parity.json")
+
+
+def text_masks(images: list) -> list:
+    """Masks LaMa is checked on, from the fp32 text segmenter so they look like the real ones"""
+    segmenter = load_yolo_model("comic-text-segmenter", YOLO_DEFAULT_BACKEND)
+    masks = []
+    for image in images:
+        result = segmenter(image, device="cpu", verbose=False)[0]
+        masks.append(union_mask(result, image.shape).astype("uint8") * 255)
+    return masks
+
+
+def check_lama(variants: list, images: list, args) -> dict:
+    reference = load_lama_model(LAMA_MODEL_PATH, "cpu", LAMA_MODEL_MD5, LAMA_DEFAULT_BACKEND)
+    masks = text_masks(images)
+    reports = {}
+    for variant in variants:
+        model = load_lama_model(LAMA_MODEL_PATH, "cpu", LAMA_MODEL_MD5, variant)
+        report = lama_parity(reference, model, images, masks)
+        report["passed"] = report["mean_abs_diff"] <= args.max_mean_diff
+        reports[f"lama:{variant}"] = report
+    return reports
+
+
+def check_yolo(variants: list, images: list, args) -> dict:
+    reports = {}
+    for name, task in YOLO_MODELS.items():
+        reference = load_yolo_model(name, YOLO_DEFAULT_BACKEND)
+        for variant in variants:
+            model = load_yolo_model(name, variant)
+            report = yolo_parity(reference, model, task, images)
+            report["passed"] = (
+                report["box_recall"] >= args.min_box_recall
+                and report["box_precision"] >= args.min_box_recall
+                and report.get("mask_iou", 1.0) >= args.min_mask_iou
+            )
+            reports[f"{name}:{variant}"] = report
+    return reports
+
+
+def exported(variants: list, paths: list) -> list:
+    """The variants whose files exist for every path"""
+    return [variant for variant in variants if all(os.path.exists(variant_path(path, variant)) for path in paths)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export optimized CPU model variants and check them against fp32")
+    parser.add_argument("target", choices=["lama", "yolo", "check"])
+    parser.add_argument("--variants", nargs="+", help="Variants to export, all of the target's by default")
+    parser.add_argument("--image_dir", type=str, default="../load_tester/raw_scans/jjk",
+                        help="Sample pages for the parity checks and static quantization")
+    parser.add_argument("--limit", type=int, default=10, help="Max number of pages to use")
+    parser.add_argument("--max_mean_diff", type=float, default=3.0,
+                        help="LaMa: max mean absolute difference of the inpainted pixels (0-255)")
+    parser.add_argument("--min_box_recall", type=float, default=0.95,
+                        help="YOLO: min share of fp32 boxes found again, and of variant boxes found by fp32")
+    parser.add_argument("--min_mask_iou", type=float, default=0.9, help="Text segmenter: min mean mask IoU")
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir, args.limit)
+    if not images:
+        raise SystemExit(f"No images found in {args.image_dir}")
+    yolo_paths = [os.path.join(MODELS_DIR, name + ".pt") for name in YOLO_MODELS]
+
+    reports = {}
+    if args.target == "lama":
+        variants = args.variants or LAMA_VARIANTS
+        for variant in variants:
+            logger.info(f"Exporting LaMa variant '{variant}'")
+            export_lama(LAMA_MODEL_PATH, variant, LAMA_MODEL_MD5)
+        reports.update(check_lama(variants, images, args))
+    elif args.target == "yolo":
+        variants = args.variants or YOLO_VARIANTS
+        for variant in variants:
+            for name in YOLO_MODELS:
+                logger.info(f"Exporting {name} variant '{variant}'")
+                export_yolo(name, variant, calibration_images=images)
+        reports.update(check_yolo(variants, images, args))
+    else:
+        lama_variants = exported(LAMA_VARIANTS, [LAMA_MODEL_PATH])
+        yolo_variants = exported(YOLO_VARIANTS, yolo_paths)
+        if lama_variants:
+            reports.update(check_lama(lama_variants, images, args))
+        if yolo_variants:
+            reports.update(check_yolo(yolo_variants, images, args))
+        if not reports:
+            raise SystemExit("No exported variants found, run the lama or yolo target first")
+
+    # keep the reports of the variants not checked this time
+    previous = {}
+    if os.path.exists(PARITY_REPORT):
+        with open(PARITY_REPORT, "r") as f:
+            previous = json.load(f)
+    previous.update(reports)
+    with open(PARITY_REPORT, "w") as f:
+        json.dump(previous, f, indent=2)
+
+    print(json.dumps(reports, indent=2))
+    failed = [key for key, report in reports.items() if not report["passed"]]
+    if failed:
+        logger.error(f"Parity check failed for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
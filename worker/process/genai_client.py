@@ -0,0 +1,70 @@
+import os
+import random
+import asyncio
+import logging
+
+from google import genai
+from google.genai import errors
+
+
+class AsyncGenAIClient:
+    """
+    Shared async Gemini client used for OCR and translation.
+    One underlying client so connections are reused, with bounded concurrency,
+    a per-request timeout and retries with jittered exponential backoff.
+    """
+    def __init__(self, api_key=None, max_concurrency=None, timeout=None, max_retries=None, backoff_base=None):
+        """
+        Args:
+            api_key (str): Gemini API key, GEMINI_API_KEY if None
+            max_concurrency (int): Max requests in flight at once
+            timeout (float): Seconds before a request is abandoned
+            max_retries (int): Retries after the first attempt
+            backoff_base (float): First backoff delay in seconds, doubled on every retry
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.client = genai.Client(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self.max_concurrency = max_concurrency or int(os.getenv("GENAI_MAX_CONCURRENCY", 8))
+        self.timeout = timeout or float(os.getenv("GENAI_TIMEOUT", 30))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GENAI_MAX_RETRIES", 3))
+        self.backoff_base = backoff_base or float(os.getenv("GENAI_BACKOFF_BASE", 0.5))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (asyncio.TimeoutError, errors.ServerError)):
+            return True
+        # rate limited
+        return isinstance(error, errors.ClientError) and error.code == 429
+
+    async def generate_content(self, model: str, contents, config=None):
+        """
+        Async equivalent of client.models.generate_content
+
+        Args:
+            model (str): Model name, e.g. 'gemini-2.0-flash'
+            contents: Prompt and/or parts
+            config (types.GenerateContentConfig): Optional generation config
+
+        Returns:
+            types.GenerateContentResponse: The response
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    return await asyncio.wait_for(
+                        self.client.aio.models.generate_content(model=model, contents=contents, config=config),
+                        timeout=self.timeout,
+                    )
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                # full jitter, so retrying workers don't hit the api in lockstep
+                delay = random.uniform(0, self.backoff_base * 2 ** attempt)
+                attempt += 1
+                self.logger.warning(f"Gemini request failed ({e!r}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+
+genai_client = AsyncGenAIClient()
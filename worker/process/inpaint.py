@@ -8,6 +8,7 @@ import asyncio
 from pathlib import Path
 import pdb
 import logging
+import threading
 
 # Third-party imports - Data processing & mathematical operations
 import numpy as np
@@ -21,11 +22,18 @@ import matplotlib.pyplot as plt
 
 # local imports
 from .utils.inpainting import (
-    norm_img,
     get_cache_path_by_url,
     load_jit_model,
-    download_model
+    download_model,
+    ceil_modulo,
+    boxes_from_mask,
+    merge_boxes,
+    resize_max_size,
+    LamaBufferPool,
+    prepare_lama_batch,
+    lama_output_to_bgr
 )
+from .model_variants import load_lama_model, LAMA_MODEL_PATH, LAMA_MODEL_MD5, LAMA_DEFAULT_BACKEND
 
 class Inpainter:
     """
@@ -37,13 +45,37 @@ class Inpainter:
         self.mask_dilation_radius = mask_dilation_radius
 
         # LaMa model setup
-        self.lama_model_path = os.environ.get(
-            "LAMA_MODEL_PATH",
-            os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models', 'anime-manga-big-lama.pt'))
-        )
-        self.lama_model_md5 = os.environ.get("LAMA_MODEL_MD5", "29f284f36a0a510bcacf39ecf4c4d54f")
+        self.lama_model_path = LAMA_MODEL_PATH
+        self.lama_model_md5 = LAMA_MODEL_MD5
         self.lama_device = lama_device
-        self.lama_model = load_jit_model(self.lama_model_path, self.lama_device, self.lama_model_md5)
+        # 'torchscript' (fp32) or an exported variant, see process/model_variants.py
+        self.lama_backend = os.getenv("LAMA_BACKEND", LAMA_DEFAULT_BACKEND)
+        self.lama_model = load_lama_model(self.lama_model_path, self.lama_device, self.lama_model_md5, self.lama_backend)
+        # input tensors are reused between calls, the lock keeps concurrent callers
+        # (pipeline stage workers) from writing into a buffer that is being inferred on
+        self.buffer_pool = LamaBufferPool()
+        self.lama_lock = threading.Lock()
+
+        # 'region' runs LaMa only on crops around the masked text, 'full' on the whole page
+        self.lama_strategy = os.getenv("LAMA_STRATEGY", "region")
+        # context kept around every mask region, LaMa needs surroundings to fill from
+        self.crop_margin = int(os.getenv("LAMA_CROP_MARGIN", 64))
+        # regions closer than this are inpainted as one crop
+        self.merge_gap = int(os.getenv("LAMA_MERGE_GAP", 32))
+        # crop height and width are each padded to the smallest of these sizes that fits and every
+        # (height, width) runs as one batched call, fixed shapes also let TorchScript reuse its optimized graphs
+        self.buckets = sorted(int(size) for size in os.getenv("LAMA_BUCKETS", "256,384,512,640,768,896,1024").split(","))
+        # longer crops are downscaled to this size before inference, at most the largest bucket
+        self.crop_max_size = min(int(os.getenv("LAMA_CROP_MAX_SIZE", 1024)), self.buckets[-1])
+        self.batch_size = int(os.getenv("LAMA_BATCH_SIZE", 4))
+
+        # method='auto': regions whose background ring has a grey level std below
+        # INPAINT_AUTO_FILL_STD get a median colour fill, below INPAINT_AUTO_TELEA_STD
+        # OpenCV TELEA, anything busier (screentone, artwork) goes to LaMa
+        self.auto_fill_std = float(os.getenv("INPAINT_AUTO_FILL_STD", 6))
+        self.auto_telea_std = float(os.getenv("INPAINT_AUTO_TELEA_STD", 18))
+        # width of the background ring around the text that the region is judged by
+        self.auto_ring_width = int(os.getenv("INPAINT_AUTO_RING_WIDTH", 6))
 
     def simple_inpaint(self, image, text_mask):
         self.logger.info("Starting simple inpainting process (OpenCV)")
@@ -53,42 +85,245 @@ class Inpainter:
         text_mask = text_mask.astype(np.uint8)
         return cv2.inpaint(image, text_mask, 3, cv2.INPAINT_TELEA)
 
+    def _lama_forward(self, image, mask):
+        """
+        Run LaMa on a BGR image
+
+        Args:
+            image (numpy.ndarray): BGR(A) uint8 image
+            mask (numpy.ndarray): Mask, nonzero where to inpaint
+
+        Returns:
+            numpy.ndarray: Inpainted BGR uint8 image of the same size
+        """
+        orig_h, orig_w = image.shape[:2]
+        # Pad image and mask to be multiples of 8
+        pad_mod = 8
+        return self._lama_forward_batch([image[:, :, :3]], [mask], ceil_modulo(orig_h, pad_mod), ceil_modulo(orig_w, pad_mod))[0]
+
     def lama_inpaint(self, image, text_mask):
         self.logger.info("Starting LaMa inpainting process")
         self.logger.debug("starting LaMa inpainting process")
-        # LaMa expects RGB images and mask in [0,1]
+        if self.lama_strategy == "region":
+            return self.lama_inpaint_regions(image, text_mask)
+        if len(text_mask.shape) == 3:
+            text_mask = cv2.cvtColor(text_mask, cv2.COLOR_BGR2GRAY)
+        return self._lama_forward(image, text_mask)
+
+    def mask_regions(self, text_mask, shape):
+        """
+        Group the mask into crop boxes: connected regions, merged when close, grown by the margin
+
+        Args:
+            text_mask (numpy.ndarray): Binary mask, 0 or 255
+            shape (tuple): Image shape
+
+        Returns:
+            list: [x1, y1, x2, y2] crop boxes inside the image
+        """
+        height, width = shape[:2]
+        boxes = merge_boxes(boxes_from_mask(text_mask), self.merge_gap)
+        crops = []
+        for x1, y1, x2, y2 in boxes:
+            crops.append(np.array([
+                max(0, x1 - self.crop_margin),
+                max(0, y1 - self.crop_margin),
+                min(width, x2 + self.crop_margin),
+                min(height, y2 + self.crop_margin),
+            ]))
+        # margins can make neighbouring crops overlap, inpaint those together
+        return merge_boxes(crops)
+
+    def _lama_forward_batch(self, images, masks, height, width=None):
+        """
+        Run LaMa once over images padded to one size
+
+        Args:
+            images (list): BGR uint8 images, none larger than height x width
+            masks (list): Masks of the images, nonzero where to inpaint
+            height (int): Padded height, the bucket height for crops
+            width (int): Padded width, height if None
+
+        Returns:
+            list: Inpainted BGR uint8 images, each the size of its input
+        """
+        width = width or height
+        with self.lama_lock:
+            # the padding is mirrored from the image for natural context at the border
+            # and stays 0 in the mask, so LaMa never inpaints it
+            image_tensor, mask_tensor = prepare_lama_batch(self.buffer_pool, images, masks, height, width)
+            with torch.inference_mode():
+                inpainted = self.lama_model(image_tensor.to(self.lama_device), mask_tensor.to(self.lama_device))
+                # scaled in place, which inference tensors only allow inside inference mode
+                return lama_output_to_bgr(inpainted, [image.shape[:2] for image in images])
+
+    def _bucket_size(self, length):
+        for size in self.buckets:
+            if length <= size:
+                return size
+        return self.buckets[-1]
+
+    def _bucket_for(self, crop):
+        # bucketing the sides separately keeps long, narrow crops from being padded to a square
+        height, width = crop.shape[:2]
+        return self._bucket_size(height), self._bucket_size(width)
+
+    def _prepare_page(self, image, text_mask):
         if image.shape[2] == 4:
-            image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
-        else:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        mask = text_mask
-        orig_h, orig_w = image.shape[:2]
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        if len(text_mask.shape) == 3:
+            text_mask = cv2.cvtColor(text_mask, cv2.COLOR_BGR2GRAY)
+        text_mask = (text_mask > 0).astype(np.uint8) * 255
+        return image, text_mask
 
-        # Pad image and mask to be multiples of 8
-        from .utils.inpainting import pad_img_to_modulo
-        pad_mod = 8
-        image_padded = pad_img_to_modulo(image, pad_mod)
-        mask_padded = pad_img_to_modulo(mask, pad_mod)
-
-        image_norm = norm_img(image_padded)
-        mask_norm = norm_img(mask_padded)
-        mask_norm = (mask_norm > 0) * 1
-        image_tensor = torch.from_numpy(image_norm).unsqueeze(0).to(self.lama_device)
-        mask_tensor = torch.from_numpy(mask_norm).unsqueeze(0).to(self.lama_device)
-        with torch.no_grad():
-            inpainted = self.lama_model(image_tensor, mask_tensor)
-        result = inpainted[0].permute(1, 2, 0).detach().cpu().numpy()
-        result = np.clip(result * 255, 0, 255).astype("uint8")
-        # Crop result back to original size
-        result_cropped = result[:orig_h, :orig_w, :]
-        result_cropped = cv2.cvtColor(result_cropped, cv2.COLOR_RGB2BGR)
-        return result_cropped
+    def lama_inpaint_regions(self, image, text_mask):
+        """
+        LaMa on crops around the masked regions instead of the whole page.
+        Only the masked pixels of each crop are pasted back, the rest of the page is untouched.
+        """
+        return self.lama_inpaint_batch([image], [text_mask])[0]
+
+    def lama_inpaint_batch(self, images, text_masks):
+        """
+        Region LaMa over several pages at once. The crops of all pages are grouped by
+        bucket shape and every group runs in batches of LAMA_BATCH_SIZE.
+
+        Args:
+            images (list): BGR(A) pages
+            text_masks (list): Text mask of every page
+
+        Returns:
+            list: Inpainted BGR pages
+        """
+        results = []
+        # (bucket height, bucket width) -> list of crop dicts
+        buckets = {}
+        for page, (image, text_mask) in enumerate(zip(images, text_masks)):
+            image, text_mask = self._prepare_page(image, text_mask)
+            results.append(image.copy())
+            for x1, y1, x2, y2 in self.mask_regions(text_mask, image.shape):
+                crop_mask = text_mask[y1:y2, x1:x2]
+                small = resize_max_size(image[y1:y2, x1:x2], self.crop_max_size)
+                small_mask = resize_max_size(crop_mask, self.crop_max_size, interpolation=cv2.INTER_NEAREST)
+                buckets.setdefault(self._bucket_for(small), []).append({
+                    "page": page,
+                    "box": (x1, y1, x2, y2),
+                    "crop_mask": crop_mask,
+                    "image": small,
+                    "mask": small_mask,
+                })
+
+        for (height, width), crops in buckets.items():
+            self.logger.debug(f"LaMa on {len(crops)} crop(s) of bucket {height}x{width}")
+            for start in range(0, len(crops), self.batch_size):
+                chunk = crops[start:start + self.batch_size]
+                inpainted = self._lama_forward_batch([crop["image"] for crop in chunk], [crop["mask"] for crop in chunk], height, width)
+                for crop, crop_result in zip(chunk, inpainted):
+                    x1, y1, x2, y2 = crop["box"]
+                    if crop_result.shape[:2] != (y2 - y1, x2 - x1):
+                        crop_result = cv2.resize(crop_result, (x2 - x1, y2 - y1), interpolation=cv2.INTER_CUBIC)
+                    # only the masked pixels of the page itself change
+                    masked = crop["crop_mask"] > 0
+                    results[crop["page"]][y1:y2, x1:x2][masked] = crop_result[masked]
+        return results
+
+    def classify_region(self, crop, crop_mask):
+        """
+        Pick the inpainting method for one region from the background around its text
+
+        Args:
+            crop (numpy.ndarray): BGR crop of the region
+            crop_mask (numpy.ndarray): Text mask of the crop, 0 or 255
+
+        Returns:
+            tuple: ('fill' | 'telea' | 'lama', median BGR colour of the background)
+        """
+        # skip a couple of pixels next to the strokes, they carry the text's anti-aliasing
+        near = cv2.dilate(crop_mask, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5)))
+        ring_size = 5 + 2 * self.auto_ring_width
+        ring = cv2.dilate(crop_mask, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (ring_size, ring_size)))
+        ring = (ring > 0) & (near == 0)
+        background = crop[ring]
+        if len(background) < 16:
+            # text fills the whole crop, nothing to judge the background by
+            return "lama", None
+
+        gray = cv2.cvtColor(background.reshape(-1, 1, 3), cv2.COLOR_BGR2GRAY).ravel()
+        spread = float(gray.std())
+        median = np.median(background, axis=0).astype(np.uint8)
+        if spread < self.auto_fill_std:
+            return "fill", median
+        if spread < self.auto_telea_std:
+            return "telea", median
+        return "lama", median
+
+    def auto_inpaint_batch(self, images, text_masks):
+        """
+        Inpaint every mask region with the cheapest method that suits it: flat bubble
+        interiors are filled with their background colour or TELEA, only regions over
+        screentone or artwork go through (batched, region) LaMa.
+
+        Args:
+            images (list): BGR(A) pages
+            text_masks (list): Text mask of every page
+
+        Returns:
+            list: Inpainted BGR pages
+        """
+        results = []
+        lama_masks = []
+        counts = {"fill": 0, "telea": 0, "lama": 0}
+        for image, text_mask in zip(images, text_masks):
+            image, text_mask = self._prepare_page(image, text_mask)
+            result = image.copy()
+            lama_mask = np.zeros_like(text_mask)
+            for x1, y1, x2, y2 in self.mask_regions(text_mask, image.shape):
+                crop_mask = text_mask[y1:y2, x1:x2]
+                kind, median = self.classify_region(image[y1:y2, x1:x2], crop_mask)
+                counts[kind] += 1
+                if kind == "fill":
+                    result[y1:y2, x1:x2][crop_mask > 0] = median
+                elif kind == "telea":
+                    result[y1:y2, x1:x2] = cv2.inpaint(image[y1:y2, x1:x2], crop_mask, 3, cv2.INPAINT_TELEA)
+                else:
+                    lama_mask[y1:y2, x1:x2] = crop_mask
+            results.append(result)
+            lama_masks.append(lama_mask)
+
+        self.logger.info(f"Auto inpainting regions: {counts}")
+        lama_pages = [i for i, lama_mask in enumerate(lama_masks) if lama_mask.any()]
+        if lama_pages:
+            inpainted = self.lama_inpaint_batch([results[i] for i in lama_pages], [lama_masks[i] for i in lama_pages])
+            for i, page in zip(lama_pages, inpainted):
+                results[i] = page
+        return results
 
     def inpaint(self, image, text_mask, method='lama'):
         """
-        method: 'opencv' or 'lama'
+        method: 'opencv', 'lama' or 'auto' (chosen per region, see auto_inpaint_batch)
         """
         if method == 'lama':
             return self.lama_inpaint(image, text_mask)
+        elif method == 'auto':
+            return self.auto_inpaint_batch([image], [text_mask])[0]
         else:
-            return self.simple_inpaint(image, text_mask)
\ No newline at end of file
+            return self.simple_inpaint(image, text_mask)
+
+    def inpaint_batch(self, images, text_masks, method='lama'):
+        """
+        Inpaint several pages, with region LaMa their crops share the batched model calls
+
+        Args:
+            images (list): BGR pages
+            text_masks (list): Text mask of every page
+            method (str): 'opencv', 'lama' or 'auto'
+
+        Returns:
+            list: Inpainted BGR pages
+        """
+        if method == 'auto':
+            return self.auto_inpaint_batch(images, text_masks)
+        if method == 'lama' and self.lama_strategy == "region":
+            self.logger.info(f"Starting LaMa inpainting process for {len(images)} page(s)")
+            return self.lama_inpaint_batch(images, text_masks)
+        return [self.inpaint(image, text_mask, method=method) for image, text_mask in zip(images, text_masks)]
\ No newline at end of file
@@ -0,0 +1,110 @@
+import os
+import time
+import asyncio
+import logging
+
+from jikanpy import Jikan
+
+jikan = Jikan()
+
+
+def normalize_title(title: str) -> str:
+    """Case and whitespace insensitive key for a manga title"""
+    return ' '.join(title.lower().split())
+
+
+def fetch_manga_info(manga_title: str) -> str:
+    """
+    Look the manga up on MyAnimeList (through Jikan) and render the prompt context. Blocking.
+
+    Args:
+        manga_title (str): Title to search for
+
+    Returns:
+        str: Context string for the Gemini prompts
+    """
+    search_results = jikan.search('manga', manga_title, page=1)
+    if search_results["data"]:
+        top_result = search_results["data"][0]
+        manga_info = f"""
+        Title: {top_result['title']}\n
+        Synopsis: {top_result['synopsis']}\n
+        Themes: {', '.join([theme['name'] for theme in top_result['themes']])}\n
+        Genres: {', '.join([genre['name'] for genre in top_result['genres']])}\n
+        Demographics: {', '.join([demographic['name'] for demographic in top_result['demographics']])}\n
+        """
+    else:
+        manga_info = f"Title: {manga_title}\nNo additional information found.\n"
+    return manga_info
+
+
+class MangaMetadataCache:
+    """
+    Caches the rendered manga context by normalized title, locally and optionally
+    in Redis, and makes concurrent pages of the same manga share one Jikan lookup.
+    """
+    def __init__(self, redis_client=None, ttl=None):
+        """
+        Args:
+            redis_client (redis.Redis): Shared tier, None keeps the cache process local
+            ttl (int): Seconds an entry stays valid
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.redis_client = redis_client
+        self.ttl = ttl or int(os.getenv("MANGA_METADATA_TTL", 7 * 24 * 60 * 60))
+        # title key -> (expires_at, manga_info)
+        self.local = {}
+        # title key -> task of the lookup currently running
+        self.inflight = {}
+
+    async def get_context(self, manga_title: str) -> str:
+        """
+        Get the prompt context for a manga, looking it up only if it isn't cached
+
+        Args:
+            manga_title (str): Manga title
+
+        Returns:
+            str: Context string, empty if there is no title
+        """
+        if not manga_title:
+            return ""
+
+        key = normalize_title(manga_title)
+        entry = self.local.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        # another page is already looking this title up, wait for its answer
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, manga_title))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, manga_title: str) -> str:
+        redis_key = f"manga_info:{key}"
+        if self.redis_client is not None:
+            try:
+                manga_info = await asyncio.to_thread(self.redis_client.get, redis_key)
+                if manga_info is not None:
+                    self.local[key] = (time.monotonic() + self.ttl, manga_info)
+                    return manga_info
+            except Exception as e:
+                self.logger.warning(f"Manga metadata cache lookup failed: {e}")
+
+        try:
+            manga_info = await asyncio.to_thread(fetch_manga_info, manga_title)
+        except Exception as e:
+            # don't cache failures, the next page will try again
+            self.logger.error(f"Jikan lookup for '{manga_title}' failed: {e}")
+            return f"Title: {manga_title}\n"
+
+        self.local[key] = (time.monotonic() + self.ttl, manga_info)
+        if self.redis_client is not None:
+            try:
+                await asyncio.to_thread(self.redis_client.set, redis_key, manga_info, ex=self.ttl)
+            except Exception as e:
+                self.logger.warning(f"Manga metadata cache store failed: {e}")
+        return manga_info
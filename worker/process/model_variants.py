@@ -0,0 +1,373 @@
+import os
+import shutil
+import logging
+
+import numpy as np
+import torch
+import cv2
+from safetensors.torch import load_file
+from ultralytics import YOLO
+
+from .utils.inpainting import (
+    load_jit_model,
+    ceil_modulo,
+    resize_max_size,
+    LamaBufferPool,
+    prepare_lama_batch,
+    lama_output_to_bgr
+)
+
+# Optimized CPU variants of the models. export_models.py writes them next to the fp32 weights
+# (see variant_path) and checks them against fp32, the worker picks one with
+# LAMA_BACKEND / YOLO_BACKEND. The fp32 models stay the default.
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "models"))
+
+# the fp32 TorchScript LaMa model
+LAMA_MODEL_PATH = os.getenv("LAMA_MODEL_PATH", os.path.join(MODELS_DIR, "anime-manga-big-lama.pt"))
+LAMA_MODEL_MD5 = os.getenv("LAMA_MODEL_MD5", "29f284f36a0a510bcacf39ecf4c4d54f")
+
+# fp32 backends, as loaded before there were variants
+LAMA_DEFAULT_BACKEND = "torchscript"
+YOLO_DEFAULT_BACKEND = "torch"
+
+# 'frozen': torch.jit.freeze + optimize_for_inference, 'onnx': ONNX Runtime,
+# 'onnx-int8': ONNX Runtime with int8 weights (dynamic quantization)
+LAMA_VARIANTS = ["frozen", "onnx", "onnx-int8"]
+# 'onnx-int8-static' also quantizes the activations, calibrated on sample pages
+YOLO_VARIANTS = ["onnx", "onnx-int8", "onnx-int8-static"]
+
+# name of the YOLO models in MODELS_DIR -> ultralytics task
+YOLO_MODELS = {
+    "detect_bubble": "detect",
+    "comic-text-segmenter": "segment",
+}
+
+# size the YOLO models are exported and calibrated at, ultralytics' default
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", 640))
+
+
+def variant_path(model_path: str, variant: str) -> str:
+    """
+    models/<name>.pt + 'frozen' -> models/<name>.frozen.pt, 'onnx' -> models/<name>.onnx,
+    'onnx-int8' -> models/<name>.int8.onnx, 'onnx-int8-static' -> models/<name>.int8-static.onnx
+    """
+    base = os.path.splitext(model_path)[0]
+    if variant == "frozen":
+        return f"{base}.frozen.pt"
+    suffix = variant.removeprefix("onnx").lstrip("-")
+    return f"{base}.{suffix}.onnx" if suffix else f"{base}.onnx"
+
+
+def _require(module: str, package: str):
+    """Import an optional dependency, with an error that says what to install"""
+    try:
+        return __import__(module, fromlist=["_"])
+    except ImportError as e:
+        raise RuntimeError(f"The ONNX model variants need '{package}', install it with: pip install {package}") from e
+
+
+def _onnx_session(path: str):
+    onnxruntime = _require("onnxruntime", "onnxruntime")
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class OnnxLamaModel:
+    """LaMa on ONNX Runtime, called like the TorchScript model: model(image, mask) -> output tensor"""
+    def __init__(self, path: str):
+        self.session = _onnx_session(path)
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def __call__(self, image: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+        outputs = self.session.run(None, dict(zip(self.input_names, (image.cpu().numpy(), mask.cpu().numpy()))))
+        return torch.from_numpy(outputs[0])
+
+
+def load_lama_model(model_path: str, device: str, model_md5: str, backend: str = LAMA_DEFAULT_BACKEND):
+    """
+    Load LaMa with the given backend, falling back to the fp32 TorchScript model
+    when the variant hasn't been exported
+
+    Args:
+        model_path (str): Path of the fp32 TorchScript model
+        device (str): Torch device
+        model_md5 (str): Expected md5 of the fp32 model
+        backend (str): 'torchscript' or one of LAMA_VARIANTS
+
+    Returns:
+        Callable model(image, mask) -> output tensor
+    """
+    if backend != LAMA_DEFAULT_BACKEND:
+        if backend not in LAMA_VARIANTS:
+            raise ValueError(f"Unknown LaMa backend '{backend}', expected {LAMA_DEFAULT_BACKEND} or one of {LAMA_VARIANTS}")
+        path = variant_path(model_path, backend)
+        if os.path.exists(path):
+            logger.info(f"Loading LaMa variant '{backend}' from: {path}")
+            if backend == "frozen":
+                return torch.jit.load(path, map_location=device).eval()
+            if device != "cpu":
+                logger.warning(f"LaMa backend '{backend}' runs on the CPU, ignoring device '{device}'")
+            return OnnxLamaModel(path)
+        logger.warning(f"LaMa variant '{backend}' not found at {path}, run export_models.py lama. Using fp32")
+    return load_jit_model(model_path, device, model_md5)
+
+
+def load_yolo_model(name: str, backend: str = YOLO_DEFAULT_BACKEND, models_dir: str = MODELS_DIR) -> YOLO:
+    """
+    Load one of the YOLO models with the given backend, falling back to the fp32
+    model (YAML + safetensors) when the variant hasn't been exported
+
+    Args:
+        name (str): Model name, a key of YOLO_MODELS
+        backend (str): 'torch' or one of YOLO_VARIANTS
+        models_dir (str): Directory of the weights
+
+    Returns:
+        ultralytics.YOLO: The model, called the same way whatever the backend
+    """
+    prefix = os.path.join(models_dir, name)
+    if backend != YOLO_DEFAULT_BACKEND:
+        if backend not in YOLO_VARIANTS:
+            raise ValueError(f"Unknown YOLO backend '{backend}', expected {YOLO_DEFAULT_BACKEND} or one of {YOLO_VARIANTS}")
+        path = variant_path(prefix + ".pt", backend)
+        if os.path.exists(path):
+            _require("onnxruntime", "onnxruntime")
+            logger.info(f"Loading {name} variant '{backend}' from: {path}")
+            return YOLO(path, task=YOLO_MODELS[name])
+        logger.warning(f"{name} variant '{backend}' not found at {path}, run export_models.py yolo. Using fp32")
+
+    model = YOLO(prefix + ".yaml")
+    model.model.load_state_dict(load_file(prefix + ".safetensors"))
+    return model
+
+
+# export
+
+def export_lama(model_path: str, variant: str, model_md5: str = None) -> str:
+    """
+    Write an optimized variant of the fp32 TorchScript LaMa model
+
+    Args:
+        model_path (str): Path of the fp32 TorchScript model
+        variant (str): One of LAMA_VARIANTS
+        model_md5 (str): Expected md5 of the fp32 model
+
+    Returns:
+        str: Path of the written variant
+    """
+    path = variant_path(model_path, variant)
+    if variant == "onnx-int8":
+        source = variant_path(model_path, "onnx")
+        if not os.path.exists(source):
+            export_lama(model_path, "onnx", model_md5)
+        quantize_onnx_dynamic(source, path)
+        return path
+
+    model = load_jit_model(model_path, "cpu", model_md5)
+    if variant == "frozen":
+        # freezing inlines the weights and attributes as constants, optimize_for_inference
+        # then folds conv/batchnorm and picks the CPU specific kernels
+        model = torch.jit.optimize_for_inference(torch.jit.freeze(model))
+        torch.jit.save(model, path)
+    elif variant == "onnx":
+        image = torch.rand(1, 3, 512, 512)
+        mask = torch.zeros(1, 1, 512, 512)
+        try:
+            torch.onnx.export(
+                model, (image, mask), path,
+                input_names=["image", "mask"],
+                output_names=["output"],
+                dynamic_axes={name: {0: "batch", 2: "height", 3: "width"} for name in ["image", "mask", "output"]},
+                opset_version=17,
+            )
+        except Exception as e:
+            # LaMa's fast Fourier convolutions need ONNX's DFT op, older exporters can't map them
+            raise RuntimeError(f"LaMa could not be exported to ONNX with torch {torch.__version__}: {e}") from e
+    else:
+        raise ValueError(f"Unknown LaMa variant '{variant}', expected one of {LAMA_VARIANTS}")
+    return path
+
+
+def export_yolo(name: str, variant: str, calibration_images: list = None, models_dir: str = MODELS_DIR) -> str:
+    """
+    Write an ONNX variant of one of the YOLO models
+
+    Args:
+        name (str): Model name, a key of YOLO_MODELS
+        variant (str): One of YOLO_VARIANTS
+        calibration_images (list): BGR pages, needed by 'onnx-int8-static'
+        models_dir (str): Directory of the weights
+
+    Returns:
+        str: Path of the written variant
+    """
+    prefix = os.path.join(models_dir, name)
+    path = variant_path(prefix + ".pt", variant)
+    source = variant_path(prefix + ".pt", "onnx")
+
+    if variant == "onnx":
+        _require("onnx", "onnx")
+        model = load_yolo_model(name, YOLO_DEFAULT_BACKEND, models_dir)
+        # dynamic axes, the worker runs batches of pages
+        exported = model.export(format="onnx", imgsz=YOLO_IMGSZ, dynamic=True, simplify=True, device="cpu")
+        if os.path.abspath(exported) != path:
+            shutil.move(exported, path)
+    elif variant == "onnx-int8":
+        if not os.path.exists(source):
+            export_yolo(name, "onnx", models_dir=models_dir)
+        quantize_onnx_dynamic(source, path)
+    elif variant == "onnx-int8-static":
+        if not calibration_images:
+            raise ValueError("Static quantization needs calibration pages")
+        if not os.path.exists(source):
+            export_yolo(name, "onnx", models_dir=models_dir)
+        quantize_onnx_static(source, path, calibration_images)
+    else:
+        raise ValueError(f"Unknown YOLO variant '{variant}', expected one of {YOLO_VARIANTS}")
+    return path
+
+
+def quantize_onnx_dynamic(source: str, path: str):
+    """int8 weights, activations quantized on the fly at inference"""
+    quantization = _require("onnxruntime.quantization", "onnxruntime")
+    quantization.quantize_dynamic(source, path, weight_type=quantization.QuantType.QUInt8)
+
+
+def yolo_input(image: np.ndarray, size: int = YOLO_IMGSZ) -> np.ndarray:
+    """BGR page -> letterboxed RGB float32 [1, 3, size, size] in [0, 1], the way ultralytics feeds the model"""
+    h, w = image.shape[:2]
+    ratio = size / max(h, w)
+    resized = cv2.resize(image, (round(w * ratio), round(h * ratio)), interpolation=cv2.INTER_LINEAR)
+    padded = np.full((size, size, 3), 114, dtype=np.uint8)
+    top = (size - resized.shape[0]) // 2
+    left = (size - resized.shape[1]) // 2
+    padded[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return np.ascontiguousarray(padded[:, :, ::-1].transpose(2, 0, 1))[None].astype(np.float32) / 255
+
+
+def quantize_onnx_static(source: str, path: str, calibration_images: list):
+    """int8 weights and activations, activation ranges calibrated on the given pages"""
+    onnx = _require("onnx", "onnx")
+    quantization = _require("onnxruntime.quantization", "onnxruntime")
+    input_name = onnx.load(source).graph.input[0].name
+
+    class PageReader(quantization.CalibrationDataReader):
+        def __init__(self):
+            self.pages = iter(calibration_images)
+
+        def get_next(self):
+            image = next(self.pages, None)
+            return None if image is None else {input_name: yolo_input(image)}
+
+    quantization.quantize_static(
+        source, path, PageReader(),
+        quant_format=quantization.QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=quantization.QuantType.QUInt8,
+        weight_type=quantization.QuantType.QInt8,
+    )
+
+
+# parity checks against fp32
+
+def lama_parity(reference, variant, images: list, masks: list, size: int = 512) -> dict:
+    """
+    Compare the inpainted pixels of a LaMa variant with the fp32 model
+
+    Args:
+        reference: fp32 model
+        variant: Model under test
+        images (list): BGR pages, downscaled to size before inference
+        masks (list): Text masks of the pages
+        size (int): Longer side the pages are run at
+
+    Returns:
+        dict: Mean and 99th percentile absolute difference of the masked pixels (0-255)
+    """
+    pool = LamaBufferPool()
+    diffs = []
+    for image, mask in zip(images, masks):
+        image = resize_max_size(image, size)
+        mask = resize_max_size(mask, size, interpolation=cv2.INTER_NEAREST)
+        h, w = image.shape[:2]
+        outputs = []
+        for model in (reference, variant):
+            image_tensor, mask_tensor = prepare_lama_batch(pool, [image], [mask], ceil_modulo(h, 8), ceil_modulo(w, 8))
+            with torch.inference_mode():
+                outputs.append(lama_output_to_bgr(model(image_tensor, mask_tensor), [(h, w)])[0])
+        masked = mask > 0
+        diffs.append(np.abs(outputs[0][masked].astype(np.int16) - outputs[1][masked].astype(np.int16)).ravel())
+    diffs = np.concatenate(diffs) if diffs else np.zeros(1)
+    return {
+        "mean_abs_diff": round(float(diffs.mean()), 3),
+        "p99_abs_diff": round(float(np.percentile(diffs, 99)), 3),
+    }
+
+
+def _box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU of every box of a [N, 4] with every box of b [M, 4], xyxy"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def union_mask(result, shape) -> np.ndarray:
+    """Merge the instance masks of a segmentation result into one boolean mask of the given shape"""
+    mask = np.zeros(shape[:2], dtype=bool)
+    if result.masks is not None:
+        for instance in result.masks.data.cpu().numpy():
+            mask |= cv2.resize(instance, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST) > 0.5
+    return mask
+
+
+def yolo_parity(reference: YOLO, variant: YOLO, task: str, images: list, conf_threshold: float = 0.25,
+                iou_threshold: float = 0.5) -> dict:
+    """
+    Compare the detections (boxes, and masks for segmentation) of a YOLO variant with the fp32 model
+
+    Args:
+        reference (YOLO): fp32 model
+        variant (YOLO): Model under test
+        task (str): 'detect' or 'segment'
+        images (list): BGR pages
+        conf_threshold (float): Detection confidence threshold
+        iou_threshold (float): IoU at which two boxes count as the same detection
+
+    Returns:
+        dict: Box recall/precision against fp32 and, for segmentation, the mean mask IoU
+    """
+    matched_reference = matched_variant = total_reference = total_variant = 0
+    mask_ious = []
+    for image in images:
+        expected = reference(image, conf=conf_threshold, device="cpu", verbose=False)[0]
+        actual = variant(image, conf=conf_threshold, device="cpu", verbose=False)[0]
+        expected_boxes = expected.boxes.xyxy.cpu().numpy()
+        actual_boxes = actual.boxes.xyxy.cpu().numpy()
+        total_reference += len(expected_boxes)
+        total_variant += len(actual_boxes)
+        if len(expected_boxes) and len(actual_boxes):
+            iou = _box_iou(expected_boxes, actual_boxes)
+            matched_reference += int((iou.max(axis=1) >= iou_threshold).sum())
+            matched_variant += int((iou.max(axis=0) >= iou_threshold).sum())
+        if task == "segment":
+            expected_mask = union_mask(expected, image.shape)
+            actual_mask = union_mask(actual, image.shape)
+            union = (expected_mask | actual_mask).sum()
+            mask_ious.append(1.0 if union == 0 else (expected_mask & actual_mask).sum() / union)
+
+    report = {
+        "boxes": total_reference,
+        "box_recall": round(matched_reference / total_reference, 4) if total_reference else 1.0,
+        "box_precision": round(matched_variant / total_variant, 4) if total_variant else 1.0,
+    }
+    if task == "segment":
+        report["mask_iou"] = round(float(np.mean(mask_ious)), 4) if mask_ious else 1.0
+    return report
@@ -0,0 +1,226 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from process.test import render_translation, build_result
+
+# stages run in this order, each one with its own bounded queue and worker pool
+STAGES = ["detect", "segment", "ocr", "translate", "inpaint", "render"]
+
+# these stages get a whole batch of pages per item so the YOLO models run once per batch,
+# the batch is split into single pages after the last of them
+BATCH_STAGES = ["detect", "segment"]
+
+# these stages are coroutines (network bound or awaiting their own executor),
+# the rest are blocking calls run in the stage's thread pool
+ASYNC_STAGES = ["ocr", "translate"]
+
+# the models are not thread safe, so every stage gets a single worker by default.
+# the win comes from overlapping different stages of different jobs, not from
+# running the same model twice at once. translate is network bound, so it can go wider.
+DEFAULT_STAGE_WORKERS = {
+    "detect": 1,
+    "segment": 1,
+    "ocr": 1,
+    "translate": 4,
+    "inpaint": 1,
+    "render": 1,
+}
+
+
+def load_pipeline_config() -> dict:
+    """
+    Read the pipeline settings from the environment
+
+    PIPELINE_QUEUE_DEPTH sets the size of every stage queue and
+    PIPELINE_<STAGE>_WORKERS (e.g. PIPELINE_TRANSLATE_WORKERS) sets the pool size of a stage.
+
+    Returns:
+        dict: {"queue_depth": int, "workers": {stage: int}}
+    """
+    workers = {
+        stage: int(os.getenv(f"PIPELINE_{stage.upper()}_WORKERS", default))
+        for stage, default in DEFAULT_STAGE_WORKERS.items()
+    }
+    return {
+        "queue_depth": int(os.getenv("PIPELINE_QUEUE_DEPTH", 2)),
+        "workers": workers,
+    }
+
+
+class StagePipeline:
+    """
+    Runs the translation steps as a chain of stages so several jobs are in flight at once.
+    While job N waits on the translator, job N+1 can already be in detection.
+    """
+    def __init__(self, text_extractor, translator, renderer, inpainter, on_complete, on_error=None,
+                 queue_depth=2, workers=None, inpaint_method="opencv", conf_threshold=0.25, stats=None):
+        """
+        Args:
+            text_extractor (MangaTextExtractor): Bubble detection, segmentation and OCR
+            translator (MangaTranslator): Translator
+            renderer (MangaTextRenderer): Text renderer
+            inpainter (Inpainter): Inpainter
+            on_complete (callable): Coroutine called with (job, result) once a job is done
+            on_error (callable): Optional coroutine called with (job, exception) when a job fails
+            queue_depth (int): Max number of items waiting in front of each stage (a batch of pages for detect/segment)
+            workers (dict): Pool size per stage, missing stages use DEFAULT_STAGE_WORKERS
+            inpaint_method (str): 'opencv', 'lama' or 'auto', used unless the job sets its own
+            conf_threshold (float): Confidence threshold for YOLO
+            stats (WorkerStats): Optional, gets the time every page spends in each stage
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.text_extractor = text_extractor
+        self.translator = translator
+        self.renderer = renderer
+        self.inpainter = inpainter
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.inpaint_method = inpaint_method
+        self.conf_threshold = conf_threshold
+        self.stats = stats
+
+        self.workers = dict(DEFAULT_STAGE_WORKERS)
+        self.workers.update(workers or {})
+
+        self.queues = {stage: asyncio.Queue(maxsize=queue_depth) for stage in STAGES}
+        self.executors = {
+            stage: ThreadPoolExecutor(max_workers=self.workers[stage], thread_name_prefix=f"pipeline-{stage}")
+            for stage in STAGES if stage != "translate"
+        }
+        self.handlers = {
+            "detect": self._detect,
+            "segment": self._segment,
+            "ocr": self._ocr,
+            "translate": self._translate,
+            "inpaint": self._inpaint,
+            "render": self._render,
+        }
+        self.tasks = []
+
+    def start(self):
+        """Spawn the worker coroutines of every stage"""
+        for stage in STAGES:
+            for _ in range(self.workers[stage]):
+                self.tasks.append(asyncio.create_task(self._stage_worker(stage)))
+        self.logger.info(f"Pipeline started with workers={self.workers}")
+
+    async def submit(self, job: dict, image):
+        """
+        Hand a decoded job to the first stage. Waits while the detect queue is full,
+        so the caller stops pulling jobs off Redis when the worker is saturated.
+
+        Args:
+            job (dict): Job payload from the queue
+            image (numpy.ndarray): Decoded BGR image
+        """
+        await self.submit_batch([(job, image)])
+
+    async def submit_batch(self, pages: list):
+        """
+        Hand several decoded jobs to the first stage as one batch
+
+        Args:
+            pages (list): List of (job, image) tuples
+        """
+        await self.queues[STAGES[0]].put([{"job": job, "image": image} for job, image in pages])
+
+    async def join(self):
+        """Wait until every submitted job has left the pipeline"""
+        for stage in STAGES:
+            await self.queues[stage].join()
+
+    async def stop(self):
+        """Cancel the stage workers and shut the thread pools down"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+
+    async def _stage_worker(self, stage: str):
+        queue = self.queues[stage]
+        handler = self.handlers[stage]
+        while True:
+            item = await queue.get()
+            try:
+                started = time.perf_counter()
+                if stage in ASYNC_STAGES:
+                    await handler(item)
+                else:
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(self.executors[stage], handler, item)
+                if self.stats is not None:
+                    pages = len(item) if isinstance(item, list) else 1
+                    self.stats.record_stage(stage, (time.perf_counter() - started) / max(pages, 1))
+
+                next_stage = self._next_stage(stage)
+                if stage in BATCH_STAGES and next_stage in BATCH_STAGES:
+                    await self.queues[next_stage].put(item)
+                elif stage in BATCH_STAGES:
+                    for ctx in item:
+                        await self._forward(ctx, next_stage)
+                else:
+                    await self._forward(item, next_stage)
+            except Exception as e:
+                ctxs = item if isinstance(item, list) else [item]
+                job_ids = [ctx["job"].get("job_id") for ctx in ctxs]
+                self.logger.error(f"ERROR in stage '{stage}' for job(s) {job_ids}: {e}", exc_info=True)
+                if self.on_error:
+                    for ctx in ctxs:
+                        await self.on_error(ctx["job"], e)
+            finally:
+                queue.task_done()
+
+    async def _forward(self, ctx: dict, next_stage: str):
+        next_stage = ctx.pop("next_stage", None) or next_stage
+        if next_stage is None:
+            await self.on_complete(ctx["job"], ctx["result"])
+        else:
+            await self.queues[next_stage].put(ctx)
+
+    def _next_stage(self, stage: str):
+        index = STAGES.index(stage) + 1
+        return STAGES[index] if index < len(STAGES) else None
+
+    def _detect(self, ctxs):
+        images = [ctx["image"] for ctx in ctxs]
+        batch_bubbles = self.text_extractor.detect_bubbles_batch(images, self.conf_threshold)
+        for ctx, bubbles in zip(ctxs, batch_bubbles):
+            ctx["bubbles"] = bubbles
+            # nothing to translate, send the page straight to the end
+            if not bubbles:
+                ctx["next_stage"] = "render"
+
+    def _segment(self, ctxs):
+        ctxs = [ctx for ctx in ctxs if ctx["bubbles"]]
+        masks = self.text_extractor.segment_text_batch([ctx["image"] for ctx in ctxs])
+        for ctx, text_mask in zip(ctxs, masks):
+            ctx["text_mask"] = text_mask
+
+    async def _ocr(self, ctx):
+        job = ctx["job"]
+        # MangaOcr still runs in the ocr pool, Gemini OCR requests don't hold a thread
+        ctx["text_data"] = await self.text_extractor.extract_text_async(
+            ctx["image"], ctx["bubbles"], source_lang=job["source_lang"], executor=self.executors["ocr"]
+        )
+
+    async def _translate(self, ctx):
+        job = ctx["job"]
+        ctx["translated_data"] = await self.translator.translate(
+            ctx["text_data"], job["source_lang"], job["target_lang"], manga_title=job.get("manga_title")
+        )
+
+    def _inpaint(self, ctx):
+        method = ctx["job"].get("inpaint_method") or self.inpaint_method
+        ctx["inpainted_image"] = self.inpainter.inpaint(ctx["image"], ctx["text_mask"], method=method)
+
+    def _render(self, ctx):
+        if not ctx["bubbles"]:
+            ctx["result"] = build_result(ctx["image"], [], [], [])
+            return
+        result_image = render_translation(ctx["inpainted_image"], ctx["translated_data"], self.renderer)
+        ctx["result"] = build_result(result_image, ctx["bubbles"], ctx["text_data"], ctx["translated_data"])
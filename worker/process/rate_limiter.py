@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import logging
+
+# requests/s and burst size per translation provider, overridable with
+# TRANSLATE_RATE_<PROVIDER> / TRANSLATE_BURST_<PROVIDER> (e.g. TRANSLATE_RATE_GENAI=4)
+DEFAULT_RATES = {
+    "google": (5.0, 5),
+    "genai": (2.0, 4),
+}
+
+# atomic token bucket shared by every worker. uses the redis clock so workers on
+# different hosts agree on the refill, returns how long the caller has to wait (0 = go)
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket for coroutines. acquire() waits with asyncio.sleep, so
+    throttled calls don't block the event loop like time.sleep does.
+    """
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate (float): Tokens added per second
+            burst (int): Bucket size, the number of calls allowed back to back
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a call is allowed"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RedisTokenBucket:
+    """Token bucket kept in Redis so the quota is shared by all workers"""
+    def __init__(self, redis_client, key: str, rate: float, burst: int):
+        """
+        Args:
+            redis_client (redis.Redis): Redis client
+            key (str): Redis key of the bucket
+            rate (float): Tokens added per second
+            burst (int): Bucket size
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.redis_client = redis_client
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        # fallback if redis is unreachable, so translation keeps going at the local quota
+        self.local = AsyncTokenBucket(rate, burst)
+
+    async def acquire(self):
+        """Wait until a call is allowed"""
+        while True:
+            try:
+                wait = float(await asyncio.to_thread(self.script, keys=[self.key], args=[self.rate, self.burst]))
+            except Exception as e:
+                self.logger.warning(f"Shared rate limiter unavailable, using local limit: {e}")
+                await self.local.acquire()
+                return
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+def build_rate_limiters(redis_client=None) -> dict:
+    """
+    Create one limiter per translation provider from the environment
+
+    With TRANSLATE_RATE_SHARED=1 and a redis client, the quota is shared by all workers.
+
+    Returns:
+        dict: provider -> limiter
+    """
+    shared = redis_client is not None and os.getenv("TRANSLATE_RATE_SHARED", "0") == "1"
+    limiters = {}
+    for provider, (rate, burst) in DEFAULT_RATES.items():
+        rate = float(os.getenv(f"TRANSLATE_RATE_{provider.upper()}", rate))
+        burst = int(os.getenv(f"TRANSLATE_BURST_{provider.upper()}", burst))
+        if shared:
+            limiters[provider] = RedisTokenBucket(redis_client, f"rate_limit:{provider}", rate, burst)
+        else:
+            limiters[provider] = AsyncTokenBucket(rate, burst)
+    return limiters
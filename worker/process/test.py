@@ -1,7 +1,7 @@
 import argparse
 import os
+import time
 import json
-import asyncio
 import cv2
 import base64
 import numpy as np
@@ -31,7 +31,12 @@ async def process_image(
     target_lang="en",
     conf_threshold=0.25,
     debug=False,
-    font_path="fonts/Anime.otf"
+    font_path="fonts/Anime.otf",
+    bubbles=None,
+    text_mask=None,
+    manga_title=None,
+    timings=None,
+    inpaint_method="opencv"
 ) -> dict:
     """
     Process a complete manga image using modular components:
@@ -49,39 +54,149 @@ async def process_image(
         conf_threshold (float): Confidence threshold for YOLO
         debug (bool): Whether to show debug visualizations
         font_path (str): Path to custom font file
+        bubbles (list): Bubbles already detected by a batched call, detected here if None
+        text_mask (numpy.ndarray): Text mask already segmented by a batched call, segmented here if None
+        manga_title (str): Title of the manga, used as translation context
+        timings (dict): If given, filled with the seconds spent per stage (detect, segment, ocr, ...)
+        inpaint_method (str): 'opencv', 'lama' or 'auto'
         
     Returns:
         dict: Results summary
     """
     # Read original image
     original_image = image
+    if timings is None:
+        timings = {}
+    started = time.perf_counter()
 
-    # Step 1: Detect speech bubbles
-    bubbles, _ = text_extractor.detect_bubbles(image, conf_threshold) # change to use image
+    def lap(stage):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] = timings.get(stage, 0.0) + now - started
+        started = now
+
+    # Step 1: Detect speech bubbles, segmenting the text at the same time
+    if bubbles is None and text_mask is None:
+        bubbles, text_mask = text_extractor.detect_and_segment(original_image, conf_threshold)
+        lap("detect")
+    elif bubbles is None:
+        bubbles, _ = text_extractor.detect_bubbles(image, conf_threshold) # change to use image
+        lap("detect")
     
     # Skip processing if no bubbles found
     if not bubbles:
-         return {
-        "status": "success",
-        "bubbles_count": len(bubbles),
-        "text_extracted": sum(1 for item in text_data if item["text"]),
-        "image_bytes": image.tobytes(),
-        "translated_data": translated_data
-        }
+        result = build_result(original_image, bubbles, [], [])
+        lap("render")
+        return result
 
     # Step 2: Generate text mask using text segmentation
-    text_mask = text_extractor.segment_text(original_image)
+    if text_mask is None:
+        text_mask = text_extractor.segment_text(original_image)
+        lap("segment")
 
     # Step 3: Extract text from bubbles
-    text_data = text_extractor.extract_text(original_image, bubbles, source_lang=source_lang)
+    text_data = await text_extractor.extract_text_async(original_image, bubbles, source_lang=source_lang)
+    lap("ocr")
     
     # Step 4: Translate text
-    translated_data = await translator.translate(text_data, source_lang, target_lang, manga_title=None)
+    translated_data = await translator.translate(text_data, source_lang, target_lang, manga_title=manga_title)
+    lap("translate")
     
     # Step 5: Create inpainted image (text removed)
-    inpainted_image = inpainter.inpaint(original_image, text_mask, method="opencv")
+    inpainted_image = inpainter.inpaint(original_image, text_mask, method=inpaint_method)
+    lap("inpaint")
     
     # Step 6: Add translated text to inpainted image
+    result_image = render_translation(inpainted_image, translated_data, renderer)
+    result = build_result(result_image, bubbles, text_data, translated_data)
+    lap("render")
+    return result
+
+
+async def process_pages(
+    images: list,
+    text_extractor,
+    translator,
+    renderer,
+    inpainter,
+    source_lang="ja",
+    target_lang="en",
+    conf_threshold=0.25,
+    batch_bubbles=None,
+    batch_masks=None,
+    manga_title=None,
+    timings=None,
+    inpaint_method="opencv"
+) -> list:
+    """
+    Process several pages of one chapter together. Same steps as process_image, but the
+    pages share the OCR batches, the translation requests (one Gemini request for the
+    chapter in page mode) and the LaMa crop buckets.
+    
+    Args:
+        images (list): BGR pages in reading order
+        source_lang (str): Source language code
+        target_lang (str): Target language code
+        conf_threshold (float): Confidence threshold for YOLO
+        batch_bubbles (list): Bubbles of every page already detected by a batched call, detected here if None
+        batch_masks (list): Text masks of every page, segmented together with the bubbles if None
+        manga_title (str): Title of the manga, used as translation context
+        timings (dict): If given, filled with the seconds spent per stage for all pages together
+        inpaint_method (str): 'opencv', 'lama' or 'auto'
+        
+    Returns:
+        list: Results summary of every page, in input order
+    """
+    if timings is None:
+        timings = {}
+    started = time.perf_counter()
+
+    def lap(stage):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] = timings.get(stage, 0.0) + now - started
+        started = now
+
+    if batch_bubbles is None:
+        batch_bubbles, batch_masks = text_extractor.detect_and_segment_batch(images, conf_threshold)
+        lap("detect")
+
+    # MangaOcr runs in a thread, Gemini OCR requests go out concurrently
+    text_pages = await text_extractor.extract_text_batch_async(images, batch_bubbles, source_lang)
+    lap("ocr")
+
+    translated_pages = await translator.translate_pages(text_pages, source_lang, target_lang, manga_title=manga_title)
+    lap("translate")
+
+    # pages without bubbles are passed through untouched
+    with_text = [i for i, bubbles in enumerate(batch_bubbles) if bubbles]
+    inpainted = inpainter.inpaint_batch([images[i] for i in with_text], [batch_masks[i] for i in with_text], method=inpaint_method)
+    inpainted = dict(zip(with_text, inpainted))
+    lap("inpaint")
+
+    results = []
+    for i, image in enumerate(images):
+        if i not in inpainted:
+            results.append(build_result(image, [], [], []))
+            continue
+        result_image = render_translation(inpainted[i], translated_pages[i], renderer)
+        results.append(build_result(result_image, batch_bubbles[i], text_pages[i], translated_pages[i]))
+    lap("render")
+    return results
+
+
+def render_translation(inpainted_image: np.ndarray, translated_data: list, renderer) -> np.ndarray:
+    """
+    Render the translated text onto the inpainted (text-free) image
+
+    Args:
+        inpainted_image (numpy.ndarray): BGR image with the original text removed
+        translated_data (list): Bubble dicts with "bbox" and "translated_text"
+        renderer (MangaTextRenderer): Renderer used to draw the text
+
+    Returns:
+        numpy.ndarray: BGR image with the translated text drawn in
+    """
     # Convert to PIL for text rendering
     pil_image = Image.fromarray(cv2.cvtColor(inpainted_image, cv2.COLOR_BGR2RGB))
     
@@ -95,16 +210,30 @@ async def process_image(
     result_pil = renderer.render_text_in_bubbles(pil_image, bubbles_with_text, auto_style=True)
     
     # Convert back to OpenCV format
-    result_image = cv2.cvtColor(np.array(result_pil), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(np.array(result_pil), cv2.COLOR_RGB2BGR)
+
+
+def build_result(result_image: np.ndarray, bubbles: list, text_data: list, translated_data: list) -> dict:
+    """
+    Encode the final image and package the job result stored in Redis.
+    image_bytes holds the raw PNG, the worker stores it as a binary key.
+
+    Args:
+        result_image (numpy.ndarray): Final BGR image
+        bubbles (list): Detected bubble bounding boxes
+        text_data (list): OCR results per bubble
+        translated_data (list): Translation results per bubble
+
+    Returns:
+        dict: Results summary
+    """
     _, img_encoded = cv2.imencode('.png', result_image)
     img_bytes = img_encoded.tobytes()
 
-    encoded_image_str = base64.b64encode(img_bytes).decode('utf-8')
-
     return {
         "status": "success",
         "bubbles_count": len(bubbles),
         "text_extracted": sum(1 for item in text_data if item["text"]),
-        "image_bytes": encoded_image_str,
+        "image_bytes": img_bytes,
         "translated_data": translated_data
     }
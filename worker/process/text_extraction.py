@@ -13,7 +13,6 @@ from loguru import logger
 
 import numpy as np
 import torch
-from safetensors.torch import load_file
 from skimage.morphology import binary_dilation, square
 
 import cv2
@@ -24,43 +23,62 @@ from googletrans import Translator
 # monkey patch for manga_ocr
 os.environ["MPS_DISABLED"] = "1"   # disable mps entirely
 from manga_ocr import MangaOcr
-from ultralytics import YOLO
+from manga_ocr.ocr import post_process
 
-from google import genai
 from google.genai import types
 
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+from .genai_client import genai_client
+from .model_variants import load_yolo_model, YOLO_DEFAULT_BACKEND
+
+
+# torch's intra-op thread count, set once for the whole process. 0 keeps torch's default (one per core)
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0))
+# run bubble detection and text segmentation side by side. off until benchmarks/detect_segment.py
+# shows a win on the worker hosts, with it on set TORCH_NUM_THREADS to about half of the cores
+YOLO_CONCURRENT = os.getenv("YOLO_CONCURRENT", "0") == "1"
+
+
+def configure_torch_threads(num_threads: int = TORCH_NUM_THREADS) -> int:
+    """
+    Set torch's intra-op thread count for the process. Call it once at startup,
+    before any model runs, never from the threads running the models.
+
+    Args:
+        num_threads (int): Threads per op, 0 keeps torch's default
+
+    Returns:
+        int: The thread count now in use
+    """
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    return torch.get_num_threads()
 
 
 class MangaTextExtractor:
-    def __init__(self, translator_method="google",  mask_dilation_radius=3):
+    def __init__(self, translator_method="google",  mask_dilation_radius=3, concurrent=YOLO_CONCURRENT):
         """
         Initialize the manga translator
         
         Args:
             translator_method (str): Translation method ('google' or 'deepl')
             mask_dilation_radius (int): Radius for mask dilation
+            concurrent (bool): Run bubble detection and text segmentation side by side
         """
         self.logger = logging.getLogger(self.__class__.__name__)
         # self.logger.setLevel(logging.DEBUG)
         script_dir = os.path.dirname(os.path.abspath(__file__))
         models_dir = os.path.join(script_dir, "..", "models")
 
+        # 'torch' (fp32) or an exported ONNX variant, see process/model_variants.py
+        self.yolo_backend = os.getenv("YOLO_BACKEND", YOLO_DEFAULT_BACKEND)
+
         # bubble detection
         try:
             self.logger.info("Loading bubble detection model")
-            bubble_prefix = os.path.join(models_dir, "detect_bubble")
-            bubble_yaml = bubble_prefix + ".yaml"
-            bubble_weights = bubble_prefix + ".safetensors"
-
-            # init YOLO model from YAML
-            self.bubble_detection_model = YOLO(bubble_yaml)
-
-            # load safetensors weights
-            bubble_state = load_file(bubble_weights)
-            self.bubble_detection_model.model.load_state_dict(bubble_state)
+            self.bubble_detection_model = load_yolo_model("detect_bubble", self.yolo_backend, models_dir)
         except Exception as e:
             self.logger.warning(f"Failed to load bubble detection model: {e}")
             self.bubble_detection_model = None
@@ -68,14 +86,7 @@ class MangaTextExtractor:
         # text segmenter
         try:
             self.logger.info("Loading text segmenter model")
-            seg_prefix = os.path.join(models_dir, "comic-text-segmenter")
-            seg_yaml = seg_prefix + ".yaml"
-            seg_weights = seg_prefix + ".safetensors"
-
-            self.segmenter = YOLO(seg_yaml)
-
-            seg_state = load_file(seg_weights)
-            self.segmenter.model.load_state_dict(seg_state)
+            self.segmenter = load_yolo_model("comic-text-segmenter", self.yolo_backend, models_dir)
         except Exception as e:
             self.logger.warning(f"Failed to load text segmenter model: {e}")
             self.segmenter = None
@@ -85,21 +96,18 @@ class MangaTextExtractor:
         logging.getLogger("transformers").setLevel(logging.ERROR)
         logger.remove() # loguru logger, not to be confused with self.logger - from logging module
         self.mocr = MangaOcr()
+        # max number of bubble crops per batched MangaOcr generate call
+        self.ocr_batch_size = int(os.getenv("OCR_BATCH_SIZE", 16))
         with open("utils/languages.json", "r") as f:
             self.languages = json.load(f)
 
+        # bubble detection and text segmentation only read the image, so they can run side by side.
+        # torch's thread count is process wide, it is split once at startup by configure_torch_threads
+        self.model_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="yolo") if concurrent else None
+
         
-    def google_ocr(self, image: Image, source_lang: str = "ja") -> str:
-        """
-        Perform OCR using Google Translate API
-        
-        Args:
-            image (PIL.Image): Image to perform OCR on
-            source_lang (str): Source language code
-            
-        Returns:
-            str: Extracted text
-        """
+    def _google_ocr_contents(self, image: Image, source_lang: str = "ja") -> list:
+        """Build the Gemini OCR request for one crop"""
         prompt = f"""
             Please extract the {self.languages.get(source_lang, source_lang)} text from the following image.
             Return only the extracted text without any additional comments or formatting.
@@ -112,16 +120,31 @@ class MangaTextExtractor:
         image.save(image_bytes, format="PNG")
         image_bytes.seek(0)
         
+        return [
+            types.Part.from_bytes(
+                data=image_bytes.getvalue(),
+                mime_type="image/png"
+            ),
+            prompt,
+        ]
+
+    def google_ocr(self, image: Image, source_lang: str = "ja") -> str:
+        """
+        Perform OCR using Google Translate API
+        
+        Blocking, prefer google_ocr_async from coroutines.
+        
+        Args:
+            image (PIL.Image): Image to perform OCR on
+            source_lang (str): Source language code
+            
+        Returns:
+            str: Extracted text
+        """
         try:
-            response = client.models.generate_content(
+            response = genai_client.client.models.generate_content(
                 model="gemini-2.0-flash",
-                contents=[
-                    types.Part.from_bytes(
-                        data=image_bytes.getvalue(),
-                        mime_type="image/png"
-                    ),
-                    prompt,
-                ]
+                contents=self._google_ocr_contents(image, source_lang)
             )
             extracted_text = response.text
         except Exception as e:
@@ -130,6 +153,29 @@ class MangaTextExtractor:
         
         return extracted_text
 
+    async def google_ocr_async(self, image: Image, source_lang: str = "ja") -> str:
+        """
+        Perform OCR using Gemini through the shared async client
+        
+        Args:
+            image (PIL.Image): Image to perform OCR on
+            source_lang (str): Source language code
+            
+        Returns:
+            str: Extracted text
+        """
+        try:
+            response = await genai_client.generate_content(
+                model="gemini-2.0-flash",
+                contents=self._google_ocr_contents(image, source_lang)
+            )
+            extracted_text = response.text or ""
+        except Exception as e:
+            self.logger.error(f"Translation error: {e}")
+            extracted_text = ""
+        
+        return extracted_text
+
     def detect_bubbles(self, image: np.ndarray, conf_threshold=0.75):
         """
         Detect speech bubbles in the image
@@ -150,66 +196,100 @@ class MangaTextExtractor:
         if self.bubble_detection_model:
 
             results = self.bubble_detection_model(image, conf=conf_threshold, device="cpu")[0]
-            
-            # Process detections
-            bubbles = []
-            for box in results.boxes:
-                # Extract coordinates
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                
-                # Convert to x, y, w, h format
-                x = int(x1)
-                y = int(y1)
-                w = int(x2 - x1)
-                h = int(y2 - y1)
-                
-                bubbles.append([x, y, w, h])
+            bubbles = self._bubbles_from_result(results)
 
         # fallback method, but won't work well
         else:
-            # Fallback to basic contour detection
-            self.logger.debug("Using fallback contour detection method")
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Apply Gaussian blur to reduce noise
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            
-            # Apply binary threshold
-            _, binary = cv2.threshold(blurred, 220, 255, cv2.THRESH_BINARY)
+            bubbles = self._detect_bubbles_contours(image)
+        
+        logger.debug(f"Detected {len(bubbles)} speech bubbles")
+        return bubbles, image
+
+    def _bubbles_from_result(self, result) -> list:
+        """Convert one YOLO detection result to bubble bounding boxes [x, y, w, h]"""
+        bubbles = []
+        for box in result.boxes:
+            # Extract coordinates
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
             
-            # Invert binary image (so speech bubbles are white)
-            binary_inv = cv2.bitwise_not(binary)
+            # Convert to x, y, w, h format
+            x = int(x1)
+            y = int(y1)
+            w = int(x2 - x1)
+            h = int(y2 - y1)
             
-            # Dilate to close gaps in bubble boundaries
-            kernel = np.ones((3, 3), np.uint8)
-            dilated = cv2.dilate(binary_inv, kernel, iterations=2)
+            bubbles.append([x, y, w, h])
+        return bubbles
+
+    def _detect_bubbles_contours(self, image: np.ndarray) -> list:
+        """Fallback bubble detection from contours, used when the YOLO model is missing"""
+        # Fallback to basic contour detection
+        self.logger.debug("Using fallback contour detection method")
+        
+        # Convert to grayscale
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        # Apply Gaussian blur to reduce noise
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        
+        # Apply binary threshold
+        _, binary = cv2.threshold(blurred, 220, 255, cv2.THRESH_BINARY)
+        
+        # Invert binary image (so speech bubbles are white)
+        binary_inv = cv2.bitwise_not(binary)
+        
+        # Dilate to close gaps in bubble boundaries
+        kernel = np.ones((3, 3), np.uint8)
+        dilated = cv2.dilate(binary_inv, kernel, iterations=2)
+        
+        # Find contours
+        contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        # Filter contours by area and shape
+        bubbles = []
+        min_area = 1000  # Minimum area to be considered a speech bubble
+        
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area < min_area:
+                continue
             
-            # Find contours
-            contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            # Get bounding rectangle
+            x, y, w, h = cv2.boundingRect(contour)
             
-            # Filter contours by area and shape
-            bubbles = []
-            min_area = 1000  # Minimum area to be considered a speech bubble
+            # Check aspect ratio (not too narrow)
+            aspect_ratio = w / h
+            if aspect_ratio < 0.2 or aspect_ratio > 5:
+                continue
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area < min_area:
-                    continue
-                
-                # Get bounding rectangle
-                x, y, w, h = cv2.boundingRect(contour)
-                
-                # Check aspect ratio (not too narrow)
-                aspect_ratio = w / h
-                if aspect_ratio < 0.2 or aspect_ratio > 5:
-                    continue
-                
-                bubbles.append([x, y, w, h])
+            bubbles.append([x, y, w, h])
         
-        logger.debug(f"Detected {len(bubbles)} speech bubbles")
-        return bubbles, image
+        return bubbles
+
+    def detect_bubbles_batch(self, images: list, conf_threshold=0.75) -> list:
+        """
+        Detect speech bubbles in several images with a single YOLO call
+        
+        Args:
+            images (list): List of numpy.ndarray images
+            conf_threshold (float): Confidence threshold for YOLO detections
+            
+        Returns:
+            list: One list of bubble bounding boxes [x, y, w, h] per image, in input order
+        """
+        if not images:
+            return []
+        if any(image is None for image in images):
+            raise ValueError(f"Could not read image")
+
+        if not self.bubble_detection_model:
+            return [self._detect_bubbles_contours(image) for image in images]
+
+        # a list source is letterboxed and stacked into one tensor batch by ultralytics
+        results = self.bubble_detection_model(images, conf=conf_threshold, device="cpu", batch=len(images))
+        batch_bubbles = [self._bubbles_from_result(result) for result in results]
+        logger.debug(f"Detected {sum(len(b) for b in batch_bubbles)} speech bubbles in {len(images)} images")
+        return batch_bubbles
 
     def segment_text(self, image: np.ndarray) -> np.ndarray: 
         """
@@ -222,9 +302,31 @@ class MangaTextExtractor:
             numpy.ndarray: Binary mask of text areas
         """
         results = self.segmenter(image, device="cpu")
-        mask = results[0].masks.data.cpu().numpy()  # shape: (N, H_mask, W_mask)
+        return self._mask_from_result(results[0], image)
+
+    def segment_text_batch(self, images: list) -> list:
+        """
+        Segment text areas in several images with a single YOLO call
+        
+        Args:
+            images (list): List of numpy.ndarray images
+            
+        Returns:
+            list: One binary mask of text areas per image, in input order
+        """
+        if not images:
+            return []
+        results = self.segmenter(images, device="cpu", batch=len(images))
+        return [self._mask_from_result(result, image) for result, image in zip(results, images)]
 
+    def _mask_from_result(self, result, image: np.ndarray) -> np.ndarray:
+        """Merge the instance masks of one segmentation result into a binary mask the size of image"""
         binary_mask = np.zeros_like(image[:, :, 0], dtype=np.uint8)
+        # no text found on this page
+        if result.masks is None:
+            return binary_mask
+        mask = result.masks.data.cpu().numpy()  # shape: (N, H_mask, W_mask)
+
         H, W = binary_mask.shape
 
         for m in mask:
@@ -234,24 +336,84 @@ class MangaTextExtractor:
 
         return binary_mask
     
-    def extract_text(self, image: np.ndarray, bubbles: list, source_lang: str = "ja" ) -> list:
+    def detect_and_segment(self, image: np.ndarray, conf_threshold=0.75):
         """
-        Extract text from speech bubbles using OCR
+        Run bubble detection and text segmentation on one image, concurrently if enabled
         
         Args:
             image (numpy.ndarray): The original image
-            bubbles (list): List of bubble bounding boxes [x, y, w, h]
+            conf_threshold (float): Confidence threshold for YOLO detections
             
         Returns:
-            list: List of dictionaries with bubble info and extracted text
+            list: List of detected bubble bounding boxes [x, y, w, h]
+            numpy.ndarray: Binary mask of text areas
         """
-        text_results = []
+        if self.model_pool is None:
+            bubbles, _ = self.detect_bubbles(image, conf_threshold)
+            return bubbles, self.segment_text(image)
+        bubbles_future = self.model_pool.submit(self.detect_bubbles, image, conf_threshold)
+        mask_future = self.model_pool.submit(self.segment_text, image)
+        bubbles, _ = bubbles_future.result()
+        return bubbles, mask_future.result()
+
+    def detect_and_segment_batch(self, images: list, conf_threshold=0.75):
+        """
+        Batched version of detect_and_segment
+        
+        Args:
+            images (list): List of numpy.ndarray images
+            conf_threshold (float): Confidence threshold for YOLO detections
+            
+        Returns:
+            list: One list of bubble bounding boxes per image
+            list: One binary mask of text areas per image
+        """
+        if self.model_pool is None:
+            return self.detect_bubbles_batch(images, conf_threshold), self.segment_text_batch(images)
+        bubbles_future = self.model_pool.submit(self.detect_bubbles_batch, images, conf_threshold)
+        masks_future = self.model_pool.submit(self.segment_text_batch, images)
+        return bubbles_future.result(), masks_future.result()
+
+    def mocr_batch(self, images: list) -> list:
+        """
+        Run MangaOcr on several crops with batched generate calls
+        
+        The ViT processor resizes every crop to the same input size, so the
+        preprocessed crops can be stacked into one tensor as they are.
+        
+        Args:
+            images (list): List of PIL.Image crops
+            
+        Returns:
+            list: Extracted text per crop, in input order
+        """
+        texts = []
+        for start in range(0, len(images), self.ocr_batch_size):
+            chunk = images[start:start + self.ocr_batch_size]
+            # same conversion MangaOcr.__call__ does before preprocessing
+            pixel_values = torch.stack([
+                self.mocr._preprocess(img.convert("L").convert("RGB")) for img in chunk
+            ])
+            with torch.no_grad():
+                generated = self.mocr.model.generate(pixel_values.to(self.mocr.model.device), max_length=300)
+            decoded = self.mocr.tokenizer.batch_decode(generated.cpu(), skip_special_tokens=True)
+            texts.extend(post_process(text) for text in decoded)
+        return texts
+
+    def _prepare_crops(self, image: np.ndarray, bubbles: list) -> list:
+        """
+        Crop and preprocess every valid bubble of an image for OCR
+        
+        Returns:
+            list: (bubble index, bbox, PIL.Image) tuples
+        """
+        crops = []
+        img_h, img_w = image.shape[:2]
         
         # Process each bubble
         for i, (x, y, w, h) in enumerate(bubbles):
             # Extract ROI (Region of Interest)
             # Ensure coordinates are within image bounds
-            img_h, img_w = image.shape[:2]
             x1 = max(0, x)
             y1 = max(0, y)
             x2 = min(img_w, x + w)
@@ -273,28 +435,163 @@ class MangaTextExtractor:
             # Apply slight blur to reduce noise
             processed_roi = cv2.GaussianBlur(binary_roi, (3, 3), 0)
             
-            # Perform OCR using MangaOcr
+            crops.append((i, [x, y, w, h], Image.fromarray(processed_roi)))
+        
+        return crops
+
+    def _ocr_crops(self, crops: list, source_lang: str = "ja") -> list:
+        """
+        OCR the preprocessed crops, batched for MangaOcr
+        
+        Returns:
+            list: Cleaned up text per crop, in input order
+        """
+        images = [img for _, _, img in crops]
+        
+        if source_lang == "ja" and images:
             try:
-                img = Image.fromarray(processed_roi)
-                if source_lang == "ja":
-                    text = self.mocr(img)
-                else:
-                    # for non-japanese languages use a different ocr model (gemini right now)
-                    text = self.google_ocr(img, source_lang)
-                # Clean up the text (remove extra whitespace and newlines)
-                text = ' '.join(text.strip().split())
+                raw_texts = self.mocr_batch(images)
             except Exception as e:
-                self.logger.warning(f"OCR error for bubble {i+1}: {e}")
-                text = ""
+                # a bad crop shouldn't take the whole page down, retry one by one
+                self.logger.warning(f"Batched OCR failed, falling back to per-bubble OCR: {e}")
+                raw_texts = []
+                for (i, _, img) in crops:
+                    try:
+                        raw_texts.append(self.mocr(img))
+                    except Exception as e:
+                        self.logger.warning(f"OCR error for bubble {i+1}: {e}")
+                        raw_texts.append("")
+        else:
+            # for non-japanese languages use a different ocr model (gemini right now)
+            raw_texts = []
+            for (i, _, img) in crops:
+                try:
+                    raw_texts.append(self.google_ocr(img, source_lang))
+                except Exception as e:
+                    self.logger.warning(f"OCR error for bubble {i+1}: {e}")
+                    raw_texts.append("")
+        
+        # Clean up the text (remove extra whitespace and newlines)
+        return [' '.join(text.strip().split()) for text in raw_texts]
 
+    def _build_text_results(self, crops: list, texts: list) -> list:
+        text_results = []
+        for (i, bbox, _), text in zip(crops, texts):
             # Add to results
             text_results.append({
                 "bubble_id": i + 1,
-                "bbox": [x, y, w, h],
+                "bbox": bbox,
                 "text": text
             })
             
             self.logger.debug(f"Bubble {i+1}: '{text}'")
-        
         return text_results
- 
\ No newline at end of file
+
+    def extract_text(self, image: np.ndarray, bubbles: list, source_lang: str = "ja" ) -> list:
+        """
+        Extract text from speech bubbles using OCR
+        
+        Args:
+            image (numpy.ndarray): The original image
+            bubbles (list): List of bubble bounding boxes [x, y, w, h]
+            
+        Returns:
+            list: List of dictionaries with bubble info and extracted text
+        """
+        crops = self._prepare_crops(image, bubbles)
+        texts = self._ocr_crops(crops, source_lang)
+        return self._build_text_results(crops, texts)
+
+    async def extract_text_async(self, image: np.ndarray, bubbles: list, source_lang: str = "ja", executor=None) -> list:
+        """
+        Coroutine version of extract_text that doesn't block the event loop
+        
+        MangaOcr runs in executor (the default one if None), Gemini OCR requests
+        for the other languages go out concurrently on the async client.
+        
+        Args:
+            image (numpy.ndarray): The original image
+            bubbles (list): List of bubble bounding boxes [x, y, w, h]
+            source_lang (str): Source language code
+            executor (concurrent.futures.Executor): Where the cpu bound work runs
+            
+        Returns:
+            list: List of dictionaries with bubble info and extracted text
+        """
+        loop = asyncio.get_running_loop()
+        crops = await loop.run_in_executor(executor, self._prepare_crops, image, bubbles)
+        
+        if source_lang == "ja":
+            texts = await loop.run_in_executor(executor, self._ocr_crops, crops, source_lang)
+        else:
+            raw_texts = await asyncio.gather(*[
+                self.google_ocr_async(img, source_lang) for _, _, img in crops
+            ])
+            # Clean up the text (remove extra whitespace and newlines)
+            texts = [' '.join(text.strip().split()) for text in raw_texts]
+        
+        return self._build_text_results(crops, texts)
+
+    def extract_text_batch(self, images: list, batch_bubbles: list, source_lang: str = "ja") -> list:
+        """
+        Extract text from the speech bubbles of several pages, sharing the OCR batches
+        
+        Args:
+            images (list): List of numpy.ndarray images
+            batch_bubbles (list): One list of bubble bounding boxes per image
+            
+        Returns:
+            list: One list of text dictionaries per image, in input order
+        """
+        page_crops = [self._prepare_crops(image, bubbles) for image, bubbles in zip(images, batch_bubbles)]
+        all_crops = [crop for crops in page_crops for crop in crops]
+        all_texts = self._ocr_crops(all_crops, source_lang)
+        return self._split_text_results(page_crops, all_texts)
+
+    async def extract_text_batch_async(self, images: list, batch_bubbles: list, source_lang: str = "ja", executor=None) -> list:
+        """
+        Coroutine version of extract_text_batch that doesn't block the event loop
+        
+        MangaOcr runs in executor (the default one if None), Gemini OCR requests
+        for the other languages go out concurrently on the async client.
+        
+        Args:
+            images (list): List of numpy.ndarray images
+            batch_bubbles (list): One list of bubble bounding boxes per image
+            source_lang (str): Source language code
+            executor (concurrent.futures.Executor): Where the cpu bound work runs
+            
+        Returns:
+            list: One list of text dictionaries per image, in input order
+        """
+        loop = asyncio.get_running_loop()
+        page_crops = await loop.run_in_executor(
+            executor, lambda: [self._prepare_crops(image, bubbles) for image, bubbles in zip(images, batch_bubbles)]
+        )
+        all_crops = [crop for crops in page_crops for crop in crops]
+        
+        if source_lang == "ja":
+            all_texts = await loop.run_in_executor(executor, self._ocr_crops, all_crops, source_lang)
+        else:
+            raw_texts = await asyncio.gather(*[
+                self.google_ocr_async(img, source_lang) for _, _, img in all_crops
+            ], return_exceptions=True)
+            all_texts = []
+            for (i, _, _), text in zip(all_crops, raw_texts):
+                # one failed request shouldn't take the other pages down, same as _ocr_crops
+                if isinstance(text, Exception):
+                    self.logger.warning(f"OCR error for bubble {i+1}: {text}")
+                    text = ""
+                all_texts.append(' '.join(text.strip().split()))
+        
+        return self._split_text_results(page_crops, all_texts)
+
+    def _split_text_results(self, page_crops: list, all_texts: list) -> list:
+        """Build the text results of every page from the texts of all pages' crops"""
+        results = []
+        offset = 0
+        for crops in page_crops:
+            texts = all_texts[offset:offset + len(crops)]
+            offset += len(crops)
+            results.append(self._build_text_results(crops, texts))
+        return results
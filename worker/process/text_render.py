@@ -8,6 +8,7 @@ import asyncio
 from pathlib import Path
 import pdb
 import logging
+from collections import OrderedDict
 
 # Third-party imports - Data processing & mathematical operations
 import numpy as np
@@ -56,7 +57,23 @@ class MangaTextRenderer:
         self.text_color = (0, 0, 0)  # Black text by default
         self.outline_color = None  # No outline by default
         self.outline_size = 1
+
+        # the worker keeps one renderer for all jobs, so loaded fonts and box fits are
+        # reused across the pages of a chapter (same fonts, many similar bubbles)
+        self._fonts = {}
+        self._fits = OrderedDict()
+        self.fit_cache_size = int(os.getenv("RENDER_FIT_CACHE_SIZE", 4096))
+        self._test_draw = None
     
+    def _load_font(self, size):
+        """Load the current font at a size, cached by path and size"""
+        key = (self.font_path, size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = ImageFont.truetype(self.font_path, size)
+            self._fonts[key] = font
+        return font
+
     def _create_test_draw(self):
         """Create a draw object for text measurements"""
         # 1 px transparent image for temp drawing context
@@ -65,7 +82,9 @@ class MangaTextRenderer:
         
     def _get_text_size(self, text, font):
         """Get dimensions of text with given font"""
-        draw = self._create_test_draw()
+        if self._test_draw is None:
+            self._test_draw = self._create_test_draw()
+        draw = self._test_draw
         # measures w,h of text on test drawing context
         try:
             bbox = draw.textbbox((0, 0), text, font=font)
@@ -108,7 +127,22 @@ class MangaTextRenderer:
             
         if min_font_size is None:
             min_font_size = self.min_font_size
-            
+
+        key = (self.font_path, text, box_width, box_height, max_font_size, min_font_size)
+        fit = self._fits.get(key)
+        if fit is not None:
+            self._fits.move_to_end(key)
+            font, lines, size = fit
+            return font, list(lines), size
+
+        fit = self._fit_text_in_box(text, box_width, box_height, max_font_size, min_font_size)
+        self._fits[key] = fit
+        if len(self._fits) > self.fit_cache_size:
+            self._fits.popitem(last=False)
+        font, lines, size = fit
+        return font, list(lines), size
+
+    def _fit_text_in_box(self, text, box_width, box_height, max_font_size, min_font_size):
         margin_ratio = 0.1  # 10% margin
         max_width = box_width * (1 - margin_ratio * 2)
         max_height = box_height * (1 - margin_ratio * 2)
@@ -120,7 +154,7 @@ class MangaTextRenderer:
         while current_size >= min_font_size:
             try:
                 if self.font_path:
-                    font = ImageFont.truetype(self.font_path, current_size)
+                    font = self._load_font(current_size)
                 else:
                     font = self.default_font
             except Exception:
@@ -143,7 +177,7 @@ class MangaTextRenderer:
             
         if best_font is None:
             if self.font_path:
-                best_font = ImageFont.truetype(self.font_path, min_font_size)
+                best_font = self._load_font(min_font_size)
             else:
                 best_font = self.default_font
                 
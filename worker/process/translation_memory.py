@@ -0,0 +1,107 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+class TranslationMemory:
+    """
+    Two tier cache of finished translations: an in-process LRU in front of a
+    shared Redis tier, so repeated lines ("え？", "！！", character names...)
+    skip the translator across jobs, workers and restarts.
+    """
+    def __init__(self, redis_client=None, max_local_entries=None, ttl=None):
+        """
+        Args:
+            redis_client (redis.Redis): Shared tier, None keeps the memory process local
+            max_local_entries (int): Size of the in-process LRU
+            ttl (int): Expiry of the Redis entries in seconds, 0 keeps them forever
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.redis_client = redis_client
+        self.max_local_entries = max_local_entries or int(os.getenv("TRANSLATION_MEMORY_LOCAL_SIZE", 10000))
+        self.ttl = ttl if ttl is not None else int(os.getenv("TRANSLATION_MEMORY_TTL", 30 * 24 * 60 * 60))
+
+        self.local = OrderedDict()
+        # the memory is shared between the pipeline's threads and coroutines
+        self.lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize width variants and whitespace so trivially different lines share an entry"""
+        return ' '.join(unicodedata.normalize("NFKC", text).split())
+
+    def _key(self, text: str, source_lang: str, target_lang: str, namespace: str) -> str:
+        digest = hashlib.sha1(self.normalize(text).encode("utf-8")).hexdigest()
+        return f"tm:{namespace}:{source_lang}:{target_lang}:{digest}"
+
+    async def lookup(self, text: str, source_lang: str, target_lang: str, namespace: str = ""):
+        """
+        Find a previous translation of text
+
+        Args:
+            text (str): Source text
+            source_lang (str): Source language code
+            target_lang (str): Target language code
+            namespace (str): Separates translators/contexts that translate differently
+
+        Returns:
+            str: Cached translation, or None on a miss
+        """
+        key = self._key(text, source_lang, target_lang, namespace)
+        with self.lock:
+            if key in self.local:
+                self.local.move_to_end(key)
+                self.local_hits += 1
+                return self.local[key]
+
+        translated = None
+        if self.redis_client is not None:
+            try:
+                translated = await asyncio.to_thread(self.redis_client.get, key)
+            except Exception as e:
+                self.logger.warning(f"Translation memory lookup failed: {e}")
+
+        if translated is None:
+            self.misses += 1
+            return None
+
+        self.redis_hits += 1
+        self._remember(key, translated)
+        return translated
+
+    async def store(self, text: str, translated: str, source_lang: str, target_lang: str, namespace: str = ""):
+        """Save a translation in both tiers"""
+        key = self._key(text, source_lang, target_lang, namespace)
+        self._remember(key, translated)
+
+        if self.redis_client is not None:
+            try:
+                await asyncio.to_thread(self.redis_client.set, key, translated, ex=self.ttl or None)
+            except Exception as e:
+                self.logger.warning(f"Translation memory store failed: {e}")
+
+    def _remember(self, key: str, translated: str):
+        with self.lock:
+            self.local[key] = translated
+            self.local.move_to_end(key)
+            while len(self.local) > self.max_local_entries:
+                self.local.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process"""
+        hits = self.local_hits + self.redis_hits
+        total = hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "local_entries": len(self.local),
+        }
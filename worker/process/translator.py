@@ -10,26 +10,72 @@ import pdb
 import logging
 
 from googletrans import Translator
-from google import genai
+from google.genai import types
+from pydantic import BaseModel
 
-from jikanpy import Jikan
+from .translation_memory import TranslationMemory
+from .rate_limiter import build_rate_limiters
+from .genai_client import genai_client
+from .manga_metadata import MangaMetadataCache
+
+
+class BubbleTranslation(BaseModel):
+    """Response schema of the page level Gemini translation"""
+    bubble_id: int
+    translated_text: str
+
+
+def parse_page_translations(response_text: str, bubble_ids: list) -> dict:
+    """
+    Validate a page level Gemini response
+    
+    Args:
+        response_text (str): JSON response text
+        bubble_ids (list): Ids that were sent
+        
+    Returns:
+        dict: bubble_id -> translated text, only for ids that were sent and answered
+    """
+    entries = json.loads(response_text)
+    if not isinstance(entries, list):
+        raise ValueError("Page translation response is not a list")
+    
+    expected = set(bubble_ids)
+    translations = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        bubble_id = entry.get("bubble_id")
+        text = entry.get("translated_text")
+        if bubble_id in expected and isinstance(text, str) and text.strip():
+            translations[bubble_id] = text.strip()
+    return translations
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-jikan = Jikan()
 
 class MangaTranslator:
-    def __init__(self, translator_method="google"):
+    def __init__(self, translator_method="google", memory=None, rate_limiters=None, genai_mode=None, metadata=None):
         """
         Initialize the manga translator
         
         Args:
             translator_method (str): Translation method ('google' or 'deepl')
+            memory (TranslationMemory): Cache of previous translations, process local if None
+            rate_limiters (dict): Limiter per provider ('google', 'genai'), built from the environment if None
+            genai_mode (str): 'page' sends all bubbles of a page in one Gemini request, 'bubble' one request per bubble
+            metadata (MangaMetadataCache): Cache of the manga context from Jikan, process local if None
         """
         self.logger = logging.getLogger(self.__class__.__name__)
         # self.logger.setLevel(logging.DEBUG)
         # Configure translation
         self.translator_method = translator_method
         self.translator = Translator()
+        self.memory = memory or TranslationMemory()
+        self.metadata = metadata or MangaMetadataCache()
+        self.rate_limiters = rate_limiters or build_rate_limiters()
+        # max translation requests in flight at once, on top of the rate limit
+        self.concurrency = asyncio.Semaphore(int(os.getenv("TRANSLATE_CONCURRENCY", 8)))
+        self.genai_mode = genai_mode or os.getenv("GENAI_TRANSLATE_MODE", "page")
+        self.page_max_bubbles = int(os.getenv("GENAI_PAGE_MAX_BUBBLES", 80))
 
         with open("utils/languages.json", "r") as f:
             self.languages = json.load(f)
@@ -57,12 +103,111 @@ class MangaTranslator:
             translated_data = await self.translate_text(text_data, source_lang, target_lang)
             return translated_data
         elif self.translator_method == "genai":
-            return self.translate_text_genai(text_data, source_lang, target_lang, manga_title)
+            return await self.translate_text_genai(text_data, source_lang, target_lang, manga_title)
         else:
             raise ValueError(f"Unsupported translator method: {self.translator_method}")
         
     
-    def translate_text_genai(self, text_data, source_lang:str="ja", target_lang:str="en", manga_title:str=None) -> list:
+    async def translate_pages(self, pages: list, source_lang:str="ja", target_lang:str="en", manga_title:str=None) -> list:
+        """
+        Translate the text of several pages, e.g. a whole chapter
+        
+        In Gemini page mode all bubbles go out in one structured request
+        (split every GENAI_PAGE_MAX_BUBBLES bubbles), otherwise pages are translated one by one.
+        
+        Args:
+            pages (list): One text_data list per page
+            source_lang (str): Source language code
+            target_lang (str): Target language code
+            
+        Returns:
+            list: The pages, with translations added
+        """
+        if self.translator_method == "genai" and self.genai_mode == "page":
+            manga_info = await self.metadata.get_context(manga_title)
+            namespace = f"genai:{TranslationMemory.normalize(manga_title)}" if manga_title else "genai"
+            items = [item for page in pages for item in page]
+            await self._translate_page_genai(items, source_lang, target_lang, manga_info, namespace)
+            return pages
+        return [await self.translate(page, source_lang, target_lang, manga_title) for page in pages]
+
+    async def _translate_page_genai(self, items, source_lang, target_lang, manga_info, namespace):
+        """
+        Translate many bubbles with one Gemini request per GENAI_PAGE_MAX_BUBBLES bubbles.
+        The response is constrained to a JSON list of {bubble_id, translated_text} and mapped
+        back by id; bubbles missing from an invalid response fall back to per-bubble calls.
+        """
+        pending = []
+        for item in items:
+            # Skip empty text
+            if not item["text"].strip():
+                item["translated_text"] = ""
+                continue
+            cached = await self.memory.lookup(item["text"], source_lang, target_lang, namespace)
+            if cached is not None:
+                item["translated_text"] = cached
+                continue
+            pending.append(item)
+        
+        # bubble ids repeat across pages, number the request instead in that case
+        ids = [item["bubble_id"] for item in pending]
+        if len(set(ids)) != len(ids):
+            ids = list(range(1, len(pending) + 1))
+        
+        chunks = [
+            (ids[start:start + self.page_max_bubbles], pending[start:start + self.page_max_bubbles])
+            for start in range(0, len(pending), self.page_max_bubbles)
+        ]
+        await asyncio.gather(*[
+            self._translate_chunk_genai(chunk_ids, chunk_items, source_lang, target_lang, manga_info, namespace)
+            for chunk_ids, chunk_items in chunks
+        ])
+
+    async def _translate_chunk_genai(self, ids, items, source_lang, target_lang, manga_info, namespace):
+        bubbles = [{"bubble_id": bubble_id, "text": item["text"]} for bubble_id, item in zip(ids, items)]
+        prompt = f"""
+        You are a translator, translating manga text from one language to another.
+        Translate the text of every speech bubble below from {self.get_language_full(source_lang)} to {self.get_language_full(target_lang)}.
+        The bubbles are in reading order and belong to the same story, use them as context for each other.
+        Return one entry per bubble with its bubble_id and the translated text only.
+        {json.dumps(bubbles, ensure_ascii=False)}
+        {"Here is some context about the manga:" + 
+         manga_info if manga_info else ""}
+        """
+        
+        translations = {}
+        async with self.concurrency:
+            await self.rate_limiters["genai"].acquire()
+            try:
+                response = await genai_client.generate_content(
+                    model="gemini-2.0-flash",
+                    contents=prompt,
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        response_schema=list[BubbleTranslation],
+                    ),
+                )
+                translations = parse_page_translations(response.text, ids)
+            except Exception as e:
+                self.logger.warning(f"Page translation failed, falling back to per-bubble calls: {e}")
+        
+        missing = []
+        for bubble_id, item in zip(ids, items):
+            if bubble_id not in translations:
+                missing.append(item)
+                continue
+            item["translated_text"] = translations[bubble_id]
+            await self.memory.store(item["text"], item["translated_text"], source_lang, target_lang, namespace)
+            self.logger.info(f"Translated: '{item['text']}' -> '{item['translated_text']}'")
+        
+        if missing:
+            self.logger.warning(f"{len(missing)} bubble(s) missing from the page translation, translating them one by one")
+            await asyncio.gather(*[
+                self._translate_item_genai(item, source_lang, target_lang, manga_info, namespace)
+                for item in missing
+            ])
+
+    async def translate_text_genai(self, text_data, source_lang:str="ja", target_lang:str="en", manga_title:str=None) -> list:
         """
         Translate extracted text using Google GenAI
         
@@ -76,59 +221,62 @@ class MangaTranslator:
         """
         self.logger.debug(f"Translating from {source_lang} to {target_lang} using {self.translator_method}")
         
-        manga_info = ""
-
-        if manga_title:
-            search_results = jikan.search('manga', manga_title, page=1)
-            if search_results["data"]:
-                top_result = search_results["data"][0]
-                manga_info = f"""
-                Title: {top_result['title']}\n
-                Synopsis: {top_result['synopsis']}\n
-                Themes: {', '.join([theme['name'] for theme in top_result['themes']])}\n
-                Genres: {', '.join([genre['name'] for genre in top_result['genres']])}\n
-                Demographics: {', '.join([demographic['name'] for demographic in top_result['demographics']])}\n
-                """
-            else:
-                manga_info = f"Title: {manga_title}\nNo additional information found.\n"
-        
-        for item in text_data:
-            original_text = item["text"]
-            
-            # Skip empty text
-            if not original_text.strip():
-                item["translated_text"] = ""
-                continue
-            
-            # slight delay to avoid rate limiting
-            time.sleep(0.5)
-            
+        manga_info = await self.metadata.get_context(manga_title)
+        
+        # the manga context changes the translation, so it's part of the memory namespace
+        namespace = f"genai:{TranslationMemory.normalize(manga_title)}" if manga_title else "genai"
+        
+        if self.genai_mode == "page":
+            await self._translate_page_genai(text_data, source_lang, target_lang, manga_info, namespace)
+        else:
+            # bubbles are translated concurrently, the rate limiter keeps us inside the quota
+            await asyncio.gather(*[
+                self._translate_item_genai(item, source_lang, target_lang, manga_info, namespace)
+                for item in text_data
+            ])
+        
+        self.logger.debug(f"Translation memory: {self.memory.stats()}")
+        return text_data
 
-            prompt = f"""
-            You are a translator, translating manga text from one language to another.
-            Translate the following text from {self.get_language_full(source_lang)} to {self.get_language_full(target_lang)}:
-            {original_text}
-            Please return only the translated text without any additional comments or formatting.
-            {"Here is some context about the manga:" + 
-             manga_info if manga_info else ""}
-            """
-            
-            # print(prompt)
-            
-            # translate using GenAI
+    async def _translate_item_genai(self, item, source_lang, target_lang, manga_info, namespace):
+        original_text = item["text"]
+        
+        # Skip empty text
+        if not original_text.strip():
+            item["translated_text"] = ""
+            return
+        
+        cached = await self.memory.lookup(original_text, source_lang, target_lang, namespace)
+        if cached is not None:
+            item["translated_text"] = cached
+            return
+
+        prompt = f"""
+        You are a translator, translating manga text from one language to another.
+        Translate the following text from {self.get_language_full(source_lang)} to {self.get_language_full(target_lang)}:
+        {original_text}
+        Please return only the translated text without any additional comments or formatting.
+        {"Here is some context about the manga:" + 
+         manga_info if manga_info else ""}
+        """
+        
+        # print(prompt)
+        
+        # translate using GenAI
+        async with self.concurrency:
+            await self.rate_limiters["genai"].acquire()
             try:
-                response = client.models.generate_content(
+                response = await genai_client.generate_content(
                     model="gemini-2.0-flash",
                     contents=prompt,
                 )
                 item["translated_text"] = response.text
+                await self.memory.store(original_text, response.text, source_lang, target_lang, namespace)
             except Exception as e:
                 self.logger.error(f"Translation error: {e}")
                 item["translated_text"] = original_text
-            
-            self.logger.info(f"Translated: '{original_text}' -> '{item['translated_text']}'")
         
-        return text_data
+        self.logger.info(f"Translated: '{original_text}' -> '{item['translated_text']}'")
 
     async def translate_text(self, text_data, source_lang:str="ja", target_lang:str="en") -> list:
         """
@@ -144,27 +292,38 @@ class MangaTranslator:
         """
         self.logger.debug(f"Translating from {source_lang} to {target_lang} using {self.translator_method}")
         
-        for item in text_data:
-            original_text = item["text"]
-            
-            # Skip empty text
-            if not original_text.strip():
-                item["translated_text"] = ""
-                continue
-            
-            # slight delay to avoid rate limiting
-            time.sleep(0.5)
-            
-            # translate based on method
+        # bubbles are translated concurrently, the rate limiter keeps us inside the quota
+        await asyncio.gather(*[
+            self._translate_item(item, source_lang, target_lang) for item in text_data
+        ])
+        
+        self.logger.debug(f"Translation memory: {self.memory.stats()}")
+        return text_data
+
+    async def _translate_item(self, item, source_lang, target_lang):
+        original_text = item["text"]
+        
+        # Skip empty text
+        if not original_text.strip():
+            item["translated_text"] = ""
+            return
+        
+        cached = await self.memory.lookup(original_text, source_lang, target_lang, "google")
+        if cached is not None:
+            item["translated_text"] = cached
+            return
+        
+        # translate based on method
+        async with self.concurrency:
+            await self.rate_limiters["google"].acquire()
             try:
                 translation = await self.translator.translate(
                     original_text, src=source_lang, dest=target_lang
                 )
                 item["translated_text"] = translation.text
+                await self.memory.store(original_text, translation.text, source_lang, target_lang, "google")
             except Exception as e:
                 self.logger.error(f"Translation error: {e}")
                 item["translated_text"] = original_text
-            
-            self.logger.info(f"Translated: '{original_text}' -> '{item['translated_text']}'")
         
-        return text_data
\ No newline at end of file
+        self.logger.info(f"Translated: '{original_text}' -> '{item['translated_text']}'")
@@ -1,6 +1,7 @@
 import io
 import os
 import sys
+from collections import OrderedDict
 from typing import List, Optional
 
 from urllib.parse import urlparse
@@ -265,6 +266,36 @@ def boxes_from_mask(mask: np.ndarray) -> List[np.ndarray]:
     return boxes
 
 
+def merge_boxes(boxes: List[np.ndarray], gap: int = 0) -> List[np.ndarray]:
+    """
+    Merge boxes that overlap or are less than gap pixels apart
+
+    Args:
+        boxes: [x1, y1, x2, y2] boxes
+        gap: max distance between two boxes that still get merged
+
+    Returns:
+        merged [x1, y1, x2, y2] boxes
+    """
+    merged = [np.array(box, dtype=int) for box in boxes]
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for box in merged:
+            for other in result:
+                if (box[0] <= other[2] + gap and other[0] <= box[2] + gap
+                        and box[1] <= other[3] + gap and other[1] <= box[3] + gap):
+                    other[:2] = np.minimum(other[:2], box[:2])
+                    other[2:] = np.maximum(other[2:], box[2:])
+                    changed = True
+                    break
+            else:
+                result.append(box)
+        merged = result
+    return merged
+
+
 def only_keep_largest_contour(mask: np.ndarray) -> List[np.ndarray]:
     """
     Args:
@@ -288,4 +319,108 @@ def only_keep_largest_contour(mask: np.ndarray) -> List[np.ndarray]:
         new_mask = np.zeros_like(mask)
         return cv2.drawContours(new_mask, contours, max_index, 255, -1)
     else:
-        return mask
\ No newline at end of file
+        return mask
+
+class LamaBufferPool:
+    """
+    Preallocated LaMa input tensors, one pair per (batch, height, width) shape.
+    Fixed crop buckets mean a handful of shapes, so the buffers are reused call after call
+    instead of allocating and copying full float arrays several times per page.
+    Whole pages rarely share a shape, max_bytes keeps their buffers from piling up.
+    """
+    def __init__(self, max_shapes: int = 8, max_bytes: int = 256 * 1024 * 1024):
+        self.max_shapes = max_shapes
+        self.max_bytes = max_bytes
+        # shape -> (image tensor [N, 3, H, W] float32, mask tensor [N, 1, H, W] float32)
+        self.buffers = OrderedDict()
+
+    @staticmethod
+    def _nbytes(key) -> int:
+        batch, height, width = key
+        # 3 image channels and the mask, float32
+        return batch * 4 * height * width * 4
+
+    def get(self, batch: int, height: int, width: int):
+        key = (batch, height, width)
+        buffers = self.buffers.get(key)
+        if buffers is None:
+            buffers = (
+                torch.empty((batch, 3, height, width), dtype=torch.float32),
+                torch.empty((batch, 1, height, width), dtype=torch.float32),
+            )
+            self.buffers[key] = buffers
+            # the newest shape always stays, it is about to be used
+            while len(self.buffers) > 1 and (
+                len(self.buffers) > self.max_shapes
+                or sum(self._nbytes(shape) for shape in self.buffers) > self.max_bytes
+            ):
+                self.buffers.popitem(last=False)
+        else:
+            self.buffers.move_to_end(key)
+        return buffers
+
+
+def prepare_lama_batch(pool: LamaBufferPool, images: list, masks: list, height: int, width: int):
+    """
+    Fill pooled LaMa input tensors from BGR uint8 images and uint8 masks in one pass:
+    channel swap, scaling to [0, 1] and HWC -> CHW happen while writing into the buffer,
+    the padding is mirrored in place and left 0 in the mask.
+
+    Args:
+        pool: buffer pool
+        images: BGR uint8 images, none larger than height x width
+        masks: uint8 masks, nonzero where to inpaint
+        height, width: padded size
+
+    Returns:
+        (image tensor [N, 3, H, W], mask tensor [N, 1, H, W]), views into the pool's buffers
+    """
+    image_tensor, mask_tensor = pool.get(len(images), height, width)
+    image_buffer = image_tensor.numpy()
+    mask_buffer = mask_tensor.numpy()
+    mask_buffer.fill(0)
+    for i, (image, mask) in enumerate(zip(images, masks)):
+        h, w = image.shape[:2]
+        plane = image_buffer[i]
+        source = torch.from_numpy(image).permute(2, 0, 1)
+        for channel in range(3):
+            # BGR -> RGB by reading the channels in reverse, the uint8 -> float32 cast happens in the copy
+            image_tensor[i, channel, :h, :w].copy_(source[2 - channel])
+        image_tensor[i, :, :h, :w].mul_(1 / 255)
+        np.greater(mask, 0, out=mask_buffer[i, 0, :h, :w], casting="unsafe")
+        # mirror the padding like np.pad(mode="symmetric"), doubling the filled extent with
+        # every slice copy instead of gathering it with fancy indexing (slow on small crops)
+        filled = h
+        while filled < height:
+            n = min(filled, height - filled)
+            plane[:, filled:filled + n, :w] = plane[:, filled - n:filled, :w][:, ::-1]
+            filled += n
+        filled = w
+        while filled < width:
+            n = min(filled, width - filled)
+            plane[:, :, filled:filled + n] = plane[:, :, filled - n:filled][:, :, ::-1]
+            filled += n
+    return image_tensor, mask_tensor
+
+
+def lama_output_to_bgr(output: torch.Tensor, sizes: list = None) -> list:
+    """
+    LaMa output [N, 3, H, W] RGB in [0, 1] -> N BGR uint8 [H, W, 3] images.
+    Scales and clamps in place, the channel swap and layout change share a single uint8 copy
+    per image (cv2.merge, a strided numpy copy of the same thing is ~3x slower).
+    Call it inside the inference_mode block the output was produced in.
+
+    Args:
+        output: LaMa output
+        sizes: (height, width) of every image, the padding is cropped before converting
+
+    Returns:
+        list: BGR uint8 images
+    """
+    results = []
+    for i, planes in enumerate(output):
+        if sizes:
+            planes = planes[:, :sizes[i][0], :sizes[i][1]]
+        planes = planes.mul_(255).clamp_(0, 255).to(torch.uint8).cpu().numpy()
+        results.append(cv2.merge([planes[2], planes[1], planes[0]]))
+    return results
@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+
+# Reliable mode: jobs are moved (not popped) from job_queue to a per worker processing
+# list and only removed once they are finished. Workers keep a heartbeat key alive, and
+# the processing lists of workers whose heartbeat expired are put back on the queue.
+RELIABLE_QUEUE = os.getenv("RELIABLE_QUEUE", "0") == "1"
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 5))
+# a worker is considered dead once its heartbeat is older than this
+WORKER_HEARTBEAT_TTL = int(os.getenv("WORKER_HEARTBEAT_TTL", 30))
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", 30))
+# a job whose worker died this many times goes to the dead letter list instead
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+
+# Priority lanes. Every lane holds one list per client, job_queue:<lane>:<client_id>,
+# plus a ring of the clients with queued jobs (job_queue:<lane>:clients) and its member
+# set (job_queue:<lane>:members). Workers pick lanes by weighted round-robin and
+# clients within a lane by plain round-robin, so one big upload can't starve the rest.
+LANE_WEIGHTS = {
+    lane: int(weight)
+    for lane, weight in (item.split(":") for item in os.getenv("JOB_LANES", "interactive:4,bulk:1").split(","))
+}
+# an idle worker polls the lanes with exponential backoff between these bounds
+QUEUE_POLL_MIN_MS = int(os.getenv("QUEUE_POLL_MIN_MS", 20))
+QUEUE_POLL_MAX_MS = int(os.getenv("QUEUE_POLL_MAX_MS", 500))
+
+# jobs queued by older api servers, drained after the lanes
+QUEUE_KEY = "job_queue"
+WORKERS_KEY = "workers"
+ATTEMPTS_KEY = "job_attempts"
+DEAD_LETTER_KEY = "job_dead_letter"
+
+# Every key a script touches is passed in KEYS, so the client rotates the lane's ring itself
+# and picks the keys before calling them. The keys of one call don't share a hash tag, so
+# the queue still needs a single Redis node (or a primary with replicas), not Redis Cluster.
+
+# pops the job of a client picked from the lane's ring and takes the client out of the
+# ring once its queue is empty. KEYS[4], the processing list in reliable mode, gets the job
+# in the same step. atomic, so a job queued meanwhile never leaves its client out of the ring
+LANE_TAKE_SCRIPT = """
+local job = redis.call('LPOP', KEYS[1])
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('LREM', KEYS[2], 0, ARGV[1])
+    redis.call('SREM', KEYS[3], ARGV[1])
+end
+if job and KEYS[4] then
+    redis.call('LPUSH', KEYS[4], job)
+end
+return job
+"""
+
+# moves one of a dead worker's jobs back to its queue (KEYS[2], with the lane's ring and
+# members as KEYS[5] and KEYS[6]), or to the dead letter list once it ran out of attempts.
+# the job is only moved if it was still in the processing list, so two reapers never
+# requeue it twice. returns 0 if another reaper got it, 1 requeued, 2 dead-lettered
+REQUEUE_SCRIPT = """
+if redis.call('LREM', KEYS[1], -1, ARGV[1]) == 0 then
+    return 0
+end
+local attempts = redis.call('HINCRBY', KEYS[4], ARGV[2], 1)
+if ARGV[5] == '0' or attempts >= tonumber(ARGV[3]) then
+    redis.call('LPUSH', KEYS[3], ARGV[1])
+    redis.call('HDEL', KEYS[4], ARGV[2])
+    return 2
+end
+-- back to the head of its queue, requeued jobs have waited long enough
+redis.call('LPUSH', KEYS[2], ARGV[1])
+if KEYS[5] and redis.call('SADD', KEYS[6], ARGV[4]) == 1 then
+    redis.call('RPUSH', KEYS[5], ARGV[4])
+end
+return 1
+"""
+
+
+def default_worker_id() -> str:
+    """WORKER_ID if set, otherwise host, pid and a random suffix"""
+    return os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobQueue:
+    """
+    Plain queue, jobs are popped off the lanes and lost if the worker dies while processing them
+    """
+    def __init__(self, redis_client):
+        """
+        Args:
+            redis_client (redis.Redis): Redis client with decode_responses=True
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.redis_client = redis_client
+        self.worker_id = default_worker_id()
+        self.lane_take = redis_client.register_script(LANE_TAKE_SCRIPT)
+        # weighted round-robin order, e.g. interactive x4 then bulk x1
+        self.schedule = [lane for lane, weight in LANE_WEIGHTS.items() for _ in range(weight)]
+        self.turn = 0
+        # where lane pops move the job to, only in reliable mode
+        self.processing_key = None
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def pop_batch(self, max_jobs: int, max_wait_ms: int) -> list:
+        """
+        Block until a job is queued, then drain up to max_jobs jobs
+
+        Args:
+            max_jobs (int): Max number of jobs to return
+            max_wait_ms (int): How long to wait for more jobs after the first one
+
+        Returns:
+            list: Raw job json strings
+        """
+        backoff = QUEUE_POLL_MIN_MS / 1000
+        while True:
+            batch = self._take(max_jobs)
+            if batch:
+                break
+            # the legacy queue can be waited on, the wait doubles as the poll backoff
+            item = self._wait_legacy(backoff)
+            if item is not None:
+                batch = [item]
+                break
+            backoff = min(backoff * 2, QUEUE_POLL_MAX_MS / 1000)
+
+        deadline = time.monotonic() + max_wait_ms / 1000
+        while len(batch) < max_jobs:
+            queued = self._take(max_jobs - len(batch))
+            if queued:
+                batch.extend(queued)
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            item = self._wait_legacy(min(remaining, QUEUE_POLL_MIN_MS / 1000))
+            if item is not None:
+                batch.append(item)
+
+        return batch
+
+    def ack(self, job_id: str):
+        """Mark a job as done, finished or failed for good"""
+        pass
+
+    def _lane_order(self) -> list:
+        # the scheduled lane first, then the others by weight so no worker idles while work is queued
+        first = self.schedule[self.turn % len(self.schedule)]
+        self.turn += 1
+        return [first] + sorted((lane for lane in LANE_WEIGHTS if lane != first), key=lambda lane: -LANE_WEIGHTS[lane])
+
+    def _take(self, max_jobs: int) -> list:
+        """Take up to max_jobs queued jobs without blocking, lanes first then the legacy queue"""
+        jobs = []
+        while len(jobs) < max_jobs:
+            for lane in self._lane_order():
+                job_json = self._pop_lane(lane)
+                if job_json:
+                    jobs.append(job_json)
+                    break
+            else:
+                break
+        if len(jobs) < max_jobs:
+            jobs.extend(self._take_legacy(max_jobs - len(jobs)))
+        return jobs
+
+    def _pop_lane(self, lane: str):
+        """Next job of a lane, round-robin over its clients, None if the lane is empty"""
+        ring = f"job_queue:{lane}:clients"
+        for _ in range(self.redis_client.llen(ring)):
+            client_id = self.redis_client.lmove(ring, ring, "LEFT", "RIGHT")
+            if client_id is None:
+                return None
+            keys = [f"job_queue:{lane}:{client_id}", ring, f"job_queue:{lane}:members"]
+            if self.processing_key:
+                keys.append(self.processing_key)
+            job_json = self.lane_take(keys=keys, args=[client_id])
+            if job_json:
+                return job_json
+        return None
+
+    def _take_legacy(self, max_jobs: int) -> list:
+        return self.redis_client.lpop(QUEUE_KEY, max_jobs) or []
+
+    def _wait_legacy(self, timeout: float):
+        item = self.redis_client.blpop(QUEUE_KEY, timeout)
+        return item[1] if item else None
+
+
+class ReliableJobQueue(JobQueue):
+    """
+    Queue that keeps every job in Redis until it is acked. Dequeued jobs wait in
+    'processing:{worker_id}', and a background thread keeps the worker's heartbeat
+    alive and requeues the jobs of workers that stopped sending theirs.
+    """
+    def __init__(self, redis_client, worker_id=None, on_dead_letter=None):
+        """
+        Args:
+            redis_client (redis.Redis): Redis client with decode_responses=True
+            worker_id (str): Stable name of this worker (WORKER_ID), generated if None
+            on_dead_letter (callable): Called with each dead-lettered job's raw json
+        """
+        super().__init__(redis_client)
+        self.worker_id = worker_id or self.worker_id
+        self.on_dead_letter = on_dead_letter
+        self.processing_key = f"processing:{self.worker_id}"
+        self.heartbeat_key = f"worker_heartbeat:{self.worker_id}"
+        self.requeue = redis_client.register_script(REQUEUE_SCRIPT)
+        # job_id -> raw json in the processing list, needed to remove it on ack
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Register the worker and start the heartbeat/reaper thread"""
+        self._heartbeat()
+        # jobs left over from a previous run under the same WORKER_ID
+        self._notify(self.reap(include_self=True))
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="job-queue-heartbeat", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop heartbeating, the worker's unacked jobs get requeued by the next reaper"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.redis_client.delete(self.heartbeat_key)
+
+    def pop_batch(self, max_jobs: int, max_wait_ms: int) -> list:
+        # same scheduling as JobQueue, but every job is moved to the processing list atomically
+        batch = super().pop_batch(max_jobs, max_wait_ms)
+
+        jobs = []
+        for job_json in batch:
+            try:
+                job_id = json.loads(job_json)["job_id"]
+            except Exception as e:
+                # retrying won't fix a broken payload
+                self.logger.error(f"Dead-lettering malformed job: {e}")
+                pipe = self.redis_client.pipeline()
+                pipe.lrem(self.processing_key, 1, job_json)
+                pipe.lpush(DEAD_LETTER_KEY, job_json)
+                pipe.execute()
+                continue
+            with self.lock:
+                self.inflight[job_id] = job_json
+            jobs.append(job_json)
+        return jobs
+
+    def _take_legacy(self, max_jobs: int) -> list:
+        jobs = []
+        while len(jobs) < max_jobs:
+            item = self.redis_client.lmove(QUEUE_KEY, self.processing_key, "LEFT", "LEFT")
+            if item is None:
+                break
+            jobs.append(item)
+        return jobs
+
+    def _wait_legacy(self, timeout: float):
+        return self.redis_client.blmove(QUEUE_KEY, self.processing_key, timeout, "LEFT", "LEFT")
+
+    def ack(self, job_id: str):
+        with self.lock:
+            job_json = self.inflight.pop(job_id, None)
+        if job_json is None:
+            return
+        pipe = self.redis_client.pipeline()
+        pipe.lrem(self.processing_key, 1, job_json)
+        pipe.hdel(ATTEMPTS_KEY, job_id)
+        pipe.execute()
+
+    def reap(self, include_self: bool = False) -> list:
+        """
+        Requeue the jobs of dead workers
+
+        Args:
+            include_self (bool): Also requeue this worker's own list, only safe before it dequeues anything
+
+        Returns:
+            list: Raw json of the jobs that ran out of attempts and were dead-lettered
+        """
+        dead_letters = []
+        for worker_id in self.redis_client.smembers(WORKERS_KEY):
+            if worker_id == self.worker_id:
+                if not include_self:
+                    continue
+            elif self.redis_client.exists(f"worker_heartbeat:{worker_id}"):
+                continue
+            dead = self._requeue(f"processing:{worker_id}")
+            if worker_id != self.worker_id:
+                self.logger.warning(f"Worker {worker_id} is gone, requeued its jobs")
+                self.redis_client.srem(WORKERS_KEY, worker_id)
+            for job_json in dead:
+                self.logger.error(f"Job gave up after {JOB_MAX_ATTEMPTS} attempts: {job_json}")
+            dead_letters.extend(dead)
+        return dead_letters
+
+    def _requeue(self, processing_key: str) -> list:
+        """Requeue the jobs of a processing list, returns the dead-lettered ones"""
+        dead = []
+        # newest first, every job goes to the head of its queue so they end up in their original order
+        for job_json in self.redis_client.lrange(processing_key, 0, -1):
+            try:
+                job = json.loads(job_json)
+                job_id = job["job_id"]
+            except Exception:
+                job, job_id = None, job_json
+            keys = [processing_key, QUEUE_KEY, DEAD_LETTER_KEY, ATTEMPTS_KEY]
+            client_id = ""
+            if job and job.get("lane") and job.get("client_id"):
+                prefix = f"job_queue:{job['lane']}:"
+                client_id = job["client_id"]
+                keys = [processing_key, prefix + client_id, DEAD_LETTER_KEY, ATTEMPTS_KEY, prefix + "clients", prefix + "members"]
+            moved = self.requeue(keys=keys, args=[job_json, job_id, JOB_MAX_ATTEMPTS, client_id, "1" if job else "0"])
+            if moved == 2:
+                dead.append(job_json)
+        return dead
+
+    def _heartbeat(self):
+        pipe = self.redis_client.pipeline()
+        pipe.set(self.heartbeat_key, time.time(), ex=WORKER_HEARTBEAT_TTL)
+        pipe.sadd(WORKERS_KEY, self.worker_id)
+        pipe.execute()
+
+    def _run(self):
+        # a thread, so the heartbeat keeps going while the worker is busy in a blocking model call
+        next_reap = time.monotonic() + REAPER_INTERVAL
+        while not self.stopped.wait(WORKER_HEARTBEAT_INTERVAL):
+            try:
+                self._heartbeat()
+                if time.monotonic() >= next_reap:
+                    next_reap = time.monotonic() + REAPER_INTERVAL
+                    self._notify(self.reap())
+            except Exception as e:
+                self.logger.warning(f"Job queue heartbeat failed: {e}")
+
+    def _notify(self, dead_letters: list):
+        if self.on_dead_letter is None:
+            return
+        for job_json in dead_letters:
+            try:
+                self.on_dead_letter(job_json)
+            except Exception as e:
+                self.logger.warning(f"Dead letter callback failed: {e}")
+
+
+def build_job_queue(redis_client, on_dead_letter=None) -> JobQueue:
+    """
+    Create the queue selected by RELIABLE_QUEUE
+
+    Args:
+        redis_client (redis.Redis): Redis client with decode_responses=True
+        on_dead_letter (callable): Called with each dead-lettered job's raw json, reliable mode only
+    """
+    if RELIABLE_QUEUE:
+        return ReliableJobQueue(redis_client, on_dead_letter=on_dead_letter)
+    return JobQueue(redis_client)
+
+
+def queue_depth(redis_client) -> dict:
+    """
+    Queued jobs per lane, plus the legacy job_queue under 'legacy'
+
+    Returns:
+        dict: lane -> number of queued jobs
+    """
+    pipe = redis_client.pipeline()
+    for lane in LANE_WEIGHTS:
+        pipe.lrange(f"job_queue:{lane}:clients", 0, -1)
+    clients_per_lane = pipe.execute()
+
+    pipe = redis_client.pipeline()
+    for lane, clients in zip(LANE_WEIGHTS, clients_per_lane):
+        for client_id in clients:
+            pipe.llen(f"job_queue:{lane}:{client_id}")
+    pipe.llen(QUEUE_KEY)
+    depths = iter(pipe.execute())
+
+    result = {lane: sum(next(depths) for _ in clients) for lane, clients in zip(LANE_WEIGHTS, clients_per_lane)}
+    result["legacy"] = next(depths)
+    return result
@@ -10,4 +10,7 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 # decode_responses=True ensures that data read from Redis is in a human-readable string format.
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 
+# Raw bytes client for the job images and result images, which are stored as binary keys.
+redis_binary_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+
 print(f"Redis client configured for {REDIS_HOST}:{REDIS_PORT}")
@@ -0,0 +1,155 @@
+import os
+import time
+
+from shared import result_store
+
+# Worker side of the content-addressed result cache, see api_server/api/shared/result_cache.py.
+# The worker knows the result size, so it does the byte accounting and the eviction.
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 24 * 60 * 60))
+# 0 disables the byte budget and leaves eviction to the TTL alone. only the bytes a result
+# keeps in Redis count here, images written to the blob directory have their own budget
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# byte budget for the blob files of cached results, 0 disables it
+RESULT_BLOB_MAX_BYTES = int(os.getenv("RESULT_BLOB_MAX_BYTES", 0))
+
+# result_cache:sizes holds the Redis bytes of every entry and result_cache:bytes their running total,
+# result_cache:blob_sizes and result_cache:blob_bytes do the same for the blob directory.
+# checking the budgets is a single GET each, they are only changed through these scripts
+
+# KEYS: redis sizes, redis total, blob sizes, blob total
+# ARGV: digest, redis bytes, blob bytes
+# sets an entry's sizes and adjusts the totals by the difference, returns the new totals
+SET_SIZE_SCRIPT = """
+local totals = {}
+for i = 0, 1 do
+    local sizes, total, size = KEYS[i * 2 + 1], KEYS[i * 2 + 2], tonumber(ARGV[i + 2])
+    local previous = tonumber(redis.call('HGET', sizes, ARGV[1]) or 0)
+    if size > 0 then
+        redis.call('HSET', sizes, ARGV[1], size)
+    else
+        redis.call('HDEL', sizes, ARGV[1])
+    end
+    totals[i + 1] = redis.call('INCRBY', total, size - previous)
+end
+return totals
+"""
+
+# KEYS: redis sizes, redis total, blob sizes, blob total
+# ARGV: digests
+# removes entries' sizes and subtracts them from the totals, returns the new totals
+DROP_SIZES_SCRIPT = """
+local totals = {}
+for i = 0, 1 do
+    local sizes, total = KEYS[i * 2 + 1], KEYS[i * 2 + 2]
+    local freed = 0
+    for _, digest in ipairs(ARGV) do
+        local size = redis.call('HGET', sizes, digest)
+        if size then
+            freed = freed + tonumber(size)
+            redis.call('HDEL', sizes, digest)
+        end
+    end
+    totals[i + 1] = redis.call('DECRBY', total, freed)
+end
+return totals
+"""
+
+SIZE_KEYS = ["result_cache:sizes", "result_cache:bytes", "result_cache:blob_sizes", "result_cache:blob_bytes"]
+LRU_KEY = "result_cache:lru"
+# victims are looked up this many LRU entries at a time
+EVICT_SCAN_BATCH = 100
+
+
+def release(redis_client, job: dict):
+    """Drop the in-flight marker so identical uploads stop attaching to this job"""
+    redis_client.delete(f"job_inflight:{job['job_id']}")
+
+
+def record_result(redis_client, job: dict, redis_bytes: int, blob_bytes: int = 0):
+    """
+    Account a stored result against the cache budgets and evict the least recently used ones
+
+    Args:
+        redis_client (redis.Redis): Redis client
+        job (dict): Finished job, must carry the "cache_key" set by the API
+        redis_bytes (int): Bytes the result keeps in Redis
+        blob_bytes (int): Bytes of its image in the blob directory, 0 if the image is in Redis
+    """
+    digest = job["cache_key"]
+    pipe = redis_client.pipeline()
+    pipe.delete(f"job_inflight:{job['job_id']}")
+    pipe.expire(f"result_cache:{digest}", RESULT_CACHE_TTL)
+    pipe.zadd(LRU_KEY, {digest: time.time()})
+    pipe.execute()
+    totals = redis_client.eval(SET_SIZE_SCRIPT, len(SIZE_KEYS), *SIZE_KEYS, digest, redis_bytes, blob_bytes)
+
+    evict(redis_client, totals)
+
+
+def _over_budget(totals) -> bool:
+    redis_total, blob_total = totals
+    return (
+        (RESULT_CACHE_MAX_BYTES and redis_total > RESULT_CACHE_MAX_BYTES)
+        or (RESULT_BLOB_MAX_BYTES and blob_total > RESULT_BLOB_MAX_BYTES)
+    )
+
+
+def evict(redis_client, totals: list = None):
+    """
+    Evict cached results until they fit in RESULT_CACHE_MAX_BYTES and RESULT_BLOB_MAX_BYTES,
+    oldest access first
+
+    Args:
+        redis_client (redis.Redis): Redis client
+        totals (list): Current result_cache:bytes and result_cache:blob_bytes, read here if None
+    """
+    result_store.sweep_blobs(redis_client)
+
+    # entries whose TTL ran out are gone already, stop counting them
+    expired_before = time.time() - RESULT_CACHE_TTL
+    expired = redis_client.zrangebyscore(LRU_KEY, 0, expired_before)
+    if expired:
+        totals = _drop(redis_client, expired)
+
+    if not RESULT_CACHE_MAX_BYTES and not RESULT_BLOB_MAX_BYTES:
+        return
+    if totals is None:
+        totals = redis_client.mget(SIZE_KEYS[1], SIZE_KEYS[3])
+    totals = [int(total or 0) for total in totals]
+    if not _over_budget(totals):
+        return
+
+    # only walk as much of the LRU as it takes to get back under both budgets
+    victims = []
+    start = 0
+    while _over_budget(totals):
+        digests = redis_client.zrange(LRU_KEY, start, start + EVICT_SCAN_BATCH - 1)
+        if not digests:
+            break
+        start += len(digests)
+        pipe = redis_client.pipeline()
+        pipe.hmget(SIZE_KEYS[0], digests)
+        pipe.hmget(SIZE_KEYS[2], digests)
+        redis_sizes, blob_sizes = pipe.execute()
+        for digest, redis_size, blob_size in zip(digests, redis_sizes, blob_sizes):
+            if not _over_budget(totals):
+                break
+            totals[0] -= int(redis_size or 0)
+            totals[1] -= int(blob_size or 0)
+            victims.append(digest)
+    if victims:
+        _drop(redis_client, victims)
+
+
+def _drop(redis_client, digests: list) -> list:
+    """Delete cached results, returns the remaining Redis and blob totals"""
+    job_ids = redis_client.mget([f"result_cache:{digest}" for digest in digests])
+    result_store.delete_blobs([job_id for job_id in job_ids if job_id])
+    pipe = redis_client.pipeline()
+    for digest, job_id in zip(digests, job_ids):
+        if job_id:
+            pipe.delete(f"job_result:{job_id}", f"job_result_image:{job_id}")
+        pipe.delete(f"result_cache:{digest}")
+        pipe.zrem(LRU_KEY, digest)
+    pipe.execute()
+    return redis_client.eval(DROP_SIZES_SCRIPT, len(SIZE_KEYS), *SIZE_KEYS, *digests)
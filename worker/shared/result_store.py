@@ -0,0 +1,94 @@
+import os
+import time
+import logging
+
+# Where finished images live. Small ones go to job_result_image:<job_id> in Redis, with
+# RESULT_BLOB_DIR set the ones of at least RESULT_BLOB_MIN_BYTES are written there as
+# <job_id>.png instead and only the json metadata stays in Redis. The directory has to
+# be shared with the api server (same volume, or a mounted object store bucket).
+
+# expiry of results that aren't in the result cache, 0 keeps them forever
+RESULT_TTL = int(os.getenv("RESULT_TTL", 24 * 60 * 60))
+RESULT_BLOB_DIR = os.getenv("RESULT_BLOB_DIR", "")
+RESULT_BLOB_MIN_BYTES = int(os.getenv("RESULT_BLOB_MIN_BYTES", 256 * 1024))
+# blobs whose metadata is gone (expired or evicted) are deleted at most this often
+RESULT_BLOB_SWEEP_INTERVAL = int(os.getenv("RESULT_BLOB_SWEEP_INTERVAL", 10 * 60))
+
+logger = logging.getLogger(__name__)
+_last_sweep = 0.0
+
+
+def blob_path(job_id: str) -> str:
+    return os.path.join(RESULT_BLOB_DIR, f"{os.path.basename(job_id)}.png")
+
+
+def save_image(redis_binary_client, job_id: str, image_bytes: bytes, ttl=None) -> dict:
+    """
+    Store a result image in Redis or in the blob directory
+
+    Args:
+        redis_binary_client (redis.Redis): Redis client without response decoding
+        job_id (str): Job id
+        image_bytes (bytes): PNG bytes
+        ttl (int): Expiry of the Redis key in seconds
+
+    Returns:
+        dict: Fields for the job's metadata telling the api server where the image is
+    """
+    if RESULT_BLOB_DIR and len(image_bytes) >= RESULT_BLOB_MIN_BYTES:
+        os.makedirs(RESULT_BLOB_DIR, exist_ok=True)
+        path = blob_path(job_id)
+        # write then rename, so the api server never serves a half written file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp_path, path)
+        return {"storage": "blob"}
+
+    redis_binary_client.set(f"job_result_image:{job_id}", image_bytes, ex=ttl)
+    return {"storage": "redis"}
+
+
+def delete_blobs(job_ids: list):
+    """Remove the blob files of evicted results, if they have any"""
+    if not RESULT_BLOB_DIR:
+        return
+    for job_id in job_ids:
+        try:
+            os.remove(blob_path(job_id))
+        except FileNotFoundError:
+            pass
+
+
+def sweep_blobs(redis_client, force: bool = False) -> int:
+    """
+    Delete blob files whose job_result expired. Runs at most every RESULT_BLOB_SWEEP_INTERVAL.
+
+    Returns:
+        int: Number of deleted files
+    """
+    global _last_sweep
+    if not RESULT_BLOB_DIR or not os.path.isdir(RESULT_BLOB_DIR):
+        return 0
+    now = time.time()
+    if not force and now - _last_sweep < RESULT_BLOB_SWEEP_INTERVAL:
+        return 0
+    _last_sweep = now
+
+    candidates = []
+    for entry in os.scandir(RESULT_BLOB_DIR):
+        # skip files that are being written, their metadata may not be stored yet
+        if entry.name.endswith(".png") and now - entry.stat().st_mtime > 60:
+            candidates.append(entry.name[:-len(".png")])
+    if not candidates:
+        return 0
+
+    pipe = redis_client.pipeline()
+    for job_id in candidates:
+        pipe.exists(f"job_result:{job_id}")
+    alive = pipe.execute()
+    stale = [job_id for job_id, exists in zip(candidates, alive) if not exists]
+    delete_blobs(stale)
+    if stale:
+        logger.info(f"Deleted {len(stale)} expired result blob(s)")
+    return len(stale)
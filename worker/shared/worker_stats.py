@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+
+# Every worker publishes its load to worker_stats:<worker_id> (a hash that expires when the
+# worker stops publishing) and registers in the worker_stats set. autoscale.py reads them.
+WORKER_STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", 5))
+WORKER_STATS_TTL = int(os.getenv("WORKER_STATS_TTL", 30))
+# weight of the newest sample in the moving averages
+STATS_EWMA_ALPHA = 0.2
+
+STATS_INDEX_KEY = "worker_stats"
+
+
+def _ewma(current, sample):
+    if current is None:
+        return sample
+    return STATS_EWMA_ALPHA * sample + (1 - STATS_EWMA_ALPHA) * current
+
+
+class WorkerStats:
+    """
+    Tracks a worker's throughput, per stage times and current jobs, and publishes them
+    to Redis from a background thread
+    """
+    def __init__(self, redis_client, worker_id: str, mode: str = "serial"):
+        """
+        Args:
+            redis_client (redis.Redis): Redis client with decode_responses=True
+            worker_id (str): Unique name of the worker
+            mode (str): Worker mode, reported as is
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.redis_client = redis_client
+        self.worker_id = worker_id
+        self.mode = mode
+        self.key = f"worker_stats:{worker_id}"
+        self.started_at = time.time()
+
+        self.lock = threading.Lock()
+        # job_id -> start time
+        self.current = {}
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.job_seconds = None
+        self.stage_seconds = {}
+        self.jobs_per_sec = None
+        self._last_publish = (time.monotonic(), 0)
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="worker-stats", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        pipe = self.redis_client.pipeline()
+        pipe.delete(self.key)
+        pipe.srem(STATS_INDEX_KEY, self.worker_id)
+        pipe.execute()
+
+    def job_started(self, job_id: str):
+        with self.lock:
+            self.current[job_id] = time.monotonic()
+
+    def job_finished(self, job_id: str, ok: bool = True):
+        with self.lock:
+            started = self.current.pop(job_id, None)
+            if ok:
+                self.jobs_done += 1
+            else:
+                self.jobs_failed += 1
+            if ok and started is not None:
+                self.job_seconds = _ewma(self.job_seconds, time.monotonic() - started)
+
+    def record_stage(self, stage: str, seconds: float):
+        """
+        Account the time one page spent in a stage
+
+        Args:
+            stage (str): Stage name, see process/pipeline.py STAGES
+            seconds (float): Time spent on the page
+        """
+        with self.lock:
+            self.stage_seconds[stage] = _ewma(self.stage_seconds.get(stage), seconds)
+
+    def snapshot(self) -> dict:
+        """The fields published to Redis"""
+        now = time.monotonic()
+        with self.lock:
+            last_at, last_done = self._last_publish
+            if now > last_at:
+                self.jobs_per_sec = _ewma(self.jobs_per_sec, (self.jobs_done - last_done) / (now - last_at))
+            self._last_publish = (now, self.jobs_done)
+            return {
+                "worker_id": self.worker_id,
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "mode": self.mode,
+                "started_at": self.started_at,
+                "updated_at": time.time(),
+                "jobs_done": self.jobs_done,
+                "jobs_failed": self.jobs_failed,
+                "jobs_per_sec": round(self.jobs_per_sec or 0.0, 4),
+                "job_seconds": round(self.job_seconds or 0.0, 3),
+                "stage_seconds": json.dumps({stage: round(value, 3) for stage, value in self.stage_seconds.items()}),
+                "current_jobs": json.dumps({job_id: round(now - started, 1) for job_id, started in self.current.items()}),
+            }
+
+    def publish(self):
+        pipe = self.redis_client.pipeline()
+        pipe.hset(self.key, mapping=self.snapshot())
+        pipe.expire(self.key, WORKER_STATS_TTL)
+        pipe.sadd(STATS_INDEX_KEY, self.worker_id)
+        pipe.execute()
+
+    def _run(self):
+        while not self.stopped.wait(WORKER_STATS_INTERVAL):
+            try:
+                self.publish()
+            except Exception as e:
+                self.logger.warning(f"Publishing worker stats failed: {e}")
+
+
+def read_worker_stats(redis_client) -> list:
+    """
+    Stats of every live worker, dropping the ones that stopped publishing
+
+    Returns:
+        list: One dict per worker, numbers parsed and json fields decoded
+    """
+    worker_ids = sorted(redis_client.smembers(STATS_INDEX_KEY))
+    pipe = redis_client.pipeline()
+    for worker_id in worker_ids:
+        pipe.hgetall(f"worker_stats:{worker_id}")
+    workers = []
+    gone = []
+    for worker_id, stats in zip(worker_ids, pipe.execute()):
+        if not stats:
+            gone.append(worker_id)
+            continue
+        for field in ("jobs_per_sec", "job_seconds", "started_at", "updated_at"):
+            stats[field] = float(stats[field])
+        for field in ("jobs_done", "jobs_failed", "pid"):
+            stats[field] = int(stats[field])
+        stats["stage_seconds"] = json.loads(stats["stage_seconds"])
+        stats["current_jobs"] = json.loads(stats["current_jobs"])
+        workers.append(stats)
+    if gone:
+        redis_client.srem(STATS_INDEX_KEY, *gone)
+    return workers
@@ -1,47 +1,268 @@
+import os
+import time
 import numpy as np
 import cv2
 import json
 import base64
 import logging
 
-from shared.redis_client import redis_client
+from shared.redis_client import redis_client, redis_binary_client
+from shared import result_cache, result_store
+from shared.job_queue import build_job_queue
+from shared.worker_stats import WorkerStats
 import asyncio
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from process.text_extraction import MangaTextExtractor
+from process.text_extraction import MangaTextExtractor, configure_torch_threads
 from process.translator import MangaTranslator
+from process.translation_memory import TranslationMemory
+from process.rate_limiter import build_rate_limiters
+from process.manga_metadata import MangaMetadataCache
 from process.text_render import MangaTextRenderer
 from process.inpaint import Inpainter
-from process.test import process_image
+from process.test import process_image, process_pages
+from process.pipeline import StagePipeline, load_pipeline_config
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
 logger = logging.getLogger(__name__)
 
+# 'serial' processes one job end to end, 'pipeline' overlaps the stages of several jobs
+WORKER_MODE = os.getenv("WORKER_MODE", "serial")
+
+# up to WORKER_BATCH_SIZE queued jobs are drained at once and go through the YOLO models
+# as one batch. after the first job, the worker waits at most WORKER_BATCH_MAX_WAIT_MS for the rest
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", 1))
+WORKER_BATCH_MAX_WAIT_MS = int(os.getenv("WORKER_BATCH_MAX_WAIT_MS", 200))
+
+# 'opencv', 'lama' or 'auto' (picked per text region), for jobs that don't ask for one
+INPAINT_METHOD = os.getenv("INPAINT_METHOD", "opencv")
+
+# finished/failed jobs are announced here, the api server streams them to clients
+JOB_EVENTS_CHANNEL = "job_events"
+# finished jobs are kept in the job_completions zset this long, the api server derives the drain rate from it
+THROUGHPUT_WINDOW = int(os.getenv("THROUGHPUT_WINDOW", 5 * 60))
+# how long a failed job stays marked as failed
+JOB_FAILED_TTL = int(os.getenv("JOB_FAILED_TTL", 24 * 60 * 60))
+
+
+def decode_job(job_json: str, image_bytes: bytes = None):
+    """
+    Parse a queued job and decode its image
+    
+    Args:
+        job_json (str): Job payload from the queue
+        image_bytes (bytes): Contents of the job's image key, fetched here if None
+    """
+    job = json.loads(job_json)
+    if 'image_b64' in job:
+        # jobs queued by an older api server still carry the image inline
+        image_bytes = base64.b64decode(job['image_b64'])
+    elif image_bytes is None:
+        image_bytes = redis_binary_client.get(f"job_image:{job['job_id']}")
+    if image_bytes is None:
+        raise ValueError(f"Image of job {job['job_id']} is missing")
+    npimg = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
+    return job, image
+
+
+def dequeue_batch() -> list:
+    """Block until a job is queued, then drain up to WORKER_BATCH_SIZE jobs"""
+    return job_queue.pop_batch(WORKER_BATCH_SIZE, WORKER_BATCH_MAX_WAIT_MS)
+
+
+def decode_batch(job_jsons: list) -> list:
+    """Decode a batch of jobs, failing the ones whose image can't be read"""
+    pages = []
+    # fetch every image of the batch in one round trip
+    job_ids = [json.loads(job_json).get("job_id") for job_json in job_jsons]
+    images_bytes = redis_binary_client.mget([f"job_image:{job_id}" for job_id in job_ids])
+    for job_json, image_bytes in zip(job_jsons, images_bytes):
+        try:
+            job, image = decode_job(job_json, image_bytes)
+            if image is None:
+                raise ValueError(f"Image of job {job['job_id']} can't be decoded")
+        except Exception as e:
+            logger.error(f"ERROR decoding job: {e}", exc_info=True)
+            fail_job(json.loads(job_json), e)
+            continue
+        logger.info(f"Dequeued job for source_lang='{job['source_lang']}'")
+        worker_stats.job_started(job['job_id'])
+        pages.append((job, image))
+    return pages
+
+
+def write_result(job: dict, result: dict):
+    """
+    Store a finished job's result in Redis using job_id. The PNG goes to its own
+    binary key or the blob directory (see shared/result_store.py), job_result holds
+    the json metadata and is written last, so a visible job_result always means the
+    image is there too.
+    """
+    job_id = job['job_id']
+    image_bytes = result.pop("image_bytes")
+    # cached results expire and count against the cache's byte budget, the rest just expire
+    ttl = result_cache.RESULT_CACHE_TTL if job.get("cache_key") else (result_store.RESULT_TTL or None)
+    result["content_type"] = "image/png"
+    result["image_size"] = len(image_bytes)
+    result.update(result_store.save_image(redis_binary_client, job_id, image_bytes, ttl))
+    result_json = json.dumps(result)
+
+    pipe = redis_client.pipeline()
+    pipe.set(f"job_result:{job_id}", result_json, ex=ttl)
+    pipe.delete(f"job_image:{job_id}")
+    pipe.publish(JOB_EVENTS_CHANNEL, json.dumps({"job_id": job_id, "status": "done"}))
+    # drain rate for the api server's admission control
+    now = time.time()
+    pipe.zadd("job_completions", {job_id: now})
+    pipe.zremrangebyscore("job_completions", 0, now - THROUGHPUT_WINDOW)
+    pipe.execute()
+
+    if job.get("cache_key"):
+        # only what stays in Redis counts against the cache budget, blobs have their own
+        in_blob = result["storage"] == "blob"
+        result_cache.record_result(
+            redis_client, job,
+            len(result_json) + (0 if in_blob else len(image_bytes)),
+            len(image_bytes) if in_blob else 0,
+        )
+    job_queue.ack(job_id)
+    worker_stats.job_finished(job_id)
+
+
+async def store_result(job: dict, result: dict):
+    """Store a finished job's result without blocking the event loop"""
+    await asyncio.to_thread(write_result, job, result)
+    logger.info(f"Job {job['job_id']} processing complete.")
+
+
+def fail_job(job: dict, error):
+    """Clean up after a job that failed, so identical uploads get queued again"""
+    if job.get("cache_key"):
+        result_cache.release(redis_client, job)
+    event = {"job_id": job['job_id'], "status": "failed", "error": str(error)}
+    pipe = redis_client.pipeline()
+    pipe.delete(f"job_image:{job['job_id']}")
+    # lets batch status tell failed pages from pending ones
+    pipe.set(f"job_failed:{job['job_id']}", str(error), ex=JOB_FAILED_TTL)
+    pipe.publish(JOB_EVENTS_CHANNEL, json.dumps(event))
+    pipe.execute()
+    job_queue.ack(job['job_id'])
+    worker_stats.job_finished(job['job_id'], ok=False)
+
+
+async def discard_job(job: dict, error: Exception):
+    """Async wrapper of fail_job for the processing loops"""
+    await asyncio.to_thread(fail_job, job, error)
+
+
+def dead_letter_job(job_json: str):
+    """A job whose workers kept dying was given up on, tell the client"""
+    try:
+        job = json.loads(job_json)
+    except ValueError:
+        return
+    fail_job(job, "job failed too many times")
+
+
+job_queue = build_job_queue(redis_client, on_dead_letter=dead_letter_job)
+# throughput, stage times and current jobs, published for autoscale.py
+worker_stats = WorkerStats(redis_client, job_queue.worker_id, mode=WORKER_MODE)
+
+
+def group_chapters(pages: list) -> list:
+    """
+    Split a dequeued batch into the groups that are processed together: pages of the same
+    chapter batch (and options) in page order, every other page on its own
+
+    Args:
+        pages (list): (job, image) tuples
+
+    Returns:
+        list: Lists of indices into pages
+    """
+    groups = {}
+    for index, (job, _) in enumerate(pages):
+        if job.get("batch_id"):
+            key = (job["batch_id"], job["source_lang"], job["target_lang"], job.get("manga_title"), job.get("inpaint_method"))
+        else:
+            key = index
+        groups.setdefault(key, []).append(index)
+    return [sorted(indices, key=lambda i: pages[i][0].get("page_index", 0)) for indices in groups.values()]
+
+
+async def run_pipeline(text_extractor, translator, renderer, inpainter):
+    """
+    Pipelined variant of the main loop. Jobs are pulled off the queue as long as
+    the first stage has room, and every stage works on a different job.
+    """
+    config = load_pipeline_config()
+    pipeline = StagePipeline(
+        text_extractor,
+        translator,
+        renderer,
+        inpainter,
+        on_complete=store_result,
+        on_error=discard_job,
+        queue_depth=config["queue_depth"],
+        workers=config["workers"],
+        stats=worker_stats,
+        inpaint_method=INPAINT_METHOD,
+    )
+    pipeline.start()
+
+    try:
+        while True:
+            try:
+                job_jsons = await asyncio.to_thread(dequeue_batch)
+                pages = await asyncio.to_thread(decode_batch, job_jsons)
+                if pages:
+                    await pipeline.submit_batch(pages)
+            except Exception as e:
+                logger.error(f"ERROR dequeuing job: {e}", exc_info=True)
+    finally:
+        await pipeline.stop()
+
+
 async def main():
     """
     The main function for the ML worker. It loads models once and then enters
     an infinite loop to process jobs from the Redis queue.
     """
     logger.info("Initializing ML components...")
+    logger.info(f"Torch threads per op: {configure_torch_threads()}")
     text_extractor = MangaTextExtractor()
-    translator = MangaTranslator()
+    translator = MangaTranslator(
+        memory=TranslationMemory(redis_client),
+        rate_limiters=build_rate_limiters(redis_client),
+        metadata=MangaMetadataCache(redis_client)
+    )
     renderer = MangaTextRenderer(font_path="fonts/Anime.otf")
     inpainter = Inpainter()
     logger.info("Initialization complete. Worker is ready.")
     
-    logger.info("Waiting for jobs in 'job_queue'...")
+    logger.info(f"Waiting for jobs in 'job_queue' (mode={WORKER_MODE})...")
 
-    while True:
+    job_queue.start()
+    worker_stats.start()
+    try:
+        if WORKER_MODE == "pipeline":
+            await run_pipeline(text_extractor, translator, renderer, inpainter)
+        else:
+            await run_serial(text_extractor, translator, renderer, inpainter)
+    finally:
+        worker_stats.stop()
+        job_queue.stop()
+
+
+async def run_serial(text_extractor, translator, renderer, inpainter):
+    """Process the dequeued jobs one after the other, the pages of a chapter batch together"""
+
+    async def process_single(job, image, bubbles, text_mask):
         try:
-            _ , job_json = redis_client.blpop("job_queue", 0)
-            job = json.loads(job_json)
-            logger.info(f"Dequeued job for source_lang='{job['source_lang']}'")
-            image_bytes = base64.b64decode(job['image_b64'])
-            npimg = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
-            
+            timings = {}
             result = await process_image(
                 image,
                 text_extractor=text_extractor,
@@ -49,12 +270,75 @@ async def main():
                 renderer=renderer,
                 inpainter=inpainter,
                 source_lang=job['source_lang'],
-                target_lang=job['target_lang']
+                target_lang=job['target_lang'],
+                bubbles=bubbles,
+                text_mask=text_mask,
+                manga_title=job.get("manga_title"),
+                timings=timings,
+                inpaint_method=job.get("inpaint_method") or INPAINT_METHOD
             )
-            
-            # Store result in Redis using job_id
-            redis_client.set(f"job_result:{job['job_id']}", json.dumps(result))
-            logger.info(f"Job {job['job_id']} processing complete.")
+            for stage, seconds in timings.items():
+                worker_stats.record_stage(stage, seconds)
+
+            await store_result(job, result)
+        except Exception as e:
+            logger.error(f"ERROR processing job {job['job_id']}: {e}", exc_info=True)
+            await discard_job(job, e)
+
+    async def process_chapter(group):
+        job = group[0][0]
+        timings = {}
+        results = await process_pages(
+            [image for _, image, _, _ in group],
+            text_extractor=text_extractor,
+            translator=translator,
+            renderer=renderer,
+            inpainter=inpainter,
+            source_lang=job['source_lang'],
+            target_lang=job['target_lang'],
+            batch_bubbles=[bubbles for _, _, bubbles, _ in group],
+            batch_masks=[text_mask for _, _, _, text_mask in group],
+            manga_title=job.get("manga_title"),
+            timings=timings,
+            inpaint_method=job.get("inpaint_method") or INPAINT_METHOD
+        )
+        for stage, seconds in timings.items():
+            worker_stats.record_stage(stage, seconds / len(group))
+        return results
+
+    while True:
+        try:
+            job_jsons = dequeue_batch()
+            pages = decode_batch(job_jsons)
+            if not pages:
+                continue
+
+            images = [image for _, image in pages]
+            # single jobs go through process_image as before, batches share the YOLO calls
+            if len(pages) > 1:
+                started = time.perf_counter()
+                batch_bubbles, batch_masks = text_extractor.detect_and_segment_batch(images, 0.25)
+                worker_stats.record_stage("detect", (time.perf_counter() - started) / len(pages))
+            else:
+                batch_bubbles = [None]
+                batch_masks = [None]
+
+            for indices in group_chapters(pages):
+                group = [(*pages[i], batch_bubbles[i], batch_masks[i]) for i in indices]
+                if len(group) > 1:
+                    batch_id = group[0][0]['batch_id']
+                    try:
+                        logger.info(f"Processing {len(group)} page(s) of batch {batch_id} together")
+                        results = await process_chapter(group)
+                    except Exception as e:
+                        # retry the pages one by one, so one bad page doesn't fail the others
+                        logger.error(f"ERROR processing batch {batch_id}, retrying page by page: {e}", exc_info=True)
+                    else:
+                        for (job, _, _, _), result in zip(group, results):
+                            await store_result(job, result)
+                        continue
+                for job, image, bubbles, text_mask in group:
+                    await process_single(job, image, bubbles, text_mask)
         except Exception as e:
             logger.error(f"ERROR processing job: {e}", exc_info=True)
 